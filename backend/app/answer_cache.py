@@ -0,0 +1,166 @@
+"""
+Semantic answer cache for near-identical questions.
+Generated answers (with their source chunks) are kept per document set; a
+question whose embedding is within `min_similarity` (cosine) of a cached
+question over the same documents gets the cached answer instead of a new
+generation. Entries are dropped when any of their documents changes, expire
+after a TTL, and the least recently used go first past the entry limit.
+An answer is only stored if none of its documents changed since the question
+was asked, so a generation racing an upload or delete never caches stale text.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Fingerprint of a search over all documents; invalidated by any change
+ALL_DOCUMENTS = ("*",)
+
+
+def document_set_fingerprint(document_ids) -> tuple:
+    return ALL_DOCUMENTS if document_ids is None else tuple(sorted(set(document_ids)))
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    """
+    {(document set, question vector): (answer, sources)} with nearest-neighbour
+    lookup, per-document invalidation, TTL and LRU eviction, plus counters of
+    hits and of the generation time they saved.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, min_similarity: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.min_similarity = min_similarity
+        self._entries = OrderedDict()  # {entry_id: entry dict}
+        self._by_fingerprint = {}  # {fingerprint: {entry_id}}
+        self._ids = itertools.count()
+        # {document_id: monotonic time of its last invalidation}, oldest first;
+        # pruned after ttl_s, and documents without an entry count as changed
+        # at _changed_floor (the latest pruned time, or the last clear)
+        self._changed_at = OrderedDict()
+        self._last_change = self._changed_floor = float("-inf")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_generation_s = 0.0
+        self.invalidations = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def lookup(self, query_vec, document_ids):
+        """The cached {"answer", "source_chunks", "similarity"} closest to query_vec, or None."""
+        fingerprint = document_set_fingerprint(document_ids)
+        query = _unit(query_vec)
+        now = time.monotonic()
+        with self._lock:
+            candidates = list(self._by_fingerprint.get(fingerprint, ()))
+            ids = [entry_id for entry_id in candidates if self._live(entry_id, now)]
+            if ids:
+                similarities = np.stack([self._entries[entry_id]["vector"] for entry_id in ids]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.min_similarity:
+                    entry = self._entries[ids[best]]
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    self.saved_generation_s += entry["generation_s"]
+                    return {
+                        "answer": entry["answer"],
+                        "source_chunks": list(entry["source_chunks"]),
+                        "similarity": float(similarities[best]),
+                    }
+            self.misses += 1
+        return None
+
+    def store(self, query_vec, document_ids, answer: str, source_chunks, generation_s: float, asked_at: float):
+        """Cache an answer; asked_at is time.monotonic() from before its sources were retrieved."""
+        fingerprint = document_set_fingerprint(document_ids)
+        with self._lock:
+            if fingerprint == ALL_DOCUMENTS:
+                changed_at = self._last_change
+            else:
+                changed_at = max(self._changed_at.get(document_id, self._changed_floor) for document_id in fingerprint)
+            if changed_at >= asked_at:
+                return
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "fingerprint": fingerprint,
+                "vector": _unit(query_vec),
+                "answer": answer,
+                "source_chunks": list(source_chunks),
+                "generation_s": generation_s,
+                "expires_at": time.monotonic() + self.ttl_s,
+            }
+            self._by_fingerprint.setdefault(fingerprint, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_document(self, document_id: str):
+        """Drop every answer drawn from document_id, and every all-documents answer."""
+        with self._lock:
+            now = time.monotonic()
+            self._changed_at.pop(document_id, None)
+            self._last_change = self._changed_at[document_id] = now
+            # Older changes only matter to answers asked more than ttl_s ago
+            while self._changed_at:
+                oldest = next(iter(self._changed_at))
+                if self._changed_at[oldest] >= now - self.ttl_s:
+                    break
+                self._changed_floor = max(self._changed_floor, self._changed_at.pop(oldest))
+            stale = [
+                entry_id
+                for fingerprint, ids in self._by_fingerprint.items()
+                if fingerprint == ALL_DOCUMENTS or document_id in fingerprint
+                for entry_id in ids
+            ]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+
+    def _live(self, entry_id, now: float) -> bool:
+        if self._entries[entry_id]["expires_at"] > now:
+            return True
+        self._remove(entry_id)
+        self.expirations += 1
+        return False
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_fingerprint[entry["fingerprint"]]
+        ids.discard(entry_id)
+        if not ids:
+            del self._by_fingerprint[entry["fingerprint"]]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_fingerprint.clear()
+            self._last_change = self._changed_floor = time.monotonic()
+            self._changed_at.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "min_similarity": self.min_similarity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_generation_s": self.saved_generation_s,
+                "invalidations": self.invalidations,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
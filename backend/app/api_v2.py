@@ -4,25 +4,40 @@ Features: Auto-summaries, multi-document support, chat history, and more.
 """
 
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, desc, or_, select, update
 from google.api_core import exceptions as google_exceptions
 from pydantic import BaseModel
 from typing import Optional, List
-import google.generativeai as genai
-from PyPDF2 import PdfReader
-from docx import Document
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import asyncio
+import hashlib
+import json
 import os
-import re
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+import time
 from dotenv import load_dotenv
 
-from . import embeddings
-from .database import get_db
+from . import embeddings, gemini_client
+from .answer_cache import document_set_fingerprint
+from .artifact_cache import ArtifactCache
+from .database import AsyncSessionLocal, SessionLocal, get_async_db
+from .job_queue import JobQueue, JobWorkerPool
 from .models import Document as DocumentModel, ChatMessage
 from .prompts import get_chat_prompt
+from .query_cache import normalize_question
+from .singleflight import AsyncSingleFlight
+# Text processing lives in text_pipeline; re-exported for existing callers
+from .text_pipeline import (
+    DocumentStream,
+    chunk_text,
+    extract_text_from_file,
+    extraction_key,
+    iter_pages,
+    preprocess_text,
+    remove_stopwords,
+)
 
 load_dotenv()
 
@@ -31,6 +46,53 @@ router = APIRouter()
 UPLOAD_FOLDER = "./data/uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Uploads are processed by background workers; jobs survive restarts.
+# INGEST_WORKER_MODE=process runs extraction and chunking (CPU bound) in a
+# process pool; summaries and indexing always run in the worker threads.
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./data/jobs.db")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_WORKER_MODE = os.getenv("INGEST_WORKER_MODE", "thread").lower()
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+# Uploads are copied to disk in blocks of this size while being hashed, so
+# memory per upload stays flat; larger uploads than MAX_UPLOAD_BYTES are
+# rejected with 413 (0 disables the limit)
+UPLOAD_COPY_BUFFER_BYTES = int(os.getenv("UPLOAD_COPY_BUFFER_BYTES", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+
+# Extracted text and summaries are cached by file content, so regenerating,
+# re-indexing or re-uploading a file skips extraction and the summary call
+ARTIFACT_CACHE_PATH = os.getenv("ARTIFACT_CACHE_PATH", "./data/artifact_cache.db")
+ARTIFACT_CACHE_MAX_BYTES = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+SUMMARY_MODEL = "gemini-1.5-flash"
+ANSWER_MODEL = "gemini-1.5-flash"
+
+# Request handlers are async: database queries use async sessions, Gemini
+# calls the async client, and blocking work (query embedding, FAISS search,
+# file I/O, the job and cache SQLite files) runs on this pool so the event
+# loop never waits on it
+API_BLOCKING_WORKERS = int(os.getenv("API_BLOCKING_WORKERS", "16"))
+
+# Answers are served from the semantic answer cache (see embeddings) only when
+# the prompt carries no conversation history, since a follow-up such as "tell
+# me more" means something different in every conversation. Set
+# ANSWER_CACHE_WITH_HISTORY=1 to cache history-aware answers too.
+ANSWER_CACHE_WITH_HISTORY = os.getenv("ANSWER_CACHE_WITH_HISTORY", "0") == "1"
+
+# Concurrent requests that would send Gemini the same prompt (same normalized
+# question, excerpts and conversation, same document set) share one
+# generation call; each waits at most GENERATION_COALESCE_TIMEOUT_S for the
+# answer (for /ask/stream: for each next token)
+GENERATION_COALESCE_TIMEOUT_S = float(os.getenv("GENERATION_COALESCE_TIMEOUT_S", "60"))
+
+_artifact_cache = ArtifactCache(ARTIFACT_CACHE_PATH, ARTIFACT_CACHE_MAX_BYTES)
+_blocking_executor = ThreadPoolExecutor(max_workers=API_BLOCKING_WORKERS, thread_name_prefix="api-blocking")
+_generation_flight = AsyncSingleFlight()
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on the API's thread pool and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(_blocking_executor, partial(fn, *args, **kwargs))
+
 
 # --------------------------
 # Pydantic Models
@@ -47,6 +109,7 @@ class UploadResponse(BaseModel):
     filename: str
     summary: str
     chunk_count: int
+    job_id: Optional[str] = None
 
 
 class DocumentListItem(BaseModel):
@@ -70,75 +133,23 @@ async def health():
     return {"status": "ok", "version": "2.0"}
 
 
-# --------------------------
-# Text Processing Functions
-# --------------------------
-def preprocess_text(text: str) -> str:
-    """Normalize text: lowercase, remove extra whitespace, remove punctuation."""
-    text = text.lower()
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"[^\w\s]", "", text)
-    return text
-
-
-def remove_stopwords(text: str) -> str:
-    """Remove common English stopwords."""
-    stop_words = set(stopwords.words("english"))
-    word_tokens = word_tokenize(text)
-    filtered_text = [w for w in word_tokens if not w.lower() in stop_words]
-    return " ".join(filtered_text)
-
-
-def chunk_text(text: str, chunk_size=500, chunk_overlap=150):
-    """Split text into overlapping chunks for embedding."""
-    words = text.split()
-    if not words:
-        return []
-    return [
-        " ".join(words[i : i + chunk_size])
-        for i in range(0, len(words), chunk_size - chunk_overlap)
-    ]
-
-
-def extract_text_from_file(file_path: str, filename: str) -> str:
-    """Extract text from PDF, DOCX, or TXT files."""
-    text = ""
-    try:
-        if filename.endswith(".pdf"):
-            reader = PdfReader(file_path)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        elif filename.endswith(".docx"):
-            full_text = []
-            doc = Document(file_path)
-            for para in doc.paragraphs:
-                full_text.append(para.text)
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.paragraphs:
-                            full_text.append(paragraph.text)
-            text = "\n".join(full_text)
-        elif filename.endswith(".txt"):
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-        else:
-            raise ValueError(f"Unsupported file type: {filename}")
-    except Exception as e:
-        print(f"Error extracting text from {filename}: {e}")
-        raise
-    
-    return text
-
-
 # --------------------------
 # Generate Summary using Gemini
 # --------------------------
-def generate_summary(text: str, filename: str) -> str:
+def generate_summary(text: str, filename: str, content_hash: str = None) -> str:
     """
     Generate a concise, professional summary using Gemini API.
     Designed to be quick and informative for the user.
+    With content_hash, a summary generated earlier for the same file
+    content and filename (the prompt names the file) is reused, and a new
+    one is cached.
     """
+    # The model field of the artifact key; the filename is part of the prompt
+    summary_key = f"{SUMMARY_MODEL}:{filename}"
+    if content_hash:
+        cached = _artifact_cache.get_text(content_hash, "summary", summary_key)
+        if cached is not None:
+            return cached
     try:
         # Limit text for summary generation to avoid token limits
         text_preview = text[:5000]  # First 5000 chars for summary context
@@ -153,233 +164,610 @@ def generate_summary(text: str, filename: str) -> str:
         Summary:
         """
         
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        summary = gemini_client.client.generate(SUMMARY_MODEL, prompt).strip()
     
     except Exception as e:
         print(f"Error generating summary: {e}")
         return f"Could not generate summary for {filename}"
 
+    if content_hash:
+        _artifact_cache.put_text(content_hash, "summary", summary_key, summary)
+    return summary
+
+
+# --------------------------
+# Background ingestion jobs
+# --------------------------
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_COPY_BUFFER_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _document_pages(file_path: str, filename: str, content_hash: str, on_page=None):
+    """
+    A file's pages: replayed from the artifact cache when this content was
+    extracted before with the same engine, else extracted and cached.
+    Pages read by a fallback engine (the configured one failed on this
+    file) are not cached, since the key names the configured engine.
+    """
+    key = extraction_key(filename)
+    cached = _artifact_cache.iter_pages(content_hash, key, on_page)
+    if cached is not None:
+        return cached
+    engines = []
+    pages = iter_pages(file_path, filename, on_page, on_engine=engines.append)
+    keep = lambda: [extraction_key(filename, engine) for engine in engines] == [key]
+    return _artifact_cache.record_pages(content_hash, key, pages, keep)
+
+
+def prepare_chunks(file_path: str, filename: str, content_hash: str):
+    """
+    Extract, normalize and chunk a whole file (process-pool mode). Returns
+    (summary_excerpt, chunks); only the excerpt needed for the summary
+    leaves the worker, not the full text.
+    """
+    stream = DocumentStream(
+        file_path,
+        filename,
+        chunk_size=500,
+        chunk_overlap=150,
+        pages=_document_pages(file_path, filename, content_hash),
+    )
+    chunks = list(stream.chunks())
+    if not stream.has_text:
+        raise ValueError("No text could be extracted from the file.")
+    return stream.excerpt, chunks
+
+
+_prepare_executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS) if INGEST_WORKER_MODE == "process" else None
+# Summaries are generated while the rest of the document is being indexed
+_summary_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="summary")
+
+
+def _run_ingest_job(job_id: str, payload: dict, report):
+    """
+    Extract, summarize, chunk and index a document (upload or regeneration).
+    The index is the one the document shares with exact copies of its file,
+    and every sharing document gets the new summary and chunk count.
+    Returns the indexing counts (chunks added, near-duplicate savings) as the job result.
+    """
+    document_id = payload["document_id"]
+    db = SessionLocal()
+    try:
+        doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
+        if not doc:
+            return  # deleted while queued
+        filename = doc.filename
+        index_id = _index_id(doc)
+        try:
+            if not doc.content_hash:
+                # Uploaded before content hashing; saved with the results
+                doc.content_hash = _file_sha256(doc.file_path)
+            content_hash = doc.content_hash
+            # Start from an empty index: regeneration, or a retry after a crash
+            embeddings.delete_index(index_id)
+            summary_future = []
+
+            def start_summary(excerpt):
+                summary_future.append(_summary_executor.submit(generate_summary, excerpt, filename, content_hash))
+
+            report("indexing", 0.0)
+            if _prepare_executor is not None:
+                excerpt, chunks = _prepare_executor.submit(
+                    prepare_chunks, doc.file_path, filename, content_hash
+                ).result()
+                start_summary(excerpt)
+                indexing = embeddings.add_chunks_to_index(
+                    index_id,
+                    chunks,
+                    progress=lambda done, total: report("indexing", done / total),
+                    corpus=doc.device_id,
+                )
+            else:
+                # Pages are extracted (or read from the artifact cache) and
+                # chunked while earlier chunks are embedded
+                on_page = lambda done, total: report("indexing", done / total if total else None)
+                stream = DocumentStream(
+                    doc.file_path,
+                    filename,
+                    chunk_size=500,
+                    chunk_overlap=150,
+                    on_excerpt=start_summary,
+                    pages=_document_pages(doc.file_path, filename, content_hash, on_page),
+                )
+                indexing = embeddings.add_chunks_to_index(index_id, stream.chunks(), corpus=doc.device_id)
+                if not stream.has_text:
+                    raise ValueError("No text could be extracted from the file.")
+            # Near-duplicates skipped under CHUNK_DEDUP are still chunks of
+            # the document (served through pointers), so they count too
+            chunk_count = indexing["chunks_added"] + indexing["duplicates_skipped"]
+            if not chunk_count:
+                raise ValueError("Text was extracted, but no processable chunks were generated.")
+
+            report("summarizing")
+            summary = summary_future[0].result()
+
+            report("finalizing")
+            for shared in db.scalars(_sharing_documents(index_id)):
+                shared.summary = summary
+                shared.chunk_count = chunk_count
+            db.commit()
+            print(f"✓ Document {filename} processed and indexed successfully.")
+            return indexing
+        except Exception:
+            # The worker pool marks the documents failed (_mark_ingest_failed)
+            db.rollback()
+            raise
+        finally:
+            # Every document using the index may have been deleted while it was being indexed
+            if db.scalars(_sharing_documents(index_id)).first() is None:
+                embeddings.delete_index(index_id)
+    finally:
+        db.close()
+
+
+def _mark_ingest_failed(job_id: str, payload: dict, error: str):
+    """
+    Show a failed ingest job (its handler raised, or restarts interrupted it
+    INGEST_MAX_ATTEMPTS times) on every document sharing the index. A failed
+    regeneration already deleted the index, so the chunk count is reset too
+    and re-uploads of the file are indexed again instead of sharing it.
+    """
+    db = SessionLocal()
+    try:
+        doc = db.query(DocumentModel).filter(DocumentModel.id == payload["document_id"]).first()
+        if not doc:
+            return
+        for shared in db.scalars(_sharing_documents(_index_id(doc))):
+            shared.summary = "Indexing failed. Please regenerate or re-upload."
+            shared.chunk_count = 0
+        db.commit()
+    finally:
+        db.close()
+
+
+ingestion_workers = JobWorkerPool(
+    JobQueue(JOBS_DB_PATH),
+    {"ingest": _run_ingest_job},
+    workers=INGEST_WORKERS,
+    max_attempts=INGEST_MAX_ATTEMPTS,
+    on_failure={"ingest": _mark_ingest_failed},
+)
+
 
 # --------------------------
 # File Upload with Summary
 # --------------------------
+def _upload_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES} byte upload limit.")
+
+
+def _save_upload(file: UploadFile, path: str):
+    """
+    Copy an upload to path block by block, hashing and counting bytes on the
+    way. Returns (SHA-256 hex digest, bytes written); stops with 413 as soon
+    as the file grows past MAX_UPLOAD_BYTES.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            block = file.file.read(UPLOAD_COPY_BUFFER_BYTES)
+            if not block:
+                break
+            size += len(block)
+            if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+                raise _upload_too_large()
+            digest.update(block)
+            f.write(block)
+    return digest.hexdigest(), size
+
+
+async def _find_indexed_copy(db: AsyncSession, content_hash: str):
+    """A fully indexed document with the same file content, or None."""
+    candidates = await db.scalars(
+        select(DocumentModel).where(
+            DocumentModel.content_hash == content_hash,
+            DocumentModel.chunk_count > 0,
+            DocumentModel.summary != "Processing...",
+        )
+    )
+    for candidate in candidates:
+        if await _run_blocking(os.path.exists, candidate.file_path):
+            return candidate
+    return None
+
+
+async def _remove_file(path: str):
+    if await _run_blocking(os.path.exists, path):
+        await _run_blocking(os.remove, path)
+
 
 @router.post("/upload", response_model=UploadResponse)
-def upload_file(
+async def upload_file(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     x_device_id: Optional[str] = Header(None, convert_underscores=False)
 ):
     """
-    Upload and process a document synchronously.
-    The request will complete only after the document is fully processed.
+    Upload a document and queue it for processing.
+    Returns immediately with the document ID and a job ID; poll
+    GET /api/jobs/{job_id} (or the document summary) for progress.
+    An exact copy of an already indexed file shares that file's index,
+    summary and stored upload instead: it is ready at once and has no job.
     """
-    print("--- Starting file upload ---")
-    print(f"Received X-Device-Id on upload: {x_device_id}")
-    file_location = os.path.join(UPLOAD_FOLDER, file.filename)
-    print(f"File location: {file_location}")
-    
+    print(f"Received upload {file.filename} (X-Device-Id: {x_device_id})")
+    # The multipart parser already knows the size when the body was spooled
+    if MAX_UPLOAD_BYTES and file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _upload_too_large()
+
     # Create initial document record
     doc = DocumentModel(
         filename=file.filename,
-        file_path=file_location,
+        file_path="",
         summary="Processing...",
         is_active=True,
         device_id=x_device_id,
     )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
-    print(f"Created document record with ID: {doc.id}")
+    await db.flush()
+    # Prefix with the document id so uploads with the same name never collide
+    upload_path = os.path.join(UPLOAD_FOLDER, f"{doc.id}_{os.path.basename(file.filename)}")
+    doc.file_path = upload_path
 
+    job_id = None
     try:
-        # Save file temporarily
-        print("Saving uploaded file...")
-        with open(file_location, "wb") as f:
-            f.write(file.file.read())
-        print("File saved.")
+        # The file is kept for the worker (and for later regeneration)
+        doc.content_hash, doc.document_size = await _run_blocking(_save_upload, file, upload_path)
+        source = await _find_indexed_copy(db, doc.content_hash)
+        if source is not None:
+            await _run_blocking(os.remove, upload_path)
+            doc.index_id = _index_id(source)
+            doc.file_path = source.file_path
+            doc.summary = source.summary
+            doc.chunk_count = source.chunk_count
+            await db.commit()
+        else:
+            doc.index_id = doc.id
+            await db.commit()
+            job_id = await _run_blocking(ingestion_workers.submit, "ingest", {"document_id": doc.id})
+    except Exception as e:
+        await db.rollback()
+        await _remove_file(upload_path)
+        if isinstance(e, HTTPException):
+            raise
+        print(f"✗ Error saving {file.filename}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # --- Synchronous Processing ---
-        
-        # 1. Extract text
-        print("Extracting text from file...")
-        text = extract_text_from_file(file_location, file.filename)
-        if not text.strip():
-            raise ValueError("No text could be extracted from the file.")
-        print(f"Text extracted. Length: {len(text)} characters.")
-            
-        # 2. Generate summary
-        print("Generating summary...")
-        summary = generate_summary(text, file.filename)
-        print("Summary generated.")
-        
-        # 3. Preprocess and chunk text
-        print("Preprocessing and chunking text...")
-        processed_text = preprocess_text(text)
-        text_without_stopwords = remove_stopwords(processed_text)
-        chunks = chunk_text(text_without_stopwords, chunk_size=500, chunk_overlap=150)
-        
-        if not chunks:
-            raise ValueError("Text was extracted, but no processable chunks were generated.")
-        print(f"Text chunked into {len(chunks)} chunks.")
-
-        # 4. Add chunks to the vector index
-        print("Adding chunks to vector index...")
-        embeddings.add_chunks_to_index(doc.id, chunks)
-        print("Chunks added to index.")
-
-        # 5. Finalize database update
-        print("Finalizing database update...")
-        doc.summary = summary
-        doc.chunk_count = len(chunks)
-        doc.document_size = len(text)
-        # Ensure device_id stored for visibility/debug
-        if x_device_id:
-            doc.device_id = x_device_id
-        db.commit()
-        db.refresh(doc)
-        
-        print(f"✓ Document {file.filename} processed and indexed successfully.")
+    if job_id is None:
+        print(f"✓ Document {doc.id} is a copy of an indexed file; sharing index {doc.index_id}")
+    else:
+        print(f"Queued document {doc.id} as job {job_id}")
+    return UploadResponse(
+        document_id=doc.id,
+        filename=doc.filename,
+        summary=doc.summary,
+        chunk_count=doc.chunk_count or 0,
+        job_id=job_id,
+    )
 
-        return UploadResponse(
-            document_id=doc.id,
-            filename=doc.filename,
-            summary=doc.summary,
-            chunk_count=doc.chunk_count
-        )
 
-    except Exception as e:
-        # If anything fails, roll back the initial document creation
-        db.delete(doc)
-        db.commit()
-        print(f"✗ Error processing {file.filename}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        # Clean up the temporarily saved file
-        print("Cleaning up temporary file...")
-        if os.path.exists(file_location):
-            os.remove(file_location)
-        print("--- File upload finished ---")
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report a background job's status, stage, progress (0..1), error and result."""
+    job = await _run_blocking(ingestion_workers.queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "document_id": job["payload"].get("document_id"),
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "error": job["error"],
+        "result": job["result"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
 
 
 # --------------------------
 # Document Management Endpoints
 # --------------------------
+def _remove_upload(doc: DocumentModel):
+    """Delete a document's stored upload file, if any."""
+    if doc.file_path and os.path.exists(doc.file_path):
+        os.remove(doc.file_path)
+
+
+def _index_id(doc: DocumentModel) -> str:
+    """Id of the index (and stored upload) a document uses."""
+    return doc.index_id or doc.id
+
+
+def _sharing_documents(index_id: str):
+    """Select the documents using an index: its reference count is their number."""
+    return select(DocumentModel).where(or_(DocumentModel.index_id == index_id, DocumentModel.id == index_id))
+
+
+async def _get_document(db: AsyncSession, document_id: str) -> DocumentModel:
+    doc = await db.get(DocumentModel, document_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return doc
+
+
+async def _delete_document(db: AsyncSession, doc: DocumentModel):
+    """
+    Delete a document. Its index and stored upload are removed only when no
+    other document shares them; the caller commits.
+    """
+    index_id = _index_id(doc)
+    others = await db.scalars(_sharing_documents(index_id).where(DocumentModel.id != doc.id).limit(1))
+    if others.first() is None:
+        await _run_blocking(embeddings.delete_index, index_id)
+        await _run_blocking(_remove_upload, doc)
+    await db.delete(doc)
+    # Flush so later reference counts in the same transaction see the deletion
+    await db.flush()
+
+
 @router.get("/documents", response_model=List[DocumentListItem])
 async def list_documents(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     x_device_id: Optional[str] = Header(None, convert_underscores=False),
 ):
     """Get list of uploaded documents. If `X-Device-Id` header is provided, filter by device."""
     print(f"List documents called. X-Device-Id: {x_device_id}")
-    query = db.query(DocumentModel)
+    query = select(DocumentModel)
     if x_device_id:
-        query = query.filter(DocumentModel.device_id == x_device_id)
-    docs = query.order_by(desc(DocumentModel.upload_time)).all()
+        query = query.where(DocumentModel.device_id == x_device_id)
+    docs = await db.scalars(query.order_by(desc(DocumentModel.upload_time)))
     return [DocumentListItem(**doc.to_dict()) for doc in docs]
 
 
 @router.get("/documents/{document_id}")
-async def get_document(document_id: str, db: Session = Depends(get_db)):
+async def get_document(document_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get details of a specific document."""
-    doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
+    doc = await _get_document(db, document_id)
     return doc.to_dict()
 
 
 @router.post("/documents/{document_id}/set-active")
-async def set_active_document(document_id: str, db: Session = Depends(get_db)):
+async def set_active_document(document_id: str, db: AsyncSession = Depends(get_async_db)):
     """Mark a document as the active context for questions."""
     # Deactivate all documents
-    db.query(DocumentModel).update({"is_active": False})
+    await db.execute(update(DocumentModel).values(is_active=False))
     
     # Activate the selected document
-    doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
+    doc = await _get_document(db, document_id)
     
     doc.is_active = True
-    db.commit()
+    await db.commit()
+
+    # Keep the active document's index resident in the cache
+    embeddings.set_pinned_documents([_index_id(doc)])
     
     return {"message": f"Document '{doc.filename}' is now active"}
 
 
 @router.delete("/documents/{document_id}")
-async def delete_document(document_id: str, db: Session = Depends(get_db)):
+async def delete_document(document_id: str, db: AsyncSession = Depends(get_async_db)):
     """Delete a document and its embeddings."""
-    doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
-    # Delete from FAISS
-    embeddings.delete_index(document_id)
+    doc = await _get_document(db, document_id)
     
-    # Delete from database
-    db.delete(doc)
-    db.commit()
+    # Delete from FAISS and the database (shared indices are kept while still in use)
+    await _delete_document(db, doc)
+    await db.commit()
     
     return {"message": f"Document '{doc.filename}' deleted successfully"}
 
 
 @router.post("/documents/bulk-delete")
-async def bulk_delete_documents(req: BulkDeleteRequest, db: Session = Depends(get_db)):
+async def bulk_delete_documents(req: BulkDeleteRequest, db: AsyncSession = Depends(get_async_db)):
     """Delete multiple documents and their embeddings in one request."""
     deleted = 0
     try:
         for document_id in req.document_ids:
-            doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
+            doc = await db.get(DocumentModel, document_id)
             if not doc:
                 continue
-            # delete faiss index
-            embeddings.delete_index(document_id)
-            db.delete(doc)
+            await _delete_document(db, doc)
             deleted += 1
-        db.commit()
+        await db.commit()
         return {"deleted": deleted}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/debug/documents")
-async def debug_list_all_documents(db: Session = Depends(get_db)):
+async def debug_list_all_documents(db: AsyncSession = Depends(get_async_db)):
     """Debug endpoint: return all documents with their stored device_id (no filtering).
     Intended for debugging deployments only. Remove or protect in production."""
-    docs = db.query(DocumentModel).order_by(desc(DocumentModel.upload_time)).all()
+    docs = await db.scalars(select(DocumentModel).order_by(desc(DocumentModel.upload_time)))
     return [doc.to_dict() for doc in docs]
 
 
+@router.get("/index-cache/stats")
+async def index_cache_stats():
+    """Report memory usage and hit/miss/eviction counters of the index cache."""
+    return embeddings.get_cache_stats()
+
+
+@router.get("/artifact-cache/stats")
+async def artifact_cache_stats():
+    """Report size, hit/miss and eviction counters of the extraction and summary cache."""
+    return await _run_blocking(_artifact_cache.stats)
+
+
+@router.get("/embeddings/stats")
+async def embedding_stats():
+    """Report ingestion embedding counters (requests, retries, rate limits) and cache hit rates."""
+    return await _run_blocking(embeddings.get_embedding_stats)
+
+
+@router.get("/generation/stats")
+async def generation_stats():
+    """Report Gemini client counters (retries, hedges, circuit state) and coalesced /ask generations."""
+    return {"client": gemini_client.client.stats(), "coalescing": _generation_flight.stats()}
+
+
 # --------------------------
 # Chat History Endpoints
 # --------------------------
 @router.get("/chat-history/{document_id}")
-async def get_chat_history(document_id: str, db: Session = Depends(get_db)):
+async def get_chat_history(document_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get chat history for a document."""
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.document_id == document_id
-    ).order_by(ChatMessage.timestamp).all()
-    
+    messages = await db.scalars(
+        select(ChatMessage).where(ChatMessage.document_id == document_id).order_by(ChatMessage.timestamp)
+    )
     return [msg.to_dict() for msg in messages]
 
 
 @router.delete("/chat-history/{document_id}")
-async def clear_chat_history(document_id: str, db: Session = Depends(get_db)):
+async def clear_chat_history(document_id: str, db: AsyncSession = Depends(get_async_db)):
     """Clear chat history for a document."""
-    db.query(ChatMessage).filter(ChatMessage.document_id == document_id).delete()
-    db.commit()
+    await db.execute(delete(ChatMessage).where(ChatMessage.document_id == document_id))
+    await db.commit()
     return {"message": "Chat history cleared"}
 
 
 # --------------------------
 # Ask Question with Chat Memory
 # --------------------------
+NO_CONTEXT_ANSWER = (
+    "I don't have any relevant information to answer that question. Please upload a document first."
+)
+
+
+async def _retrieve_context(q: QuestionRequest, db: AsyncSession):
+    """
+    Resolve which document(s) to search and retrieve the relevant chunks.
+    Returns (search_doc_ids, index_ids, query_vec, relevant_chunks);
+    search_doc_ids and index_ids are None for a global search.
+    """
+    search_doc_ids = None
+    index_ids = None
+
+    if q.document_ids or q.document_id:
+        # Multi-document search, or single document search (backward compatible)
+        search_doc_ids = q.document_ids or [q.document_id]
+        docs = {
+            doc.id: doc
+            for doc in await db.scalars(select(DocumentModel).where(DocumentModel.id.in_(search_doc_ids)))
+        }
+        # Validate all documents exist
+        for doc_id in search_doc_ids:
+            if doc_id not in docs:
+                detail = f"Document {doc_id} not found" if q.document_ids else "Document not found"
+                raise HTTPException(status_code=404, detail=detail)
+        # Copies of the same file share one index, searched once
+        index_ids = list(dict.fromkeys(_index_id(docs[doc_id]) for doc_id in search_doc_ids))
+
+    # Search for relevant chunks from selected document(s).
+    # The question is embedded once (or served from the query cache) and
+    # reused for every document searched. Embedding and FAISS run off the
+    # event loop.
+    query_vec = await _run_blocking(embeddings.embed_query, q.question)
+    if search_doc_ids:
+        # Take the best chunks from each document, merged by score
+        hits = await _run_blocking(
+            embeddings.search_vector, query_vec, document_ids=index_ids, top_k=None, per_document_k=2
+        )
+    else:
+        # Search all documents (global search)
+        hits = await _run_blocking(embeddings.search_vector, query_vec, document_ids=None, top_k=5)
+    return search_doc_ids, index_ids, query_vec, [hit["chunk"] for hit in hits]
+
+
+async def _build_chat_prompt(q: QuestionRequest, db: AsyncSession, search_doc_ids, relevant_chunks):
+    """
+    Prompt with the labelled excerpts and, if enabled, the recent conversation.
+    Returns (prompt, conversation_context).
+    """
+    # Format context with labels so the LLM can reference them
+    context_text = ""
+    for i, chunk in enumerate(relevant_chunks, 1):
+        context_text += f"[Excerpt {i}]:\n{chunk}\n\n"
+
+    # Build conversation history for context
+    conversation_context = ""
+    if q.use_chat_history and search_doc_ids:
+        # Get recent messages from first document in the list
+        first_doc_id = search_doc_ids[0]
+        recent_messages = list(await db.scalars(
+            select(ChatMessage).where(
+                ChatMessage.document_id == first_doc_id
+            ).order_by(desc(ChatMessage.timestamp)).limit(6)
+        ))
+
+        recent_messages.reverse()
+        for msg in recent_messages:
+            role = "User" if msg.role == "user" else "Assistant"
+            conversation_context += f"{role}: {msg.content}\n"
+
+    return get_chat_prompt(q.question, context_text, conversation_context), conversation_context
+
+
+def _answer_cache_key(index_ids, query_vec, uses_history: bool, asked_at: float):
+    """(query_vec, index_ids, asked_at) for the answer cache, or None when the answer may not be cached."""
+    if uses_history and not ANSWER_CACHE_WITH_HISTORY:
+        return None
+    return query_vec, index_ids, asked_at
+
+
+def _generation_key(kind: str, q: QuestionRequest, index_ids, relevant_chunks, conversation_context: str) -> tuple:
+    """Key shared by requests that would send Gemini the same prompt (up to question normalization)."""
+    digest = hashlib.sha256()
+    for part in (normalize_question(q.question), conversation_context, *relevant_chunks):
+        digest.update(part.encode("utf-8") + b"\0")
+    return kind, document_set_fingerprint(index_ids), digest.hexdigest()
+
+
+def _store_answer(cache_key, answer: str, relevant_chunks, generation_s: float):
+    if cache_key:
+        query_vec, index_ids, asked_at = cache_key
+        embeddings.store_answer(query_vec, index_ids, answer, relevant_chunks, generation_s, asked_at)
+
+
+async def _generate_answer(prompt: str, relevant_chunks, cache_key) -> str:
+    """One Gemini call (shared by coalesced requests), cached when cache_key allows."""
+    started = time.perf_counter()
+    # Gemini's async client: no thread is held while waiting
+    answer = await gemini_client.client.generate_async(ANSWER_MODEL, prompt)
+    _store_answer(cache_key, answer, relevant_chunks, time.perf_counter() - started)
+    return answer
+
+
+async def _generate_answer_stream(prompt: str, relevant_chunks, cache_key):
+    """Yield answer text as Gemini streams it (fanned out to coalesced requests); cached once complete."""
+    started = time.perf_counter()
+    parts = []
+    async for text in gemini_client.client.stream_async(ANSWER_MODEL, prompt):
+        parts.append(text)
+        yield text
+    _store_answer(cache_key, "".join(parts), relevant_chunks, time.perf_counter() - started)
+
+
+async def _save_chat_messages(db: AsyncSession, search_doc_ids, question: str, answer: str):
+    """Save the exchange to chat history when a single document was asked about."""
+    if search_doc_ids and len(search_doc_ids) == 1:
+        doc_id = search_doc_ids[0]
+        db.add(ChatMessage(document_id=doc_id, role="user", content=question))
+        db.add(ChatMessage(document_id=doc_id, role="assistant", content=answer))
+        await db.commit()
+
+
 @router.post("/ask")
-def ask_question(
+async def ask_question(
     q: QuestionRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Ask a question about the document(s).
@@ -390,111 +778,169 @@ def ask_question(
     - All documents (neither provided)
     """
     try:
-        # Determine which document(s) to search
-        search_doc_ids = None
-        
-        if q.document_ids:
-            # Multi-document search
-            search_doc_ids = q.document_ids
-            # Validate all documents exist
-            for doc_id in search_doc_ids:
-                if not db.query(DocumentModel).filter(DocumentModel.id == doc_id).first():
-                    raise HTTPException(status_code=404, detail=f"Document {doc_id} not found")
-        elif q.document_id:
-            # Single document search (backward compatible)
-            if not db.query(DocumentModel).filter(DocumentModel.id == q.document_id).first():
-                raise HTTPException(status_code=404, detail="Document not found")
-            search_doc_ids = [q.document_id]
-        
-        # Search for relevant chunks from selected document(s)
-        relevant_chunks = []
-        if search_doc_ids:
-            # Search each document and collect chunks
-            for doc_id in search_doc_ids:
-                chunks = embeddings.search(q.question, document_id=doc_id, top_k=2)
-                relevant_chunks.extend(chunks)
-        else:
-            # Search all documents (global search)
-            relevant_chunks = embeddings.search(q.question, document_id=None, top_k=5)
-        
+        asked_at = time.monotonic()
+        search_doc_ids, index_ids, query_vec, relevant_chunks = await _retrieve_context(q, db)
+
         if not relevant_chunks:
             return {
-                "answer": "I don't have any relevant information to answer that question. Please upload a document first.",
+                "answer": NO_CONTEXT_ANSWER,
                 "source_chunks": []
             }
-        
-        # Format context with labels so the LLM can reference them
-        context_text = ""
-        for i, chunk in enumerate(relevant_chunks, 1):
-            context_text += f"[Excerpt {i}]:\n{chunk}\n\n"
-        
-        # Build conversation history for context
-        conversation_context = ""
-        if q.use_chat_history and search_doc_ids:
-            # Get recent messages from first document in the list
-            first_doc_id = search_doc_ids[0]
-            recent_messages = db.query(ChatMessage).filter(
-                ChatMessage.document_id == first_doc_id
-            ).order_by(desc(ChatMessage.timestamp)).limit(6).all()
-            
-            recent_messages.reverse()
-            for msg in recent_messages:
-                role = "User" if msg.role == "user" else "Assistant"
-                conversation_context += f"{role}: {msg.content}\n"
-        
-        # Build prompt with context
-        prompt = get_chat_prompt(q.question, context_text, conversation_context)
-        
-        # Generate response using Gemini
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
-        answer = response.text
-        
-        # Save to chat history if single document provided
-        if search_doc_ids and len(search_doc_ids) == 1:
-            doc_id = search_doc_ids[0]
-            user_msg = ChatMessage(
-                document_id=doc_id,
-                role="user",
-                content=q.question
-            )
-            assistant_msg = ChatMessage(
-                document_id=doc_id,
-                role="assistant",
-                content=answer
+
+        prompt, conversation_context = await _build_chat_prompt(q, db, search_doc_ids, relevant_chunks)
+        # Return the connection to the pool while waiting for Gemini
+        await db.commit()
+
+        cache_key = _answer_cache_key(index_ids, query_vec, bool(conversation_context), asked_at)
+        cached = embeddings.lookup_answer(query_vec, index_ids) if cache_key else None
+        if cached is not None:
+            # A near-identical question over the same documents was answered before
+            answer, relevant_chunks = cached["answer"], cached["source_chunks"]
+        else:
+            # Identical questions in flight share one generation
+            answer = await _generation_flight.do(
+                _generation_key("answer", q, index_ids, relevant_chunks, conversation_context),
+                lambda: _generate_answer(prompt, relevant_chunks, cache_key),
+                GENERATION_COALESCE_TIMEOUT_S,
             )
-            db.add(user_msg)
-            db.add(assistant_msg)
-            db.commit()
-        
+
+        await _save_chat_messages(db, search_doc_ids, q.question, answer)
+
         return {
             "answer": answer,
-            "source_chunks": relevant_chunks
+            "source_chunks": relevant_chunks,
+            "cached": cached is not None,
         }
-    
+
     except google_exceptions.ServiceUnavailable as e:
         error_message = "Could not connect to Google's AI service. Please try again."
         return JSONResponse(status_code=503, content={"answer": error_message})
-    
-    except google_exceptions.RetryError as e:
+
+    except (google_exceptions.RetryError, google_exceptions.DeadlineExceeded) as e:
         error_message = "Request to AI service timed out. Please try again."
         return JSONResponse(status_code=504, content={"answer": error_message})
-    
+
+    except (TimeoutError, asyncio.TimeoutError):
+        # Waited too long for a shared embedding or generation call
+        error_message = "Request to AI service timed out. Please try again."
+        return JSONResponse(status_code=504, content={"answer": error_message})
+
     except Exception as e:
         print(f"Error in ask_question: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_answer(
+    q: QuestionRequest, search_doc_ids, relevant_chunks, prompt, cache_key=None, cached_answer=None, flight_key=None
+):
+    """
+    Yield the SSE stream of an answer: a sources event first, then token
+    events as Gemini generates text, then done (after the exchange has been
+    saved to chat history) or error. A cached_answer is sent as a single
+    token; with a cache_key, a generated answer is cached once complete.
+    Streams with the same flight_key share one generation.
+    """
+    yield _sse("sources", {"source_chunks": relevant_chunks})
+    if prompt is None:
+        yield _sse("token", {"text": NO_CONTEXT_ANSWER})
+        yield _sse("done", {"answer": NO_CONTEXT_ANSWER})
+        return
+
+    parts = []
+    try:
+        if cached_answer is not None:
+            answer = cached_answer
+            yield _sse("token", {"text": answer})
+        else:
+            tokens = _generation_flight.stream(
+                flight_key,
+                lambda: _generate_answer_stream(prompt, relevant_chunks, cache_key),
+                GENERATION_COALESCE_TIMEOUT_S,
+            )
+            async for text in tokens:
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            answer = "".join(parts)
+
+        # The request's session may be closed once streaming starts
+        async with AsyncSessionLocal() as db:
+            await _save_chat_messages(db, search_doc_ids, q.question, answer)
+        yield _sse("done", {"answer": answer, "cached": cached_answer is not None})
+
+    except google_exceptions.ServiceUnavailable:
+        yield _sse("error", {"status": 503, "error": "Could not connect to Google's AI service. Please try again."})
+    except (google_exceptions.RetryError, google_exceptions.DeadlineExceeded, TimeoutError, asyncio.TimeoutError):
+        yield _sse("error", {"status": 504, "error": "Request to AI service timed out. Please try again."})
+    except Exception as e:
+        print(f"Error in ask_question_stream: {e}")
+        yield _sse("error", {"status": 500, "error": str(e)})
+
+
+@router.post("/ask/stream")
+async def ask_question_stream(
+    q: QuestionRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streaming variant of /ask over Server-Sent Events. The retrieved
+    source chunks are sent before generation starts, then answer tokens as
+    they are generated:
+    - event: sources  data: {"source_chunks": [...]}
+    - event: token    data: {"text": "..."}  (repeated)
+    - event: done     data: {"answer": "<full answer>", "cached": false}
+    - event: error    data: {"status": 503, "error": "..."}
+    """
+    try:
+        asked_at = time.monotonic()
+        search_doc_ids, index_ids, query_vec, relevant_chunks = await _retrieve_context(q, db)
+        prompt, cache_key, cached, flight_key = None, None, None, None
+        if relevant_chunks:
+            prompt, conversation_context = await _build_chat_prompt(q, db, search_doc_ids, relevant_chunks)
+            cache_key = _answer_cache_key(index_ids, query_vec, bool(conversation_context), asked_at)
+            cached = embeddings.lookup_answer(query_vec, index_ids) if cache_key else None
+            if cached is not None:
+                relevant_chunks = cached["source_chunks"]
+            else:
+                flight_key = _generation_key("stream", q, index_ids, relevant_chunks, conversation_context)
+        # The session is not used while streaming; return its connection to the pool
+        await db.commit()
+    except HTTPException:
+        raise
+    except (TimeoutError, asyncio.TimeoutError):
+        return JSONResponse(status_code=504, content={"error": "Request to AI service timed out. Please try again."})
+    except Exception as e:
+        print(f"Error in ask_question_stream: {e}")
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+    return StreamingResponse(
+        _stream_answer(
+            q,
+            search_doc_ids,
+            relevant_chunks,
+            prompt,
+            cache_key,
+            cached["answer"] if cached is not None else None,
+            flight_key,
+        ),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # --------------------------
 # Summary Endpoint
 # --------------------------
 @router.get("/documents/{document_id}/summary")
-async def get_document_summary(document_id: str, db: Session = Depends(get_db)):
+async def get_document_summary(document_id: str, db: AsyncSession = Depends(get_async_db)):
     """Get or regenerate summary for a specific document."""
     try:
-        doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
-        if not doc:
-            raise HTTPException(status_code=404, detail="Document not found")
+        doc = await _get_document(db, document_id)
         
         return {
             "document_id": doc.id,
@@ -508,57 +954,18 @@ async def get_document_summary(document_id: str, db: Session = Depends(get_db)):
 
 
 @router.post("/documents/{document_id}/summary/regenerate")
-def regenerate_document_summary(document_id: str, db: Session = Depends(get_db)):
-    """Regenerate summary and embeddings for a document synchronously."""
-    doc = db.query(DocumentModel).filter(DocumentModel.id == document_id).first()
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
+async def regenerate_document_summary(document_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Queue regeneration of a document's summary and embeddings."""
+    doc = await _get_document(db, document_id)
 
     file_location = doc.file_path
-    if not os.path.exists(file_location):
+    if not await _run_blocking(os.path.exists, file_location):
         raise HTTPException(status_code=404, detail=f"File not found at path: {file_location}. Cannot regenerate.")
 
-    try:
-        # Mark as processing
-        doc.summary = "Processing..."
-        db.commit()
+    # Mark as processing (with every copy sharing its index)
+    for shared in await db.scalars(_sharing_documents(_index_id(doc))):
+        shared.summary = "Processing..."
+    await db.commit()
+    job_id = await _run_blocking(ingestion_workers.submit, "ingest", {"document_id": doc.id})
 
-        # --- Synchronous Processing ---
-        
-        # 1. Extract text
-        text = extract_text_from_file(file_location, doc.filename)
-        if not text.strip():
-            raise ValueError("No text could be extracted from the file for regeneration.")
-            
-        # 2. Generate summary
-        summary = generate_summary(text, doc.filename)
-        
-        # 3. Preprocess and chunk text
-        processed_text = preprocess_text(text)
-        text_without_stopwords = remove_stopwords(processed_text)
-        chunks = chunk_text(text_without_stopwords, chunk_size=500, chunk_overlap=150)
-        
-        if not chunks:
-            raise ValueError("Text was extracted, but no processable chunks were generated for regeneration.")
-
-        # 4. Delete old index and add new chunks
-        embeddings.delete_index(doc.id)
-        embeddings.add_chunks_to_index(doc.id, chunks)
-
-        # 5. Finalize database update
-        doc.summary = summary
-        doc.chunk_count = len(chunks)
-        doc.document_size = len(text)
-        db.commit()
-        
-        print(f"✓ Document {doc.filename} regenerated and indexed successfully.")
-        
-        return {"message": "Regeneration successful", "document_id": doc.id}
-
-    except Exception as e:
-        # Revert summary on failure
-        doc.summary = "Regeneration failed. Please try again."
-        db.commit()
-        print(f"✗ Error regenerating {doc.filename}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    
+    return {"message": "Regeneration queued", "document_id": doc.id, "job_id": job_id}
@@ -0,0 +1,234 @@
+"""
+Persistent cache of ingestion artifacts keyed by file content.
+Extracted page text and generated summaries are stored zlib-compressed under
+sha256(file content hash, artifact kind, model) in a small SQLite file, so
+regenerating a document, re-indexing it after a configuration change or
+uploading it again skips extraction and the summary call. The file is
+bounded by a byte budget; least recently used artifacts are evicted first.
+
+The cache is used from ingestion worker processes too (INGEST_WORKER_MODE=
+process), so each process opens its own SQLite connection on first use and
+a forked child starts with a fresh lock: connections must not cross a fork,
+and a lock some parent thread held at fork time would never be released.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+
+# Per-row overhead beyond the compressed bytes (key, timestamp, b-tree)
+ROW_OVERHEAD_BYTES = 64
+# Evict down to this fraction of the budget, so eviction runs in batches
+EVICT_TO_FRACTION = 0.9
+# Artifacts larger than this fraction of the budget are not cached
+MAX_ARTIFACT_FRACTION = 0.25
+COMPRESS_LEVEL = 6
+# Compressed pages are inflated this many bytes at a time when replayed
+DECOMPRESS_BLOCK_BYTES = 64 * 1024
+
+_instances = weakref.WeakSet()
+
+
+def _reset_locks_after_fork():
+    # Runs in the child while it has a single thread
+    for cache in list(_instances):
+        cache._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_locks_after_fork)
+
+
+def _decode_pages(blob: bytes):
+    """Yield the length-prefixed UTF-8 pages of a compressed page stream."""
+    for data in _page_records(blob):
+        yield data.decode("utf-8")
+
+
+def _replay_pages(blob: bytes, on_page):
+    """_decode_pages, calling on_page(pages_done, total_pages) after each page."""
+    # Page counts are not stored; counting is one decompression pass, no decoding
+    total = sum(1 for _ in _page_records(blob))
+    for done, page in enumerate(_decode_pages(blob), 1):
+        yield page
+        on_page(done, total)
+
+
+def _page_records(blob: bytes):
+    inflater = zlib.decompressobj()
+    buffer = bytearray()
+    for offset in range(0, len(blob) + 1, DECOMPRESS_BLOCK_BYTES):
+        if offset < len(blob):
+            buffer += inflater.decompress(blob[offset : offset + DECOMPRESS_BLOCK_BYTES])
+        else:
+            buffer += inflater.flush()
+        while len(buffer) >= 4:
+            size = int.from_bytes(buffer[:4], "little")
+            if len(buffer) < 4 + size:
+                break
+            data = bytes(buffer[4 : 4 + size])
+            del buffer[: 4 + size]
+            yield data
+
+
+class ArtifactCache:
+    """
+    Disk-backed {(content hash, kind, model): bytes} map with LRU eviction
+    and hit counters. Byte totals are read from the file, so worker
+    processes can share it.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None  # opened by the process in self._pid
+        self._pid = None
+        # Connections a forked child inherited: kept referenced so they are
+        # never closed (or checkpointed) from the child
+        self._inherited = []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _instances.add(self)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        """This process's connection (used with the lock held), opened on first use."""
+        pid = os.getpid()
+        if self._pid != pid:
+            if self._conn is not None:
+                self._inherited.append(self._conn)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                " key BLOB PRIMARY KEY, kind TEXT NOT NULL, data BLOB NOT NULL, last_used REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS artifacts_last_used ON artifacts (last_used)")
+            conn.commit()
+            self._conn, self._pid = conn, pid
+        return self._conn
+
+    @staticmethod
+    def key(content_hash: str, kind: str, model: str) -> bytes:
+        return hashlib.sha256(f"{content_hash}\0{kind}\0{model}".encode("utf-8")).digest()
+
+    def _get(self, content_hash: str, kind: str, model: str):
+        """The stored (compressed) bytes, or None on a miss; a hit is marked recently used."""
+        key = self.key(content_hash, kind, model)
+        with self._lock:
+            row = self._db.execute("SELECT data FROM artifacts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE artifacts SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def _put(self, content_hash: str, kind: str, model: str, blob: bytes):
+        """Store compressed bytes, then evict LRU artifacts to fit the budget."""
+        if len(blob) > self.max_bytes * MAX_ARTIFACT_FRACTION:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO artifacts (key, kind, data, last_used) VALUES (?, ?, ?, ?)",
+                (self.key(content_hash, kind, model), kind, blob, time.time()),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Drop least recently used artifacts until under EVICT_TO_FRACTION of the budget."""
+        _, current = self._usage()
+        if current <= self.max_bytes:
+            return
+        target = self.max_bytes * EVICT_TO_FRACTION
+        rows = self._db.execute("SELECT key, LENGTH(data) FROM artifacts ORDER BY last_used").fetchall()
+        victims = []
+        for key, size in rows:
+            if current <= target:
+                break
+            victims.append((key,))
+            current -= size + ROW_OVERHEAD_BYTES
+        self._db.executemany("DELETE FROM artifacts WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def _usage(self):
+        entries, data_bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM artifacts"
+        ).fetchone()
+        return entries, data_bytes + entries * ROW_OVERHEAD_BYTES
+
+    def get_text(self, content_hash: str, kind: str, model: str):
+        blob = self._get(content_hash, kind, model)
+        return None if blob is None else zlib.decompress(blob).decode("utf-8")
+
+    def put_text(self, content_hash: str, kind: str, model: str, text: str):
+        self._put(content_hash, kind, model, zlib.compress(text.encode("utf-8"), COMPRESS_LEVEL))
+
+    def iter_pages(self, content_hash: str, model: str, on_page=None):
+        """
+        Generator replaying cached pages, or None on a miss. on_page, if
+        given, is called as on_page(pages_done, total_pages) after each page.
+        """
+        blob = self._get(content_hash, "pages", model)
+        if blob is None:
+            return None
+        return _decode_pages(blob) if on_page is None else _replay_pages(blob, on_page)
+
+    def record_pages(self, content_hash: str, model: str, pages, keep=None):
+        """
+        Pass pages through, compressing them on the way; once every page has
+        been read they are cached (if keep() is true, when keep is given).
+        Only the compressed stream is held, and recording stops if it
+        outgrows the size an artifact may have.
+        """
+        compressor = zlib.compressobj(COMPRESS_LEVEL)
+        parts, size = [], 0
+        for page in pages:
+            if parts is not None:
+                data = page.encode("utf-8")
+                parts.append(compressor.compress(len(data).to_bytes(4, "little") + data))
+                size += len(parts[-1])
+                if size > self.max_bytes * MAX_ARTIFACT_FRACTION:
+                    parts = None
+            yield page
+        if parts is not None and (keep is None or keep()):
+            parts.append(compressor.flush())
+            self._put(content_hash, "pages", model, b"".join(parts))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM artifacts")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = self._pid = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, current = self._usage()
+            kinds = dict(self._db.execute("SELECT kind, COUNT(*) FROM artifacts GROUP BY kind").fetchall())
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "entries_by_kind": kinds,
+                "bytes": current,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
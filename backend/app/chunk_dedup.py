@@ -0,0 +1,237 @@
+"""
+Near-duplicate chunk elimination before embedding.
+Each chunk gets a 64-bit SimHash over its word 3-shingles. A chunk within
+max_distance bits of one already kept in the same document, or anywhere in
+the same corpus (a device's documents), is not embedded or stored: a pointer
+to the kept chunk is recorded instead. Fingerprints and pointers live in a
+small SQLite file; lookups use four 16-bit bands (by pigeonhole, two
+fingerprints within 3 bits share at least one band exactly).
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+SHINGLE_WORDS = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+# Four bands can only guarantee finding fingerprints up to 3 bits apart
+MAX_SUPPORTED_DISTANCE = BANDS - 1
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of text's word shingles (similar texts differ in few bits)."""
+    words = text.split()
+    if len(words) >= SHINGLE_WORDS:
+        features = [" ".join(words[i : i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    else:
+        features = [" ".join(words)]
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little") for f in features),
+        dtype="<u8",
+        count=len(features),
+    )
+    # Each bit is set when the majority of feature hashes have it set
+    bits = np.unpackbits(hashes.view(np.uint8)).reshape(-1, 64)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > len(features)
+    return int.from_bytes(np.packbits(votes).tobytes(), "little")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def bands(fingerprint: int) -> list:
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+def _to_sql(fingerprint: int) -> int:
+    # SQLite integers are signed 64-bit
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+def _from_sql(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class ChunkFingerprints:
+    """
+    Persistent fingerprints of stored chunks per corpus, and pointers from
+    documents to the chunks their skipped duplicates resolved to.
+    """
+
+    def __init__(self, path: str, max_distance: int = MAX_SUPPORTED_DISTANCE):
+        self.path = path
+        self.max_distance = min(max_distance, MAX_SUPPORTED_DISTANCE)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " corpus TEXT NOT NULL, band INTEGER NOT NULL, value INTEGER NOT NULL,"
+            " fingerprint INTEGER NOT NULL, document_id TEXT NOT NULL, chunk_id INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_band ON fingerprints (corpus, band, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_document ON fingerprints (document_id)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pointers ("
+            " document_id TEXT NOT NULL, target_document_id TEXT NOT NULL, target_chunk_id INTEGER NOT NULL,"
+            " duplicates INTEGER NOT NULL, PRIMARY KEY (document_id, target_document_id, target_chunk_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pointers_target ON pointers (target_document_id)")
+        self._conn.commit()
+        self.lookups = 0
+        self.duplicates = 0
+
+    def find(self, corpus: str, fingerprint: int):
+        """(document_id, chunk_id) of a stored chunk near fingerprint, or None."""
+        with self._lock:
+            self.lookups += 1
+            for band, value in enumerate(bands(fingerprint)):
+                rows = self._conn.execute(
+                    "SELECT fingerprint, document_id, chunk_id FROM fingerprints"
+                    " WHERE corpus = ? AND band = ? AND value = ?",
+                    (corpus, band, value),
+                ).fetchall()
+                for stored, document_id, chunk_id in rows:
+                    if hamming(_from_sql(stored), fingerprint) <= self.max_distance:
+                        self.duplicates += 1
+                        return document_id, chunk_id
+        return None
+
+    def add(self, corpus: str, document_id: str, entries):
+        """Record stored chunks: entries are (chunk_id, fingerprint)."""
+        rows = [
+            (corpus, band, value, _to_sql(fingerprint), document_id, chunk_id)
+            for chunk_id, fingerprint in entries
+            for band, value in enumerate(bands(fingerprint))
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO fingerprints (corpus, band, value, fingerprint, document_id, chunk_id)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def add_pointers(self, document_id: str, targets: dict):
+        """Record skipped duplicates: targets is {(target_document_id, chunk_id): duplicates}."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO pointers (document_id, target_document_id, target_chunk_id, duplicates)"
+                " VALUES (?, ?, ?, ?) ON CONFLICT (document_id, target_document_id, target_chunk_id)"
+                " DO UPDATE SET duplicates = duplicates + excluded.duplicates",
+                [(document_id, target, chunk_id, n) for (target, chunk_id), n in targets.items()],
+            )
+            self._conn.commit()
+
+    def pointers(self, document_id: str) -> list:
+        """(target_document_id, chunk_id) of chunks in other documents this document points to."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT target_document_id, target_chunk_id FROM pointers"
+                " WHERE document_id = ? AND target_document_id != ?",
+                (document_id, document_id),
+            ).fetchall()
+
+    def remove_document(self, document_id: str) -> dict:
+        """
+        Forget a document's fingerprints and pointers. Returns the pointers
+        other documents held into it, as {document_id: [(chunk_id, corpus,
+        fingerprint)]}, so the caller can copy those chunks before they go.
+        """
+        with self._lock:
+            referenced = self._conn.execute(
+                "SELECT p.document_id, p.target_chunk_id, f.corpus, f.fingerprint FROM pointers p"
+                " JOIN fingerprints f ON f.document_id = p.target_document_id"
+                " AND f.chunk_id = p.target_chunk_id AND f.band = 0"
+                " WHERE p.target_document_id = ? AND p.document_id != ?",
+                (document_id, document_id),
+            ).fetchall()
+            self._conn.execute("DELETE FROM fingerprints WHERE document_id = ?", (document_id,))
+            self._conn.execute(
+                "DELETE FROM pointers WHERE document_id = ? OR target_document_id = ?", (document_id, document_id)
+            )
+            self._conn.commit()
+        orphans = {}
+        for referrer, chunk_id, corpus, fingerprint in referenced:
+            orphans.setdefault(referrer, []).append((chunk_id, corpus, _from_sql(fingerprint)))
+        return orphans
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM fingerprints")
+            self._conn.execute("DELETE FROM pointers")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            chunks = self._conn.execute("SELECT COUNT(*) FROM fingerprints WHERE band = 0").fetchone()[0]
+            skipped = self._conn.execute("SELECT COALESCE(SUM(duplicates), 0) FROM pointers").fetchone()[0]
+            return {
+                "max_distance": self.max_distance,
+                "fingerprinted_chunks": chunks,
+                "duplicates_skipped": skipped,
+                "lookups": self.lookups,
+                "duplicates_found": self.duplicates,
+            }
+
+
+class ChunkDeduplicator:
+    """
+    Filters one document's chunk stream. Chunks near one kept earlier in
+    the stream or stored in the corpus are dropped; kept chunks get ids
+    first_chunk_id, first_chunk_id + 1, ... in order. Call commit() once the
+    kept chunks are stored to persist their fingerprints and the pointers.
+    """
+
+    def __init__(self, store: ChunkFingerprints, corpus: str, document_id: str, first_chunk_id: int):
+        self.store = store
+        self.corpus = corpus
+        self.document_id = document_id
+        self.next_chunk_id = first_chunk_id
+        self.kept = []  # [(chunk_id, fingerprint)]
+        self.targets = {}  # {(document_id, chunk_id): duplicates}
+        self.skipped = 0
+        self.skipped_text_bytes = 0
+        self._bands = {}  # {(band, value): [(fingerprint, chunk_id)]} for this document
+
+    def _find_in_document(self, fingerprint: int):
+        for key in enumerate(bands(fingerprint)):
+            for stored, chunk_id in self._bands.get(key, ()):
+                if hamming(stored, fingerprint) <= self.store.max_distance:
+                    return self.document_id, chunk_id
+        return None
+
+    def filter(self, chunks):
+        """Yield the chunks that are not near-duplicates."""
+        for chunk in chunks:
+            fingerprint = simhash(chunk)
+            target = self._find_in_document(fingerprint) or self.store.find(self.corpus, fingerprint)
+            if target is not None:
+                self.targets[target] = self.targets.get(target, 0) + 1
+                self.skipped += 1
+                self.skipped_text_bytes += len(chunk.encode("utf-8"))
+                continue
+            chunk_id = self.next_chunk_id
+            self.next_chunk_id += 1
+            self.kept.append((chunk_id, fingerprint))
+            for key in enumerate(bands(fingerprint)):
+                self._bands.setdefault(key, []).append((fingerprint, chunk_id))
+            yield chunk
+
+    def commit(self):
+        if self.kept:
+            self.store.add(self.corpus, self.document_id, self.kept)
+        if self.targets:
+            self.store.add_pointers(self.document_id, self.targets)
@@ -0,0 +1,150 @@
+"""
+Compact on-disk chunk text store used alongside each document's FAISS index.
+Chunk texts are concatenated UTF-8 in a single data file, with an int64 array
+of end offsets; both are memory-mapped so a search only reads the chunks it returns.
+"""
+
+import mmap
+import os
+import threading
+
+import numpy as np
+
+OFFSET_DTYPE = np.dtype("<i8")
+
+
+class ChunkStore:
+    """
+    Append-only mapping of chunk id (0..n-1) -> chunk text.
+    Supports the read side of the old {int: str} id map: `len`, `in` and `[]`.
+    """
+
+    def __init__(self, data_path: str, offsets_path: str):
+        self.data_path = data_path
+        self.offsets_path = offsets_path
+        self._lock = threading.RLock()
+        self._data_map = None
+        self._offsets_map = None
+        self._ends = np.empty(0, dtype=OFFSET_DTYPE)
+        self._closed = False
+        self._open()
+
+    # --------------------------
+    # Opening / mapping
+    # --------------------------
+    def _open(self):
+        """(Re)map the data and offsets files, dropping any torn tail."""
+        self._close_maps()
+        self._closed = False
+        # Files are created lazily on first append
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        offsets_size = os.path.getsize(self.offsets_path) if os.path.exists(self.offsets_path) else 0
+        usable = offsets_size - offsets_size % OFFSET_DTYPE.itemsize
+        if usable:
+            with open(self.offsets_path, "rb") as f:
+                self._offsets_map = mmap.mmap(f.fileno(), usable, access=mmap.ACCESS_READ)
+            ends = np.frombuffer(self._offsets_map, dtype=OFFSET_DTYPE)
+            # A crash between the data and offsets writes can leave offsets
+            # pointing past the data; only trust fully written entries.
+            valid = int(np.searchsorted(ends, data_size, side="right"))
+            self._ends = ends[:valid]
+        else:
+            self._ends = np.empty(0, dtype=OFFSET_DTYPE)
+
+        if data_size:
+            with open(self.data_path, "rb") as f:
+                self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_maps(self):
+        # Drop numpy views before closing the buffer they point into
+        self._ends = np.empty(0, dtype=OFFSET_DTYPE)
+        for m in (self._data_map, self._offsets_map):
+            if m is not None:
+                m.close()
+        self._data_map = None
+        self._offsets_map = None
+
+    def close(self):
+        """Unmap the files (e.g. on cache eviction); a later read maps them again."""
+        with self._lock:
+            self._close_maps()
+            self._closed = True
+
+    def _ensure_open(self):
+        # A reader may still hold a store the index cache has since closed
+        if self._closed:
+            with self._lock:
+                if self._closed:
+                    self._open()
+
+    # --------------------------
+    # Read side
+    # --------------------------
+    def __len__(self) -> int:
+        self._ensure_open()
+        return len(self._ends)
+
+    def __contains__(self, chunk_id) -> bool:
+        return 0 <= chunk_id < len(self)
+
+    def __getitem__(self, chunk_id) -> str:
+        with self._lock:
+            self._ensure_open()
+            if chunk_id not in self:
+                raise KeyError(chunk_id)
+            start = int(self._ends[chunk_id - 1]) if chunk_id else 0
+            end = int(self._ends[chunk_id])
+            return self._data_map[start:end].decode("utf-8")
+
+    def get_many(self, chunk_ids) -> list:
+        """Fetch several chunks; ids that do not exist are skipped."""
+        return [self[i] for i in chunk_ids if i in self]
+
+    # --------------------------
+    # Write side
+    # --------------------------
+    def append(self, texts) -> int:
+        """Append chunk texts; returns the id of the first appended chunk."""
+        with self._lock:
+            self._ensure_open()
+            start_id = len(self._ends)
+            if not texts:
+                return start_id
+            # Truncate any torn tail so new entries line up with valid offsets
+            data_end = int(self._ends[-1]) if len(self._ends) else 0
+            encoded = [t.encode("utf-8") for t in texts]
+            ends = data_end + np.cumsum([len(b) for b in encoded], dtype=OFFSET_DTYPE)
+            self._close_maps()
+            for path in (self.data_path, self.offsets_path):
+                open(path, "ab").close()
+
+            with open(self.data_path, "r+b") as f:
+                f.truncate(data_end)
+                f.seek(data_end)
+                f.write(b"".join(encoded))
+                f.flush()
+                os.fsync(f.fileno())
+            # Offsets are written last: an entry exists only once its end offset does
+            with open(self.offsets_path, "r+b") as f:
+                f.truncate(start_id * OFFSET_DTYPE.itemsize)
+                f.seek(start_id * OFFSET_DTYPE.itemsize)
+                f.write(ends.astype(OFFSET_DTYPE).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._open()
+            return start_id
+
+    def truncate(self, count: int):
+        """Drop every chunk with id >= count."""
+        with self._lock:
+            self._ensure_open()
+            if count >= len(self._ends):
+                return
+            data_end = int(self._ends[count - 1]) if count else 0
+            self._close_maps()
+            with open(self.offsets_path, "r+b") as f:
+                f.truncate(count * OFFSET_DTYPE.itemsize)
+            with open(self.data_path, "r+b") as f:
+                f.truncate(data_end)
+            self._open()
@@ -1,9 +1,12 @@
 """
 Database configuration and session management for SQLAlchemy.
-Handles connection pooling and session lifecycle.
+Handles connection pooling and session lifecycle. API requests use async
+sessions (aiosqlite) so queries never block the event loop; background
+workers use the synchronous sessions.
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 from .models import Base
@@ -11,6 +14,7 @@ import os
 
 # Use SQLite for simplicity (can be upgraded to PostgreSQL in production)
 DATABASE_URL = "sqlite:///./data/marthanote.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./data/marthanote.db"
 
 # Create database directory if it doesn't exist
 os.makedirs("./data", exist_ok=True)
@@ -22,6 +26,23 @@ engine = create_engine(
     poolclass=StaticPool,  # Use StaticPool for SQLite
 )
 
+# Async engine and sessions for the request path. Objects stay usable after
+# commit: reloading expired attributes would need another round trip.
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets request reads run alongside worker writes; NORMAL skips an fsync per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+event.listen(engine, "connect", _configure_sqlite)
+event.listen(async_engine.sync_engine, "connect", _configure_sqlite)
+
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -31,16 +52,20 @@ def init_db():
     # Create any missing tables
     Base.metadata.create_all(bind=engine)
 
-    # Ensure the documents table has the device_id column (SQLite won't alter existing tables automatically)
+    # Add columns introduced after the documents table was created (SQLite won't alter existing tables automatically)
     try:
-        with engine.connect() as conn:
-            res = conn.execute("PRAGMA table_info(documents);")
-            cols = [r[1] for r in res.fetchall()]
-            if "device_id" not in cols:
-                print("Adding missing 'device_id' column to documents table")
-                conn.execute("ALTER TABLE documents ADD COLUMN device_id TEXT;")
+        with engine.begin() as conn:
+            cols = [r[1] for r in conn.execute(text("PRAGMA table_info(documents);")).fetchall()]
+            for name in ("device_id", "content_hash", "index_id"):
+                if name not in cols:
+                    print(f"Adding missing '{name}' column to documents table")
+                    conn.execute(text(f"ALTER TABLE documents ADD COLUMN {name} TEXT;"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_documents_index_id ON documents (index_id);"))
+            # Documents uploaded before index sharing use their own index
+            conn.execute(text("UPDATE documents SET index_id = id WHERE index_id IS NULL;"))
     except Exception as e:
-        print(f"Warning: could not ensure device_id column exists: {e}")
+        print(f"Warning: could not migrate documents table: {e}")
 
     print("✓ Database tables initialized.")
 
@@ -56,3 +81,13 @@ def get_db() -> Session:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncSession:
+    """
+    Dependency injection function for async FastAPI routes.
+    Usage in routes: @router.get("/path")
+    async def route(db: AsyncSession = Depends(get_async_db)):
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,170 @@
+"""
+Persistent content-addressed cache of chunk embeddings.
+Vectors are keyed by sha256(embedding model, chunk text) and stored as raw
+float32 bytes in a small SQLite file, so re-uploading or regenerating a
+document never re-embeds chunks that were embedded before. The file is
+bounded by a byte budget; least recently used vectors are evicted first.
+Readers that need fresh vectors can pass a maximum age; older entries are
+then dropped instead of returned.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# Per-row overhead beyond the vector bytes (key, timestamp, b-tree)
+ROW_OVERHEAD_BYTES = 64
+# Evict down to this fraction of the budget, so eviction runs in batches
+EVICT_TO_FRACTION = 0.9
+
+
+class EmbeddingCache:
+    """
+    Disk-backed {text: float32 vector} map for one embedding model, with LRU
+    eviction and hit counters. Models can share a file; keys never collide.
+    """
+
+    def __init__(self, path: str, model: str, max_bytes: int):
+        self.path = path
+        self.model = model
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL, created_at REAL"
+            ") WITHOUT ROWID"
+        )
+        # Cache files created before entry ages were recorded
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")}
+        if "created_at" not in columns:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN created_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        entries, vector_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        self.entries = entries
+        self.current_bytes = vector_bytes + entries * ROW_OVERHEAD_BYTES
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(self.model.encode() + b"\0" + text.encode("utf-8")).digest()
+
+    def get_many(self, texts, max_age_s: float = None) -> list:
+        """
+        Return a vector (or None on a miss) for each text, marking hits recently
+        used. With max_age_s, entries stored longer ago than that are deleted
+        and count as misses.
+        """
+        keys = [self.key(text) for text in texts]
+        found, expired = {}, []
+        now = time.time()
+        # Entries written before ages were recorded are aged from their last use
+        oldest = now - max_age_s if max_age_s is not None else float("-inf")
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = list(set(keys[i : i + 500]))
+                rows = self._conn.execute(
+                    "SELECT key, vector, COALESCE(created_at, last_used) FROM embeddings"
+                    f" WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, vector, created_at in rows:
+                    if created_at >= oldest:
+                        found[key] = vector
+                    else:
+                        expired.append((key, vector))
+            if expired:
+                self._delete(expired)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+            if found or expired:
+                self._conn.commit()
+            out = [np.frombuffer(found[k], dtype=np.float32) if k in found else None for k in keys]
+            hits = sum(v is not None for v in out)
+            self.hits += hits
+            self.misses += len(out) - hits
+        return out
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts, then evict LRU entries to fit the budget."""
+        now = time.time()
+        rows = {
+            self.key(text): np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+            for text, vector in zip(texts, vectors)
+        }
+        with self._lock:
+            for key, blob in rows.items():
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, last_used, created_at) VALUES (?, ?, ?, ?)",
+                    (key, blob, now, now),
+                ).rowcount
+                if inserted:
+                    self.entries += 1
+                    self.current_bytes += len(blob) + ROW_OVERHEAD_BYTES
+            self._evict()
+            self._conn.commit()
+
+    def _delete(self, rows):
+        """Drop expired (key, vector) rows; the caller commits."""
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+        self.entries -= len(rows)
+        self.current_bytes -= sum(len(vector) for _, vector in rows) + len(rows) * ROW_OVERHEAD_BYTES
+
+    def _evict(self):
+        """Drop least recently used vectors until under EVICT_TO_FRACTION of the budget."""
+        if self.current_bytes <= self.max_bytes or not self.entries:
+            return
+        target = self.max_bytes * EVICT_TO_FRACTION
+        entry_bytes = self.current_bytes / self.entries
+        count = min(self.entries, int((self.current_bytes - target) / entry_bytes) + 1)
+        freed = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM"
+            " (SELECT vector FROM embeddings ORDER BY last_used LIMIT ?)",
+            (count,),
+        ).fetchone()[0]
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (count,),
+        )
+        self.entries -= count
+        self.current_bytes -= freed + count * ROW_OVERHEAD_BYTES
+        self.evictions += count
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self.entries = 0
+            self.current_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model,
+                "entries": self.entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
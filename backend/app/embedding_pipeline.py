@@ -0,0 +1,205 @@
+"""
+Concurrent, rate-limit-aware embedding pipeline for ingestion.
+Chunk batches are embedded on a bounded thread pool, paced by a shared
+token bucket, and retried with jittered exponential backoff on 429/503.
+Batch size adapts to rate limiting (additive increase, multiplicative
+decrease), and results are yielded in chunk order so vector ids stay
+aligned with chunk ids. With an EmbeddingCache, only chunks missing from
+the cache are sent to the API.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+from google.api_core import exceptions as google_exceptions
+
+# Rate limiting shrinks the batch size; other retryable errors only back off
+RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+RETRYABLE_ERRORS = RATE_LIMIT_ERRORS + (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` requests per second with bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for `seconds` (all workers back off after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveBatchSize:
+    """
+    AIMD batch sizing: grow by `step` after `grow_after` consecutive successful
+    calls, halve on every rate-limit response.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, grow_after: int = 4):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.size = min(max(initial, minimum), self.maximum)
+        self.step = max(1, initial // 4)
+        self.grow_after = grow_after
+        self._streak = 0
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        with self._lock:
+            return self.size
+
+    def on_success(self):
+        with self._lock:
+            self._streak += 1
+            if self._streak >= self.grow_after:
+                self._streak = 0
+                self.size = min(self.maximum, self.size + self.step)
+
+    def on_rate_limited(self):
+        with self._lock:
+            self._streak = 0
+            self.size = max(self.minimum, self.size // 2)
+
+
+class EmbeddingPipeline:
+    """
+    Embeds chunk lists through `embed_fn(texts) -> list of vectors` with at
+    most `concurrency` calls in flight. One pipeline is shared by all
+    ingestion requests so they share the rate limit.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        requests_per_minute: float = 0,
+        batch_size: int = 32,
+        max_batch_size: int = 100,
+        max_retries: int = 6,
+        backoff_base_s: float = 0.5,
+        backoff_max_s: float = 30.0,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.bucket = TokenBucket(requests_per_minute / 60.0, self.concurrency) if requests_per_minute > 0 else None
+        self.batch_size = AdaptiveBatchSize(batch_size, max_batch_size)
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="embed")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.chunks = 0
+
+    def embed(self, chunks, embed_fn, cache=None):
+        """
+        Yield (batch, vectors) for consecutive batches of chunks, in order.
+        vectors is a float32 array with one row per chunk in batch.
+        chunks may be any iterable (e.g. a generator still extracting the
+        document); it is consumed lazily, at most 2 * concurrency batches ahead.
+        """
+        chunks = iter(chunks)
+        window = deque()  # [(batch, future)] in chunk order
+        max_in_flight = self.concurrency * 2
+        exhausted = False
+        try:
+            while True:
+                # Keep the pool busy; batch size is read at submission time
+                while not exhausted and len(window) < max_in_flight:
+                    batch = list(islice(chunks, self.batch_size.current()))
+                    if not batch:
+                        exhausted = True
+                        break
+                    window.append((batch, self._executor.submit(self._embed_batch, batch, embed_fn, cache)))
+                if not window:
+                    break
+                batch, future = window.popleft()
+                yield batch, future.result()
+        finally:
+            # Caller stopped early or a batch failed: drop work not yet started
+            for _, future in window:
+                future.cancel()
+
+    def _embed_batch(self, batch, embed_fn, cache) -> np.ndarray:
+        """Embed a batch, serving cached chunks locally and each distinct miss once."""
+        if cache is None:
+            return self._call_with_retry(batch, embed_fn)
+        vectors = cache.get_many(batch)
+        missing = list(dict.fromkeys(text for text, vector in zip(batch, vectors) if vector is None))
+        if missing:
+            fresh = self._call_with_retry(missing, embed_fn)
+            cache.put_many(missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(batch, vectors)]
+        return np.vstack(vectors).astype(np.float32, copy=False)
+
+    def _call_with_retry(self, batch, embed_fn) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            with self._lock:
+                self.requests += 1
+            try:
+                vecs = embed_fn(batch)
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                # Full jitter keeps concurrent workers from retrying in lockstep
+                delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2**attempt))
+                with self._lock:
+                    self.retries += 1
+                    if isinstance(e, RATE_LIMIT_ERRORS):
+                        self.rate_limited += 1
+                if isinstance(e, RATE_LIMIT_ERRORS):
+                    self.batch_size.on_rate_limited()
+                    if self.bucket is not None:
+                        self.bucket.pause(delay)
+                print(f"Warning: embedding batch of {len(batch)} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.batch_size.on_success()
+            arr = np.vstack(vecs).astype(np.float32) if len(vecs) else np.empty((0, 0), dtype=np.float32)
+            if arr.shape[0] != len(batch):
+                raise ValueError(f"Embedding API returned {arr.shape[0]} vectors for {len(batch)} chunks")
+            with self._lock:
+                self.chunks += len(batch)
+            return arr
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "batch_size": self.batch_size.current(),
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "chunks": self.chunks,
+            }
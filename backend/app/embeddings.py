@@ -2,19 +2,46 @@
 Enhanced multi-document FAISS embedding system.
 Maintains separate FAISS indices per document for isolated search context.
 Supports both document-specific and global search modes.
+
+Global search is served by a single consolidated FAISS index holding every
+document's vectors, so its cost does not grow with the number of files.
 """
 
 import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import faiss
 import numpy as np
 import pickle
 from dotenv import load_dotenv
-import google.generativeai as genai
 from pathlib import Path
 
+from . import gemini_client
+from .answer_cache import AnswerCache
+from .chunk_dedup import ChunkDeduplicator, ChunkFingerprints
+from .chunk_store import ChunkStore
+from .embedding_cache import EmbeddingCache
+from .embedding_pipeline import EmbeddingPipeline
+from .index_cache import IndexCache
+from .index_policy import (
+    build_id_index,
+    build_index,
+    choose_index_spec,
+    configure_search,
+    describe_compression,
+    describe_index,
+    describe_spec,
+    index_ids,
+    index_memory_bytes,
+)
+from .query_cache import QueryCache, normalize_question
+from .rwlock import ReadWriteLock
+from .segment_log import OP_ADD, OP_ADD_IDS, OP_REMOVE_RANGE, SegmentLog, write_index_atomic
+from .singleflight import SingleFlight
+from .vector_store import VectorStore
+
 load_dotenv()
-GEN_API_KEY = os.getenv("GEN_API_KEY")
-genai.configure(api_key=GEN_API_KEY)
 
 # --------------------------
 # Configuration
@@ -22,19 +49,146 @@ genai.configure(api_key=GEN_API_KEY)
 EMBED_MODEL = "models/text-embedding-004"  # Gemini embedding model (768 dims)
 INDICES_DIR = "./data/indices"  # Directory for per-document indices
 os.makedirs(INDICES_DIR, exist_ok=True)
+EMBED_DIM = 768
+
+# Global index mode: keep all chunk vectors in one consolidated index.
+# Set GLOBAL_INDEX_ENABLED=0 to fall back to scanning per-document indices.
+GLOBAL_INDEX_ENABLED = os.getenv("GLOBAL_INDEX_ENABLED", "1") != "0"
+GLOBAL_INDEX_DIR = os.path.join(INDICES_DIR, "_global")
+
+# Memory budget for loaded per-document indices (bytes). Least recently
+# used documents are evicted once the budget is exceeded; pinned
+# (active) documents stay resident.
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Index writes are appended to a per-index segment log; the base index is
+# rewritten (compacted) only once the log reaches this size and the size
+# of the base, so each add costs O(new chunks) amortized.
+WAL_COMPACT_MIN_BYTES = int(os.getenv("WAL_COMPACT_MIN_BYTES", str(16 * 1024 * 1024)))
+
+# Compressed indices (INDEX_COMPRESSION=fp16/sq8/pq) fetch this many times
+# more candidates and re-rank them with exact full-precision distances.
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+
+# Ingestion embeds batches concurrently, paced to the API quota. Batch size
+# starts at EMBED_BATCH_SIZE and adapts to rate limiting (up to the API's
+# 100-texts-per-request limit); 429/503 responses are retried with backoff.
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1500"))  # 0 disables pacing
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "100"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+
+# Chunk embeddings are cached on disk by (model, text hash), so identical
+# chunks (re-uploads, regenerations) are never embedded twice.
+# Set EMBED_CACHE_MAX_BYTES=0 to disable the cache.
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./data/embedding_cache.db")
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Query vectors are cached in-process by normalized question text. With
+# QUERY_CACHE_PERSIST=1 misses also check the on-disk embedding cache.
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096"))
+QUERY_CACHE_TTL_S = float(os.getenv("QUERY_CACHE_TTL_S", str(24 * 3600)))
+QUERY_CACHE_PERSIST = os.getenv("QUERY_CACHE_PERSIST", "1") != "0"
+# Concurrent identical questions (after normalization) share one query cache
+# lookup and embedding call; the others wait up to QUERY_COALESCE_TIMEOUT_S.
+QUERY_COALESCE_TIMEOUT_S = float(os.getenv("QUERY_COALESCE_TIMEOUT_S", "30"))
+
+# Generated answers are cached per document set; a question whose vector has
+# cosine similarity >= ANSWER_CACHE_MIN_SIMILARITY with a cached question over
+# the same documents reuses its answer. ANSWER_CACHE_MAX_ENTRIES=0 disables it.
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(24 * 3600)))
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+
+# CHUNK_DEDUP=1 skips chunks that are near-duplicates (SimHash within
+# CHUNK_DEDUP_MAX_DISTANCE bits) of a chunk already stored in the same
+# document or device corpus; a pointer to the stored chunk is kept instead.
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "0") == "1"
+CHUNK_DEDUP_MAX_DISTANCE = int(os.getenv("CHUNK_DEDUP_MAX_DISTANCE", "3"))
+CHUNK_DEDUP_PATH = os.getenv("CHUNK_DEDUP_PATH", "./data/chunk_fingerprints.db")
 
 # In-memory cache for loaded indices
-_index_cache = {}  # {document_id: (index, id_to_chunk)}
+# {document_id: (index, chunk_store)}; dropped entries' chunk stores are closed
+_index_cache = IndexCache(INDEX_CACHE_MAX_BYTES, close=lambda entry: entry[1].close())
+
+# Consolidated global index state.
+# Vector ids encode (document sequence number << 32 | local chunk id), so the
+# chunk -> document mapping needs only one registry entry per document.
+_global_index = None  # faiss.IndexIDMap2 over IndexFlatL2
+_global_registry = None  # {"next_seq": int, "documents": {document_id: seq}, "generation": int}
+_global_seq_to_doc = {}  # {seq: document_id}
+_global_lock = threading.RLock()
+# Searches share the loaded index; writers (holding _global_lock) mutate it alone
+_global_index_rw = ReadWriteLock()
+_global_pending_ops = None  # ops applied while the global index is being rebuilt
+
+# Per-document locks serialize appends, searches and index swaps. The epoch
+# changes whenever a document's index is deleted, so a background rebuild
+# started before a delete/regenerate never swaps in stale vectors.
+_document_locks = {}  # {document_id: threading.RLock}
+_document_epochs = {}  # {document_id: int}
+_document_locks_guard = threading.Lock()
+
+# Background index migrations (Flat -> HNSW/IVF) run one at a time
+_migration_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-migration")
+_migrations = {}  # {document_id or "_global": Future}
+_migrations_lock = threading.Lock()
+
+# Shared by all ingestions so concurrent uploads share the rate limit
+_embedding_pipeline = EmbeddingPipeline(
+    concurrency=EMBED_CONCURRENCY,
+    requests_per_minute=EMBED_REQUESTS_PER_MINUTE,
+    batch_size=EMBED_BATCH_SIZE,
+    max_batch_size=EMBED_MAX_BATCH_SIZE,
+    max_retries=EMBED_MAX_RETRIES,
+)
+_embedding_cache = (
+    EmbeddingCache(EMBED_CACHE_PATH, EMBED_MODEL, EMBED_CACHE_MAX_BYTES) if EMBED_CACHE_MAX_BYTES > 0 else None
+)
+_query_cache = QueryCache(
+    QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_S, _embedding_cache if QUERY_CACHE_PERSIST else None
+)
+_query_flight = SingleFlight()
+_answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_S, ANSWER_CACHE_MIN_SIMILARITY)
+# Opened even with CHUNK_DEDUP off, so pointers recorded earlier still resolve
+_chunk_fingerprints = ChunkFingerprints(CHUNK_DEDUP_PATH, CHUNK_DEDUP_MAX_DISTANCE)
 
 
 # --------------------------
 # Helper: Get index file paths
 # --------------------------
 def _get_index_paths(document_id: str):
-    """Get paths for a document's index and ID map files."""
+    """Get paths for a document's base index, chunk store, segment log and vector files."""
     index_path = os.path.join(INDICES_DIR, f"{document_id}.index")
-    id_map_path = os.path.join(INDICES_DIR, f"{document_id}_id_map.pkl")
-    return index_path, id_map_path
+    chunks_path = os.path.join(INDICES_DIR, f"{document_id}.chunks")
+    offsets_path = os.path.join(INDICES_DIR, f"{document_id}.offsets")
+    log_path = os.path.join(INDICES_DIR, f"{document_id}.wal")
+    vectors_path = os.path.join(INDICES_DIR, f"{document_id}.vectors")
+    return index_path, chunks_path, offsets_path, log_path, vectors_path
+
+
+def _get_legacy_id_map_path(document_id: str):
+    """Path of the pickled {int: str} id map used before the chunk store."""
+    return os.path.join(INDICES_DIR, f"{document_id}_id_map.pkl")
+
+
+def _get_document_log(document_id: str) -> SegmentLog:
+    """Get the append-only segment log holding a document's uncompacted adds."""
+    return SegmentLog(_get_index_paths(document_id)[3], EMBED_DIM)
+
+
+def _get_vector_store(document_id: str) -> VectorStore:
+    """Get the full-precision vectors of a document (exact re-ranking and rebuilds)."""
+    return VectorStore(_get_index_paths(document_id)[4], EMBED_DIM)
+
+
+def _get_document_lock(document_id: str) -> threading.RLock:
+    with _document_locks_guard:
+        lock = _document_locks.get(document_id)
+        if lock is None:
+            lock = _document_locks[document_id] = threading.RLock()
+        return lock
 
 
 # --------------------------
@@ -42,44 +196,464 @@ def _get_index_paths(document_id: str):
 # --------------------------
 def _load_or_create_index(document_id: str):
     """Load existing index or create new one for a document."""
-    if document_id in _index_cache:
-        return _index_cache[document_id]
+    cached = _index_cache.get(document_id)
+    if cached is not None:
+        return cached
+
+    with _get_document_lock(document_id):
+        # Another thread may have loaded it while we waited
+        cached = _index_cache.get(document_id)
+        if cached is not None:
+            return cached
 
-    index_path, id_map_path = _get_index_paths(document_id)
+        index_path, chunks_path, offsets_path, _, _ = _get_index_paths(document_id)
+        legacy_id_map_path = _get_legacy_id_map_path(document_id)
 
-    if os.path.exists(index_path) and os.path.exists(id_map_path):
-        index = faiss.read_index(index_path)
+        if os.path.exists(index_path):
+            index = configure_search(faiss.read_index(index_path))
+        else:
+            index = faiss.IndexFlatL2(EMBED_DIM)  # 768 dims for text-embedding-004
+        _replay_document_log(index, _get_document_log(document_id))
+
+        chunk_store = ChunkStore(chunks_path, offsets_path)
+        if os.path.exists(legacy_id_map_path):
+            _migrate_legacy_id_map(legacy_id_map_path, chunk_store)
+        # Chunks written without a committed log record (a crash mid-add) have no vectors
+        chunk_store.truncate(index.ntotal)
+        _sync_vector_store(index, _get_vector_store(document_id))
+
+        _index_cache.put(document_id, (index, chunk_store), _estimate_entry_bytes(index, chunk_store))
+        return index, chunk_store
+
+
+def _replay_document_log(index, log: SegmentLog):
+    """Apply logged adds that are not yet part of the base index."""
+    for record in log.replay():
+        if record.op != OP_ADD:
+            continue
+        # Records already folded into the base by a compaction are skipped
+        skip = index.ntotal - record.start
+        if skip < 0:
+            print(f"Warning: gap in segment log {log.path}; ignoring later records")
+            break
+        if skip < record.count:
+            index.add(np.ascontiguousarray(record.vectors[skip:]))
+
+
+def _sync_vector_store(index, vector_store: VectorStore):
+    """Trim uncommitted rows, and backfill exact vectors for indices created before the store."""
+    vector_store.truncate(index.ntotal)
+    missing = index.ntotal - len(vector_store)
+    if missing > 0 and describe_compression(index) == "none":
+        try:
+            vector_store.append(index.reconstruct_n(len(vector_store), missing))
+        except RuntimeError as e:
+            print(f"Warning: could not backfill full-precision vectors: {e}")
+
+
+def _migrate_legacy_id_map(id_map_path: str, chunk_store: ChunkStore):
+    """One-time conversion of a pickled id map into the chunk store."""
+    if len(chunk_store) == 0:
         with open(id_map_path, "rb") as f:
             id_to_chunk = pickle.load(f)
-    else:
-        index = faiss.IndexFlatL2(768)  # 768 dims for text-embedding-004
-        id_to_chunk = {}
+        chunk_store.append([id_to_chunk[i] for i in sorted(id_to_chunk)])
+    os.remove(id_map_path)
+
 
-    _index_cache[document_id] = (index, id_to_chunk)
-    return index, id_to_chunk
+def _estimate_entry_bytes(index, chunk_store) -> int:
+    """Approximate resident size of a cached (index, chunk_store) entry."""
+    # Chunk text and full-precision vectors are memory-mapped; only the
+    # index codes and the offsets array are counted
+    return index_memory_bytes(index) + len(chunk_store) * 8
 
 
 # --------------------------
 # Save index to disk
 # --------------------------
-def _save_index(document_id: str, index, id_to_chunk):
-    """Persist index and ID map to disk."""
-    index_path, id_map_path = _get_index_paths(document_id)
-    
-    faiss.write_index(index, index_path)
-    with open(id_map_path, "wb") as f:
-        pickle.dump(id_to_chunk, f)
+def _needs_compaction(log: SegmentLog, base_path: str) -> bool:
+    """Compact once the log outgrows both the minimum size and the base index."""
+    base_size = os.path.getsize(base_path) if os.path.exists(base_path) else 0
+    return log.size_bytes() >= max(WAL_COMPACT_MIN_BYTES, base_size)
+
+
+def _save_index(document_id: str, index):
+    """Compact: atomically rewrite the base index, then empty the segment log."""
+    index_path = _get_index_paths(document_id)[0]
+    write_index_atomic(index, index_path)
+    # A crash before the reset is harmless: replay skips records in the base
+    _get_document_log(document_id).reset()
+
+
+# --------------------------
+# Consolidated global index
+# --------------------------
+# Persistence is generation based: registry.json names the live generation,
+# whose base index and segment log are global.<gen>.index / global.<gen>.wal.
+# Compaction writes generation g+1 and commits it by atomically rewriting the
+# registry, so a crash at any point leaves one consistent generation.
+def _get_global_registry_path():
+    return os.path.join(GLOBAL_INDEX_DIR, "registry.json")
+
+
+def _get_global_paths(generation: int):
+    """Get paths for one generation of the global base index and segment log."""
+    index_path = os.path.join(GLOBAL_INDEX_DIR, f"global.{generation}.index")
+    log_path = os.path.join(GLOBAL_INDEX_DIR, f"global.{generation}.wal")
+    return index_path, log_path
+
+
+def _get_global_log() -> SegmentLog:
+    return SegmentLog(_get_global_paths(_global_registry["generation"])[1], EMBED_DIM)
+
+
+def _global_id_range(seq: int):
+    """Return the [start, end) vector id range owned by a document sequence number."""
+    return seq << 32, (seq + 1) << 32
+
+
+def _write_global_registry():
+    """Atomically persist the document registry (and live generation)."""
+    os.makedirs(GLOBAL_INDEX_DIR, exist_ok=True)
+    registry_path = _get_global_registry_path()
+    tmp_path = registry_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_global_registry, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, registry_path)
+
+
+def _compact_global_index():
+    """Write the global index as a new generation and commit it via the registry."""
+    os.makedirs(GLOBAL_INDEX_DIR, exist_ok=True)
+    old_generation = _global_registry["generation"]
+    new_generation = old_generation + 1 if os.path.exists(_get_global_registry_path()) else old_generation
+
+    # Drop vectors of documents whose removal was registered but not logged
+    if _global_index.ntotal:
+        live_ids = index_ids(_global_index)
+        known = np.array(list(_global_seq_to_doc), dtype=np.int64)
+        orphan = live_ids[~np.isin(live_ids >> 32, known)]
+        if orphan.size:
+            with _global_index_rw.write():
+                _global_index.remove_ids(faiss.IDSelectorBatch(orphan))
+
+    index_path, log_path = _get_global_paths(new_generation)
+    write_index_atomic(_global_index, index_path)
+    SegmentLog(log_path, EMBED_DIM).reset()
+    _global_registry["generation"] = new_generation
+    _write_global_registry()
+
+    if new_generation != old_generation:
+        for path in _get_global_paths(old_generation):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _register_global_document(document_id: str) -> int:
+    """Return the sequence number for a document, assigning one if needed."""
+    seq = _global_registry["documents"].get(document_id)
+    if seq is None:
+        seq = _global_registry["next_seq"]
+        _global_registry["next_seq"] = seq + 1
+        _global_registry["documents"][document_id] = seq
+        _global_seq_to_doc[seq] = document_id
+        # Registered before any of its vectors are logged
+        _write_global_registry()
+    return seq
+
+
+def _load_global_index():
+    """Load the global index, building it from per-document indices if missing."""
+    global _global_index, _global_registry
+    with _global_lock:
+        if _global_index is not None:
+            return _global_index
+
+        registry_path = _get_global_registry_path()
+        if os.path.exists(registry_path):
+            with open(registry_path, "r") as f:
+                _global_registry = json.load(f)
+            _global_seq_to_doc.clear()
+            for doc_id, seq in _global_registry["documents"].items():
+                _global_seq_to_doc[seq] = doc_id
+            index_path, _ = _get_global_paths(_global_registry["generation"])
+            if os.path.exists(index_path):
+                index = configure_search(faiss.read_index(index_path))
+            else:
+                index = faiss.IndexIDMap2(faiss.IndexFlatL2(EMBED_DIM))
+            for record in _get_global_log().replay():
+                if record.op == OP_ADD_IDS:
+                    index.add_with_ids(np.ascontiguousarray(record.vectors), record.ids)
+                elif record.op == OP_REMOVE_RANGE:
+                    index.remove_ids(faiss.IDSelectorRange(record.start, record.end))
+            # Published only once built: searches read _global_index without _global_lock
+            _global_index = index
+            _reconcile_global_index()
+            return _global_index
+
+        # Migrate: consolidate any existing per-document indices
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(EMBED_DIM))
+        _global_registry = {"next_seq": 0, "documents": {}, "generation": 0}
+        _global_seq_to_doc.clear()
+        for index_file in sorted(os.listdir(INDICES_DIR)):
+            if not index_file.endswith(".index"):
+                continue
+            doc_id = index_file[: -len(".index")]
+            doc_index, _ = _load_or_create_index(doc_id)
+            if doc_index.ntotal == 0:
+                continue
+            seq = _global_registry["next_seq"]
+            _global_registry["next_seq"] = seq + 1
+            _global_registry["documents"][doc_id] = seq
+            _global_seq_to_doc[seq] = doc_id
+            vectors = _read_document_vectors(doc_id, doc_index, 0, doc_index.ntotal)
+            index.add_with_ids(vectors, _global_ids(seq, 0, vectors.shape[0]))
+        _global_index = index
+        _compact_global_index()
+        return _global_index
+
+
+def _stored_chunk_count(document_id: str) -> int:
+    """
+    Upper bound on a document's committed chunks, from its chunk store's
+    offsets file size (chunk text is written before the commit point).
+    """
+    offsets_path = _get_index_paths(document_id)[2]
+    return os.path.getsize(offsets_path) // 8 if os.path.exists(offsets_path) else 0
+
+
+def _reconcile_global_index():
+    """
+    Catch the global index up with the per-document stores on load. A crash
+    after a document's segment log commit but before the global write
+    leaves committed chunks missing from global search; a crash during a
+    delete leaves a registered document without files.
+    """
+    ids = index_ids(_global_index) if _global_index.ntotal else np.empty(0, dtype=np.int64)
+    on_disk = {name[: -len(".index")] for name in os.listdir(INDICES_DIR) if name.endswith(".index")}
+    for doc_id in [doc_id for doc_id in _global_registry["documents"] if doc_id not in on_disk]:
+        _global_remove(doc_id)
+    for doc_id in sorted(on_disk):
+        seq = _global_registry["documents"].get(doc_id)
+        present = ids[(ids >> 32) == seq] & 0xFFFFFFFF if seq is not None else ids[:0]
+        legacy = os.path.exists(_get_legacy_id_map_path(doc_id))
+        # Cheap check first: only documents that may hold more chunks are loaded
+        if not legacy and _stored_chunk_count(doc_id) <= present.size:
+            continue
+        with _get_document_lock(doc_id):
+            doc_index, _ = _load_or_create_index(doc_id)
+            missing = np.setdiff1d(np.arange(doc_index.ntotal, dtype=np.int64), present)
+            # Missing ids are added as contiguous runs of local ids
+            runs = np.split(missing, np.flatnonzero(np.diff(missing) != 1) + 1) if missing.size else []
+            parts = [
+                (int(run[0]), _read_document_vectors(doc_id, doc_index, int(run[0]), int(run[-1]) + 1))
+                for run in runs
+            ]
+        for start_id, vectors in parts:
+            _global_add(doc_id, start_id, vectors)
+        if missing.size:
+            print(f"✓ Restored {missing.size} chunks of document {doc_id} to the global index")
+
+
+def _global_ids(seq: int, start_id: int, count: int) -> np.ndarray:
+    """Global vector ids for a document's local chunk ids start_id..start_id+count."""
+    return (np.int64(seq) << 32) + np.arange(start_id, start_id + count, dtype=np.int64)
+
+
+def _global_add(document_id: str, start_id: int, vectors: np.ndarray):
+    """Add a document's vectors (local ids start_id..) to the global index."""
+    with _global_lock:
+        index = _load_global_index()
+        seq = _register_global_document(document_id)
+        ids = _global_ids(seq, start_id, vectors.shape[0])
+        _get_global_log().append_add_with_ids(vectors, ids)
+        with _global_index_rw.write():
+            index.add_with_ids(vectors, ids)
+        if _global_pending_ops is not None:
+            _global_pending_ops.append(("add", ids, vectors))
+
+
+def _global_remove(document_id: str):
+    """Remove all of a document's vectors from the global index."""
+    with _global_lock:
+        index = _load_global_index()
+        seq = _global_registry["documents"].pop(document_id, None)
+        if seq is None:
+            return
+        _global_seq_to_doc.pop(seq, None)
+        _write_global_registry()
+        start, end = _global_id_range(seq)
+        _get_global_log().append_remove_range(start, end)
+        with _global_index_rw.write():
+            index.remove_ids(faiss.IDSelectorRange(start, end))
+        if _global_pending_ops is not None:
+            _global_pending_ops.append(("remove", start, end))
+        _maybe_compact_global_index()
+
+
+def _maybe_compact_global_index():
+    with _global_lock:
+        base_path = _get_global_paths(_global_registry["generation"])[0]
+        if _needs_compaction(_get_global_log(), base_path):
+            _compact_global_index()
+
+
+def _global_search(query_vec: np.ndarray, k: int):
+    """Search the global index. Returns a list of (distance, document_id, local_id)."""
+    # Once loaded, the index is searched without _global_lock; searches
+    # overlap under the read lock and only wait for index mutations
+    index = _global_index
+    if index is None:
+        index = _load_global_index()
+    with _global_index_rw.read():
+        if index.ntotal == 0:
+            return []
+        compressed = describe_compression(index) != "none"
+        fetch_k = k * RERANK_FACTOR if compressed else k
+        D, I = index.search(np.array([query_vec]), min(fetch_k, index.ntotal))
+        hits = []
+        for distance, vector_id in zip(D[0], I[0]):
+            if vector_id < 0:
+                continue
+            doc_id = _global_seq_to_doc.get(int(vector_id) >> 32)
+            if doc_id is not None:
+                hits.append((distance, doc_id, int(vector_id) & 0xFFFFFFFF))
+    if compressed:
+        hits = _rerank(query_vec, hits, k)
+    return hits
+
+
+# --------------------------
+# Background index migration (Flat -> HNSW / IVF)
+# --------------------------
+def _schedule_migration(key: str, fn):
+    """Run a migration in the background unless one is already running for key."""
+    with _migrations_lock:
+        future = _migrations.get(key)
+        if future is not None and not future.done():
+            return
+        _migrations[key] = _migration_executor.submit(fn)
+
+
+def _read_document_vectors(document_id: str, index, start: int, stop: int) -> np.ndarray:
+    """Exact vectors for chunk ids [start, stop), from the vector store when available."""
+    vector_store = _get_vector_store(document_id)
+    if len(vector_store) >= stop:
+        return vector_store.read_range(start, stop)
+    return index.reconstruct_n(start, stop - start)
+
+
+def _maybe_schedule_migration(document_id: str):
+    """Rebuild a document's index in the background if the policy picks a new type."""
+    index, _ = _load_or_create_index(document_id)
+    spec = choose_index_spec(index.ntotal)
+    if spec != describe_spec(index):
+        with _document_locks_guard:
+            epoch = _document_epochs.get(document_id, 0)
+        _schedule_migration(document_id, lambda: _migrate_document_index(document_id, spec, epoch))
+
+
+def _migrate_document_index(document_id: str, spec, epoch: int):
+    """Build a new index for `spec` off-lock, then catch up and swap it in atomically."""
+    lock = _get_document_lock(document_id)
+    with lock:
+        index, _ = _load_or_create_index(document_id)
+        snapshot = index.ntotal
+        vectors = _read_document_vectors(document_id, index, 0, snapshot)
+
+    new_index = build_index(spec, vectors, EMBED_DIM)
+
+    with lock:
+        if _document_epochs.get(document_id, 0) != epoch:
+            return  # deleted or regenerated meanwhile
+        index, chunk_store = _load_or_create_index(document_id)
+        if index.ntotal > snapshot:
+            new_index.add(_read_document_vectors(document_id, index, snapshot, index.ntotal))
+        # Swap on disk (atomic rename + log reset), then in memory
+        _save_index(document_id, new_index)
+        _index_cache.put(document_id, (new_index, chunk_store), _estimate_entry_bytes(new_index, chunk_store))
+    print(f"✓ Migrated index for document {document_id} to {'/'.join(spec)} ({new_index.ntotal} vectors)")
+
+
+def _maybe_schedule_global_migration():
+    """Rebuild the global index in the background if the policy picks a new type."""
+    with _global_lock:
+        index = _load_global_index()
+        spec = choose_index_spec(index.ntotal, supports_removal=True)
+        if spec == describe_spec(index):
+            return
+    _schedule_migration("_global", lambda: _migrate_global_index(spec))
+
+
+def _migrate_global_index(spec):
+    """Rebuild the global index from per-document vectors, replaying concurrent changes."""
+    global _global_index, _global_pending_ops
+    with _global_lock:
+        _load_global_index()
+        _global_pending_ops = []
+        documents = dict(_global_registry["documents"])
+
+    id_parts, vector_parts = [], []
+    for doc_id, seq in documents.items():
+        with _get_document_lock(doc_id):
+            doc_index, _ = _load_or_create_index(doc_id)
+            count = doc_index.ntotal
+            if count:
+                vector_parts.append(_read_document_vectors(doc_id, doc_index, 0, count))
+                id_parts.append(_global_ids(seq, 0, count))
+    vectors = np.vstack(vector_parts) if vector_parts else np.empty((0, EMBED_DIM), dtype=np.float32)
+    ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=np.int64)
+
+    new_index = build_id_index(spec, vectors, ids, EMBED_DIM)
+
+    with _global_lock:
+        # Adds are replayed as remove-then-add, so overlap with the snapshot is harmless
+        for op in _global_pending_ops:
+            if op[0] == "add":
+                _, op_ids, op_vectors = op
+                new_index.remove_ids(faiss.IDSelectorBatch(op_ids))
+                new_index.add_with_ids(op_vectors, op_ids)
+            else:
+                _, start, end = op
+                new_index.remove_ids(faiss.IDSelectorRange(start, end))
+        _global_pending_ops = None
+        _global_index = new_index
+        _compact_global_index()
+    print(f"✓ Migrated global index to {'/'.join(spec)} ({new_index.ntotal} vectors)")
+
+
+def wait_for_index_migrations():
+    """Block until scheduled background index migrations finish (for tests/shutdown)."""
+    with _migrations_lock:
+        futures = list(_migrations.values())
+    for future in futures:
+        future.result()
 
 
 # --------------------------
 # Create embedding
 # --------------------------
 def create_embedding(text: str) -> np.ndarray:
-    """Generate embedding vector using Gemini API."""
-    result = genai.embed_content(model=EMBED_MODEL, content=text)
+    """Generate embedding vector using Gemini API (with the shared client's deadline, retries and hedging)."""
+    result = gemini_client.client.embed(EMBED_MODEL, text)
     return np.array(result["embedding"], dtype=np.float32)
 
 
+def embed_query(question: str) -> np.ndarray:
+    """
+    Embedding of a search question, served from the query cache when the
+    same (normalized) question was asked recently. Concurrent requests for
+    the same question wait for one lookup (and embedding call) instead of
+    each calling the API.
+    """
+    return _query_flight.do(
+        normalize_question(question),
+        lambda: _query_cache.get_or_embed(question, lambda text: create_embedding(text)),
+        QUERY_COALESCE_TIMEOUT_S,
+    )
+
+
 def create_embeddings(texts: list) -> list:
     """Generate embeddings for a list of texts in a single call (batch).
 
@@ -87,8 +661,9 @@ def create_embeddings(texts: list) -> list:
     """
     if not texts:
         return []
-    # Attempt to use batch embedding API by passing list to content
-    result = genai.embed_content(model=EMBED_MODEL, content=texts)
+    # Attempt to use batch embedding API by passing list to content.
+    # The ingestion pipeline paces and retries batches itself.
+    result = gemini_client.client.embed(EMBED_MODEL, texts, retries=0, hedge=False)
     embeddings_out = []
     # Result may be a single embedding or a list depending on SDK; handle both
     if isinstance(result, dict) and "embedding" in result:
@@ -106,33 +681,276 @@ def create_embeddings(texts: list) -> list:
 # --------------------------
 # Add chunks to a document's index
 # --------------------------
-def add_chunks_to_index(document_id: str, chunks):
-    """Add text chunks to a specific document's FAISS index."""
-    index, id_to_chunk = _load_or_create_index(document_id)
-    # Batch embeddings to reduce API calls and speed up processing
-    batch_size = 16
-    total = len(chunks)
-    added = 0
-    for i in range(0, total, batch_size):
-        batch = chunks[i : i + batch_size]
-        vecs = create_embeddings(batch)
-        if not vecs:
-            continue
-        arr = np.vstack(vecs).astype(np.float32)
+def _append_chunks(document_id: str, texts, arr: np.ndarray) -> int:
+    """Store one batch of chunk texts and their vectors; returns the first chunk id."""
+    if GLOBAL_INDEX_ENABLED:
+        # Loaded (and reconciled) before this commit, so the batch is added exactly once
+        _load_global_index()
+    lock = _get_document_lock(document_id)
+    with lock:
+        # Re-fetch: the entry may have been evicted or swapped by a migration
+        index, chunk_store = _load_or_create_index(document_id)
+        # Chunk ids line up with vector ids in the index. Text is written
+        # first; the log record is the commit point for the batch.
+        start_id = chunk_store.append(texts)
+        _get_vector_store(document_id).append(arr)
+        _get_document_log(document_id).append_add(arr, start_id)
         index.add(arr)
-        # Map new ids to chunks
-        start_id = index.ntotal - arr.shape[0]
-        for offset, chunk_text in enumerate(batch):
-            id_to_chunk[start_id + offset] = chunk_text
+    if GLOBAL_INDEX_ENABLED:
+        _global_add(document_id, start_id, arr)
+    return start_id
+
+
+def _finish_appends(document_id: str, added: int):
+    """Compact and re-account a document after appends, and schedule migrations."""
+    index_path = _get_index_paths(document_id)[0]
+    with _get_document_lock(document_id):
+        index, chunk_store = _load_or_create_index(document_id)
+        if _needs_compaction(_get_document_log(document_id), index_path):
+            _save_index(document_id, index)
+        # Re-account the grown entry so the cache budget stays accurate
+        _index_cache.put(document_id, (index, chunk_store), _estimate_entry_bytes(index, chunk_store))
+    # Answers drawn from the document before these chunks are stale
+    _answer_cache.invalidate_document(document_id)
+    if added:
+        _maybe_schedule_migration(document_id)
+        if GLOBAL_INDEX_ENABLED:
+            _maybe_compact_global_index()
+            _maybe_schedule_global_migration()
+
+
+def _stored_bytes_per_chunk(document_id: str) -> int:
+    """Bytes one more chunk costs in the document index, vector store and global index (text excluded)."""
+    index, _ = _load_or_create_index(document_id)
+    index_bytes = index_memory_bytes(index) // index.ntotal if index.ntotal else EMBED_DIM * 4
+    nbytes = index_bytes + EMBED_DIM * 4 + 8  # codes, full-precision vector, text offset
+    if GLOBAL_INDEX_ENABLED:
+        nbytes += EMBED_DIM * 4 + 8
+    return nbytes
+
+
+def add_chunks_to_index(document_id: str, chunks, progress=None, corpus: str = None):
+    """
+    Add text chunks to a specific document's FAISS index.
+    chunks may be a list or a generator (streamed ingestion); it is read once.
+    progress, if given, is called as progress(chunks_done, total) after each
+    batch, with total None for generators.
+    With CHUNK_DEDUP on, near-duplicates of chunks already in the document
+    or in corpus (e.g. a device id) are skipped. Returns
+    {"chunks_added", "duplicates_skipped", "api_calls_saved", "index_bytes_saved"};
+    api_calls_saved assumes EMBED_BATCH_SIZE chunks per call.
+    """
+    if GLOBAL_INDEX_ENABLED:
+        # Load (or migrate) the global index before this document changes
+        _load_global_index()
+    index_path = _get_index_paths(document_id)[0]
+    with _get_document_lock(document_id):
+        index, chunk_store = _load_or_create_index(document_id)
+        if not os.path.exists(index_path):
+            # Write an (empty) base so the document is discoverable on disk
+            _save_index(document_id, index)
+        first_chunk_id = len(chunk_store)
+    total = len(chunks) if hasattr(chunks, "__len__") else None
+    dedup = None
+    if CHUNK_DEDUP:
+        dedup = ChunkDeduplicator(_chunk_fingerprints, corpus or "", document_id, first_chunk_id)
+        chunks = dedup.filter(chunks)
+    # Batches are embedded concurrently but arrive here in chunk order
+    added = 0
+    for batch, arr in _embedding_pipeline.embed(chunks, create_embeddings, _embedding_cache):
+        _append_chunks(document_id, batch, arr)
         added += arr.shape[0]
+        if progress is not None:
+            done = added + (dedup.skipped if dedup is not None else 0)
+            progress(min(done, total) if total is not None else done, total)
+    _finish_appends(document_id, added)
 
-    _save_index(document_id, index, id_to_chunk)
+    result = {"chunks_added": added, "duplicates_skipped": 0, "api_calls_saved": 0, "index_bytes_saved": 0}
+    if dedup is not None:
+        dedup.commit()
+        if dedup.skipped:
+            result["duplicates_skipped"] = dedup.skipped
+            result["api_calls_saved"] = -(-dedup.skipped // max(1, EMBED_BATCH_SIZE))
+            result["index_bytes_saved"] = (
+                dedup.skipped * _stored_bytes_per_chunk(document_id) + dedup.skipped_text_bytes
+            )
+            print(f"✓ Skipped {dedup.skipped} near-duplicate chunks in document {document_id}")
     print(f"✓ Added {added} chunks to document {document_id}")
+    return result
+
+
+def _adopt_pointed_chunks(document_id: str, orphans: dict):
+    """
+    Before a document is deleted, copy the chunks other documents point to
+    (their skipped near-duplicates) into those documents, with their vectors.
+    """
+    with _get_document_lock(document_id):
+        _, chunk_store = _load_or_create_index(document_id)
+        vector_store = _get_vector_store(document_id)
+        available = min(len(chunk_store), len(vector_store))
+        copies = {}
+        for referrer, entries in orphans.items():
+            entries = [entry for entry in entries if entry[0] < available]
+            ids = [chunk_id for chunk_id, _, _ in entries]
+            if ids:
+                copies[referrer] = (entries, chunk_store.get_many(ids), vector_store.get(ids))
+    # Appended outside this document's lock; referrers take their own locks
+    for referrer, (entries, texts, vectors) in copies.items():
+        start_id = _append_chunks(referrer, texts, np.ascontiguousarray(vectors, dtype=np.float32))
+        _finish_appends(referrer, len(texts))
+        for offset, (_, corpus, fingerprint) in enumerate(entries):
+            _chunk_fingerprints.add(corpus, referrer, [(start_id + offset, fingerprint)])
+        print(f"✓ Copied {len(texts)} shared chunks from {document_id} into {referrer}")
 
 
 # --------------------------
 # Search within a document or globally
 # --------------------------
+def _rerank(query_vec: np.ndarray, hits, k: int):
+    """
+    Re-rank (distance, document_id, local_id) candidates from a compressed
+    index by exact L2 distance against the full-precision vectors on disk.
+    """
+    exact = [distance for distance, _, _ in hits]
+    positions_by_doc = {}
+    for position, (_, doc_id, local_id) in enumerate(hits):
+        positions_by_doc.setdefault(doc_id, []).append(position)
+
+    for doc_id, positions in positions_by_doc.items():
+        vector_store = _get_vector_store(doc_id)
+        available = len(vector_store)
+        positions = [p for p in positions if hits[p][2] < available]
+        if not positions:
+            continue
+        vectors = vector_store.get([hits[p][2] for p in positions])
+        distances = ((vectors - query_vec) ** 2).sum(axis=1)
+        for position, distance in zip(positions, distances):
+            exact[position] = distance
+
+    order = sorted(range(len(hits)), key=lambda p: exact[p])[:k]
+    return [(exact[p], hits[p][1], hits[p][2]) for p in order]
+
+
+def _search_document(query_vec: np.ndarray, document_id: str, k: int):
+    """Search one document's index. Returns a list of (distance, document_id, chunk)."""
+    with _get_document_lock(document_id):
+        index, chunk_store = _load_or_create_index(document_id)
+        if index.ntotal == 0:
+            return []
+        compressed = describe_compression(index) != "none"
+        fetch_k = k * RERANK_FACTOR if compressed else k
+        D, I = index.search(np.array([query_vec]), min(fetch_k, index.ntotal))
+    hits = [(distance, document_id, int(idx)) for distance, idx in zip(D[0], I[0]) if idx >= 0]
+    if compressed:
+        hits = _rerank(query_vec, hits, k)
+    # Only the returned chunks are read from the memory-mapped store
+    results = [
+        (distance, doc_id, chunk_store[idx])
+        for distance, doc_id, idx in hits
+        if idx in chunk_store
+    ]
+    targets = _chunk_fingerprints.pointers(document_id)
+    if targets:
+        results.extend(_search_pointed_chunks(query_vec, document_id, targets))
+        results.sort(key=lambda hit: hit[0])
+        results = results[:k]
+    return results
+
+
+def _search_pointed_chunks(query_vec: np.ndarray, document_id: str, targets):
+    """
+    Score the chunks a document points to in other documents (its skipped
+    near-duplicates) exactly, attributed to the document itself.
+    """
+    ids_by_doc = {}
+    for target_doc, chunk_id in targets:
+        ids_by_doc.setdefault(target_doc, []).append(chunk_id)
+    hits = []
+    for target_doc, ids in ids_by_doc.items():
+        with _get_document_lock(target_doc):
+            _, chunk_store = _load_or_create_index(target_doc)
+            vector_store = _get_vector_store(target_doc)
+            ids = [i for i in ids if i < len(vector_store) and i in chunk_store]
+            if not ids:
+                continue
+            distances = ((vector_store.get(ids) - query_vec) ** 2).sum(axis=1)
+            hits.extend(zip(distances, [document_id] * len(ids), chunk_store.get_many(ids)))
+    return hits
+
+
+def _read_chunk_texts(document_id: str, chunk_ids) -> dict:
+    """
+    {chunk id: text} read straight from a document's chunk store, without
+    loading its index: the cached store when the document is resident,
+    else its files mapped just for this read.
+    """
+    with _get_document_lock(document_id):
+        cached = _index_cache.peek(document_id)
+        if cached is None and os.path.exists(_get_legacy_id_map_path(document_id)):
+            cached = _load_or_create_index(document_id)  # migrates the pickled id map
+        if cached is not None:
+            chunk_store = cached[1]
+            return {i: chunk_store[i] for i in chunk_ids if i in chunk_store}
+        _, chunks_path, offsets_path, _, _ = _get_index_paths(document_id)
+        chunk_store = ChunkStore(chunks_path, offsets_path)
+        try:
+            return {i: chunk_store[i] for i in chunk_ids if i in chunk_store}
+        finally:
+            chunk_store.close()
+
+
+def search_vector(query_vec: np.ndarray, document_ids=None, top_k=5, per_document_k=None):
+    """
+    Search for similar chunks using a precomputed query embedding.
+
+    Args:
+        query_vec: Query embedding (e.g. from create_embedding)
+        document_ids: Documents to search. If None or empty, search across
+                    all documents (global search)
+        top_k: Maximum number of merged results to return (None for no limit)
+        per_document_k: Results taken from each listed document before
+                    merging (defaults to top_k)
+
+    Returns:
+        List of {"document_id", "chunk", "score"} dicts sorted by L2 distance
+        (lower score is more similar)
+    """
+    query_vec = np.asarray(query_vec, dtype=np.float32)
+    limit = top_k if top_k is not None else (per_document_k or 5)
+    hits = []
+
+    if document_ids:
+        # Document-specific search, merged across the requested documents
+        k = per_document_k or limit
+        for doc_id in document_ids:
+            hits.extend(_search_document(query_vec, doc_id, k))
+    elif GLOBAL_INDEX_ENABLED:
+        # Global search: one query against the consolidated index
+        global_hits = _global_search(query_vec, limit)
+        ids_by_doc = {}
+        for _, doc_id, local_id in global_hits:
+            ids_by_doc.setdefault(doc_id, []).append(local_id)
+        texts = {doc_id: _read_chunk_texts(doc_id, ids) for doc_id, ids in ids_by_doc.items()}
+        for distance, doc_id, local_id in global_hits:
+            if local_id in texts[doc_id]:
+                hits.append((distance, doc_id, texts[doc_id][local_id]))
+    else:
+        # Global search across all documents (per-document scan)
+        for index_file in os.listdir(INDICES_DIR):
+            if index_file.endswith(".index"):
+                doc_id = index_file.replace(".index", "")
+                hits.extend(_search_document(query_vec, doc_id, limit))
+
+    # Sort by distance and return top k
+    hits.sort(key=lambda x: x[0])
+    if top_k is not None:
+        hits = hits[:top_k]
+    return [
+        {"document_id": doc_id, "chunk": chunk, "score": float(distance)}
+        for distance, doc_id, chunk in hits
+    ]
+
+
 def search(query: str, document_id: str = None, top_k=5):
     """
     Search for similar chunks.
@@ -150,70 +968,96 @@ def search(query: str, document_id: str = None, top_k=5):
     max_k = 5
     k = min(top_k, max_k)
 
-    query_vec = create_embedding(query)
-
-    if document_id:
-        # Document-specific search
-        index, id_to_chunk = _load_or_create_index(document_id)
-        if index.ntotal == 0:
-            return []
-
-        k = min(k, index.ntotal)
-        D, I = index.search(np.array([query_vec]), k)
-        results = [id_to_chunk[i] for i in I[0] if i in id_to_chunk]
-        return results
-    else:
-        # Global search across all documents
-        all_results = []
-        
-        # Iterate through all documents
-        for index_file in os.listdir(INDICES_DIR):
-            if index_file.endswith(".index"):
-                doc_id = index_file.replace(".index", "")
-                index, id_to_chunk = _load_or_create_index(doc_id)
-                
-                if index.ntotal == 0:
-                    continue
-
-                search_k = min(k, index.ntotal)
-                D, I = index.search(np.array([query_vec]), search_k)
-                
-                for distance, idx in zip(D[0], I[0]):
-                    if idx in id_to_chunk:
-                        all_results.append((distance, id_to_chunk[idx]))
-
-        # Sort by distance and return top k
-        all_results.sort(key=lambda x: x[0])
-        return [chunk for _, chunk in all_results[:k]]
+    query_vec = embed_query(query)
+    document_ids = [document_id] if document_id else None
+    return [hit["chunk"] for hit in search_vector(query_vec, document_ids, top_k=k)]
 
 
 # --------------------------
 # Delete document index
 # --------------------------
 def delete_index(document_id: str):
-    """Remove a document's FAISS index and ID map."""
-    index_path, id_map_path = _get_index_paths(document_id)
-    
-    if os.path.exists(index_path):
-        os.remove(index_path)
-    if os.path.exists(id_map_path):
-        os.remove(id_map_path)
-    
-    if document_id in _index_cache:
-        del _index_cache[document_id]
+    """Remove a document's FAISS index and chunk store."""
+    orphans = _chunk_fingerprints.remove_document(document_id)
+    if orphans:
+        _adopt_pointed_chunks(document_id, orphans)
+    with _get_document_lock(document_id):
+        with _document_locks_guard:
+            # Invalidate any in-flight background rebuild of this document
+            _document_epochs[document_id] = _document_epochs.get(document_id, 0) + 1
+        cached = _index_cache.pop(document_id)
+        if cached is not None:
+            cached[1].close()
+
+        for path in (*_get_index_paths(document_id), _get_legacy_id_map_path(document_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    if GLOBAL_INDEX_ENABLED:
+        _global_remove(document_id)
+    _answer_cache.invalidate_document(document_id)
     
     print(f"✓ Deleted index for document {document_id}")
 
 
+# --------------------------
+# Semantic answer cache
+# --------------------------
+def lookup_answer(query_vec: np.ndarray, document_ids=None):
+    """
+    Cached {"answer", "source_chunks", "similarity"} for a question near
+    query_vec over the same documents (None = all documents), or None.
+    """
+    if ANSWER_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return _answer_cache.lookup(query_vec, document_ids)
+
+
+def store_answer(query_vec: np.ndarray, document_ids, answer: str, source_chunks, generation_s: float, asked_at: float):
+    """
+    Cache a generated answer. generation_s is what a later hit saves;
+    asked_at (time.monotonic() before retrieval) keeps answers drawn from
+    documents that changed in the meantime out of the cache.
+    """
+    if ANSWER_CACHE_MAX_ENTRIES > 0:
+        _answer_cache.store(query_vec, document_ids, answer, source_chunks, generation_s, asked_at)
+
+
+# --------------------------
+# Index cache control
+# --------------------------
+def set_pinned_documents(document_ids):
+    """Pin documents (e.g. the active one) so they are never evicted from the cache."""
+    _index_cache.set_pinned(document_ids)
+
+
+def get_cache_stats():
+    """Get hit/miss/eviction counters and memory usage of the index cache."""
+    return _index_cache.stats()
+
+
+def get_embedding_stats():
+    """Get pipeline request/retry counters, embedding, query and answer cache hit rates and dedup counters."""
+    stats = _embedding_pipeline.stats()
+    stats["cache"] = _embedding_cache.stats() if _embedding_cache is not None else None
+    stats["query_cache"] = _query_cache.stats()
+    stats["query_coalescing"] = _query_flight.stats()
+    stats["answer_cache"] = {"enabled": ANSWER_CACHE_MAX_ENTRIES > 0, **_answer_cache.stats()}
+    stats["dedup"] = {"enabled": CHUNK_DEDUP, **_chunk_fingerprints.stats()}
+    return stats
+
+
 # --------------------------
 # Get document statistics
 # --------------------------
 def get_index_stats(document_id: str):
     """Get statistics about a document's index."""
-    index, id_to_chunk = _load_or_create_index(document_id)
+    index, _ = _load_or_create_index(document_id)
     return {
         "chunk_count": index.ntotal,
         "embedding_dimension": index.d,
+        "index_type": describe_index(index),
+        "compression": describe_compression(index),
     }
 
 
@@ -223,8 +1067,17 @@ def get_index_stats(document_id: str):
 def reset_all_indices():
     """Delete all document indices. Use with caution."""
     import shutil
+    global _global_index, _global_registry, _global_pending_ops
     
+    wait_for_index_migrations()
     _index_cache.clear()
+    _chunk_fingerprints.clear()
+    _answer_cache.clear()
+    with _global_lock:
+        _global_index = None
+        _global_registry = None
+        _global_pending_ops = None
+        _global_seq_to_doc.clear()
     
     if os.path.exists(INDICES_DIR):
         shutil.rmtree(INDICES_DIR)
@@ -0,0 +1,253 @@
+"""
+Text-extraction engines, registered per file type in order of preference.
+Faster optional backends (pypdfium2 or PyMuPDF for PDFs, a streaming lxml
+reader for DOCX) are used when installed; otherwise extraction falls back
+to PyPDF2 and python-docx. PDF_ENGINE / DOCX_ENGINE pin an engine by name
+("auto", the default, picks the first available one).
+"""
+
+import importlib
+import importlib.util
+import os
+import zipfile
+
+# --------------------------
+# Configuration
+# --------------------------
+PDF_ENGINE = os.getenv("PDF_ENGINE", "auto")
+DOCX_ENGINE = os.getenv("DOCX_ENGINE", "auto")
+
+_WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class Extractor:
+    """
+    An extraction engine. `modules` are alternative import names for the
+    library it needs (the first installed one is imported on first use).
+    """
+
+    name = ""
+    modules = ()
+
+    def __init__(self):
+        self._lib = None
+
+    def available(self) -> bool:
+        return not self.modules or any(importlib.util.find_spec(m) is not None for m in self.modules)
+
+    @property
+    def lib(self):
+        if self._lib is None and self.modules:
+            module = next(m for m in self.modules if importlib.util.find_spec(m) is not None)
+            self._lib = importlib.import_module(module)
+        return self._lib
+
+
+# --------------------------
+# PDF engines: open(), page_count(doc), page_text(doc, i), close(doc)
+# --------------------------
+class PdfExtractor(Extractor):
+    def open(self, file_path: str):
+        raise NotImplementedError
+
+    def page_count(self, doc) -> int:
+        return len(doc)
+
+    def page_text(self, doc, page_no: int) -> str:
+        raise NotImplementedError
+
+    def close(self, doc):
+        pass
+
+
+class PdfiumExtractor(PdfExtractor):
+    """pypdfium2: bindings to Chrome's PDFium, typically the fastest."""
+
+    name = "pypdfium2"
+    modules = ("pypdfium2",)
+
+    def open(self, file_path: str):
+        return self.lib.PdfDocument(file_path)
+
+    def page_text(self, doc, page_no: int) -> str:
+        page = doc[page_no]
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range()
+        finally:
+            textpage.close()
+            page.close()
+
+    def close(self, doc):
+        doc.close()
+
+
+class PyMuPDFExtractor(PdfExtractor):
+    name = "pymupdf"
+    modules = ("pymupdf", "fitz")
+
+    def open(self, file_path: str):
+        return self.lib.open(file_path)
+
+    def page_count(self, doc) -> int:
+        return doc.page_count
+
+    def page_text(self, doc, page_no: int) -> str:
+        return doc[page_no].get_text()
+
+    def close(self, doc):
+        doc.close()
+
+
+class PyPDF2Extractor(PdfExtractor):
+    """Pure Python; always installed (see requirements.txt)."""
+
+    name = "pypdf2"
+    modules = ("PyPDF2",)
+
+    def open(self, file_path: str):
+        return self.lib.PdfReader(file_path)
+
+    def page_count(self, doc) -> int:
+        return len(doc.pages)
+
+    def page_text(self, doc, page_no: int) -> str:
+        return doc.pages[page_no].extract_text() or ""
+
+
+# --------------------------
+# Line engines (DOCX, TXT): iter_lines(file_path)
+# --------------------------
+class LxmlDocxExtractor(Extractor):
+    """
+    Streams word/document.xml with lxml.iterparse, yielding each paragraph
+    (body and table cells, in document order) and freeing it once read, so
+    memory stays flat instead of building python-docx's object model.
+    """
+
+    name = "lxml"
+    modules = ("lxml.etree",)
+
+    def iter_lines(self, file_path: str):
+        with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as xml:
+            for _, element in self.lib.iterparse(xml, events=("end",), tag=f"{_WORD_NS}p"):
+                yield "".join(self._runs(element))
+                # Nested paragraphs (text boxes) were already yielded and cleared
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+    @staticmethod
+    def _runs(paragraph):
+        for node in paragraph.iter(f"{_WORD_NS}t", f"{_WORD_NS}tab", f"{_WORD_NS}br", f"{_WORD_NS}cr"):
+            if node.tag == f"{_WORD_NS}t":
+                yield node.text or ""
+            elif node.tag == f"{_WORD_NS}tab":
+                yield "\t"
+            else:
+                yield "\n"
+
+
+class PythonDocxExtractor(Extractor):
+    name = "python-docx"
+    modules = ("docx",)
+
+    def iter_lines(self, file_path: str):
+        doc = self.lib.Document(file_path)
+        for para in doc.paragraphs:
+            yield para.text
+        for table in doc.tables:
+            for row in table.rows:
+                for cell in row.cells:
+                    for paragraph in cell.paragraphs:
+                        yield paragraph.text
+
+
+class TxtExtractor(Extractor):
+    name = "text"
+
+    def iter_lines(self, file_path: str):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+
+# --------------------------
+# Registry
+# --------------------------
+EXTRACTORS = {
+    ".pdf": [PdfiumExtractor(), PyMuPDFExtractor(), PyPDF2Extractor()],
+    ".docx": [LxmlDocxExtractor(), PythonDocxExtractor()],
+    ".txt": [TxtExtractor()],
+}
+_PREFERRED = {".pdf": lambda: PDF_ENGINE, ".docx": lambda: DOCX_ENGINE}
+
+
+def file_type(filename: str) -> str:
+    """The registry key (".pdf", ".docx", ".txt") for a filename."""
+    for suffix in EXTRACTORS:
+        if filename.endswith(suffix):
+            return suffix
+    raise ValueError(f"Unsupported file type: {filename}")
+
+
+def available_extractors(kind: str) -> list:
+    """Installed engines for a file type, in order of preference."""
+    return [extractor for extractor in EXTRACTORS[kind] if extractor.available()]
+
+
+def get_extractor(kind: str, name: str = None) -> Extractor:
+    """
+    The engine to use for a file type: `name` (or the PDF_ENGINE /
+    DOCX_ENGINE setting) if it is installed, else the first available one.
+    """
+    installed = available_extractors(kind)
+    if not installed:
+        raise ValueError(f"No text extractor installed for {kind} files")
+    name = name or _PREFERRED.get(kind, lambda: "auto")()
+    if name != "auto":
+        for extractor in installed:
+            if extractor.name == name:
+                return extractor
+        print(f"Warning: {kind} extractor {name!r} is not installed; using {installed[0].name}")
+    return installed[0]
+
+
+def candidate_extractors(kind: str, name: str = None) -> list:
+    """The selected engine followed by the other installed ones (fallback order)."""
+    first = get_extractor(kind, name)
+    return [first] + [extractor for extractor in available_extractors(kind) if extractor is not first]
+
+
+def open_pdf(file_path: str, name: str = None):
+    """Open a PDF with the first engine that can read it; returns (extractor, doc)."""
+    candidates = candidate_extractors(".pdf", name)
+    for i, extractor in enumerate(candidates):
+        try:
+            return extractor, extractor.open(file_path)
+        except Exception as e:
+            if i == len(candidates) - 1:
+                raise
+            print(f"Warning: {extractor.name} could not open {file_path} ({e}); trying {candidates[i + 1].name}")
+
+
+def iter_lines(file_path: str, kind: str, name: str = None, on_engine=None):
+    """
+    Yield the lines of a DOCX or TXT file. An engine that fails before
+    producing any text is replaced by the next installed one.
+    on_engine, if given, is called with the name of the engine that read the file.
+    """
+    candidates = candidate_extractors(kind, name)
+    for i, extractor in enumerate(candidates):
+        produced = False
+        try:
+            for line in extractor.iter_lines(file_path):
+                produced = True
+                yield line
+            if on_engine is not None:
+                on_engine(extractor.name)
+            return
+        except Exception as e:
+            if produced or i == len(candidates) - 1:
+                raise
+            print(f"Warning: {extractor.name} could not read {file_path} ({e}); trying {candidates[i + 1].name}")
@@ -0,0 +1,465 @@
+"""
+Shared Gemini client layer for generation and embeddings.
+Model handles are created once per model name and reused. Every call gets
+a deadline (passed to the API as its request timeout), is retried with
+jittered exponential backoff on transient errors (429/500/503/deadline)
+while the deadline allows, and can be hedged: if a call has not returned
+after GEMINI_HEDGE_AFTER_S, an identical backup call is sent and the first
+success wins. A circuit breaker opens after GEMINI_BREAKER_FAILURES
+consecutive upstream failures (rate limits do not count: a throttling
+upstream is up) and fails calls fast with GeminiUnavailable
+(a 503) until GEMINI_BREAKER_RESET_S has passed and a trial call succeeds.
+At most GEMINI_MAX_CONCURRENCY calls run at once (separately for threads
+and for the event loop); callers wait for a slot until their deadline.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+from .embedding_pipeline import RATE_LIMIT_ERRORS, RETRYABLE_ERRORS
+
+load_dotenv()
+genai.configure(api_key=os.getenv("GEN_API_KEY"))
+
+GEMINI_GENERATE_TIMEOUT_S = float(os.getenv("GEMINI_GENERATE_TIMEOUT_S", "60"))
+GEMINI_EMBED_TIMEOUT_S = float(os.getenv("GEMINI_EMBED_TIMEOUT_S", "20"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+GEMINI_BACKOFF_BASE_S = float(os.getenv("GEMINI_BACKOFF_BASE_S", "0.5"))
+GEMINI_BACKOFF_MAX_S = float(os.getenv("GEMINI_BACKOFF_MAX_S", "8"))
+# 0 disables hedging
+GEMINI_HEDGE_AFTER_S = float(os.getenv("GEMINI_HEDGE_AFTER_S", "0"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_RESET_S = float(os.getenv("GEMINI_BREAKER_RESET_S", "30"))
+
+
+class GeminiUnavailable(google_exceptions.ServiceUnavailable):
+    """Raised without calling Gemini: the circuit is open, or no call slot freed up before the deadline."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open ->
+    half-open after `reset_timeout_s`, letting one trial call through; the
+    trial's success closes the circuit and its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout_s: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def release(self):
+        """A call ended without an outcome (e.g. cancelled); let another trial through."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+def _deadline_exceeded() -> google_exceptions.DeadlineExceeded:
+    return google_exceptions.DeadlineExceeded("Gemini call deadline exceeded")
+
+
+class GeminiClient:
+    """Pooled Gemini model handles behind deadlines, retries, hedging, a circuit breaker and a concurrency limit."""
+
+    def __init__(
+        self,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        backoff_base_s: float = GEMINI_BACKOFF_BASE_S,
+        backoff_max_s: float = GEMINI_BACKOFF_MAX_S,
+        hedge_after_s: float = GEMINI_HEDGE_AFTER_S,
+        breaker: CircuitBreaker = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge_after_s = hedge_after_s
+        self.breaker = breaker or CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_RESET_S)
+        self._models = {}  # {model name: genai.GenerativeModel}
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_slots = weakref.WeakKeyDictionary()  # {event loop: asyncio.Semaphore}
+        self._hedge_executor = None  # created on first hedged call
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.overloaded = 0
+
+    # --------------------------
+    # Model handles and counters
+    # --------------------------
+    def model(self, name: str):
+        """The long-lived handle for a generative model (created on first use)."""
+        with self._lock:
+            handle = self._models.get(name)
+            if handle is None:
+                handle = self._models[name] = genai.GenerativeModel(name)
+            return handle
+
+    def _count(self, counter: str, n: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent callers from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2**attempt))
+
+    def _retry_delay(self, error: Exception, attempt: int, retries: int, deadline: float):
+        """Backoff before the next attempt, or None when the error is final."""
+        if isinstance(error, GeminiUnavailable) or attempt >= retries:
+            return None
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            return None
+        self._count("retries")
+        print(f"Warning: Gemini call failed ({error}); retrying in {delay:.1f}s")
+        return delay
+
+    def _admit(self):
+        if not self.breaker.allow():
+            raise GeminiUnavailable("Gemini circuit breaker is open; failing fast")
+
+    def _settle(self, error: BaseException = None):
+        """Report an attempt's outcome to the circuit breaker."""
+        if error is None:
+            self.breaker.record_success()
+        elif isinstance(error, RATE_LIMIT_ERRORS):
+            # Throttled (e.g. by an ingestion burst), not down
+            self._count("rate_limited")
+            self.breaker.record_success()
+        elif isinstance(error, RETRYABLE_ERRORS + (asyncio.TimeoutError,)):
+            self._count("failures")
+            self.breaker.record_failure()
+        elif isinstance(error, Exception):
+            # The upstream answered (e.g. invalid argument): it is up
+            self.breaker.record_success()
+        else:
+            self.breaker.release()
+
+    # --------------------------
+    # Blocking calls (threads)
+    # --------------------------
+    def generate(self, model: str, prompt, timeout: float = GEMINI_GENERATE_TIMEOUT_S, hedge: bool = True) -> str:
+        """Text of a generate_content call."""
+        return self._call(
+            lambda remaining: self.model(model).generate_content(prompt, request_options={"timeout": remaining}).text,
+            timeout,
+            hedge=hedge,
+        )
+
+    def embed(
+        self, model: str, content, timeout: float = GEMINI_EMBED_TIMEOUT_S, retries: int = None, hedge: bool = True
+    ):
+        """Raw embed_content result; retries=0 leaves retrying to the caller (e.g. the ingestion pipeline)."""
+        return self._call(
+            lambda remaining: genai.embed_content(model=model, content=content, request_options={"timeout": remaining}),
+            timeout,
+            retries=retries,
+            hedge=hedge,
+        )
+
+    def _call(self, fn, timeout: float, retries: int = None, hedge: bool = True):
+        self._count("calls")
+        deadline = time.monotonic() + timeout
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(fn, deadline, hedge)
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(e, attempt, retries, deadline)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    def _acquire_slot(self, deadline: float):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._count("overloaded")
+            raise GeminiUnavailable(f"All {self.max_concurrency} Gemini call slots are busy")
+
+    def _attempt(self, fn, deadline: float, hedge: bool):
+        self._acquire_slot(deadline)
+        slot_held = True
+        try:
+            self._admit()
+            error = None
+            try:
+                self._count("attempts")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise _deadline_exceeded()
+                if hedge and self.hedge_after_s > 0:
+                    primary = self._hedge_pool().submit(fn, remaining)
+                    # The primary keeps its slot until it finishes, even after a backup wins
+                    slot_held = False
+                    primary.add_done_callback(lambda _: self._slots.release())
+                    return self._hedged(fn, primary, deadline)
+                return fn(remaining)
+            except BaseException as e:
+                error = e
+                if isinstance(e, google_exceptions.DeadlineExceeded):
+                    self._count("timeouts")
+                raise
+            finally:
+                self._settle(error)
+        finally:
+            if slot_held:
+                self._slots.release()
+
+    def _hedge_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=2 * self.max_concurrency, thread_name_prefix="gemini-hedge"
+                )
+            return self._hedge_executor
+
+    def _hedged(self, fn, primary, deadline: float):
+        """Wait for primary; if it is still running after hedge_after_s, race a backup call (if a slot is free)."""
+        pending = {primary}
+        done, _ = wait(pending, timeout=min(self.hedge_after_s, max(0.0, deadline - time.monotonic())))
+        if not done and self._slots.acquire(blocking=False):
+            self._count("hedges")
+            backup = self._hedge_pool().submit(fn, deadline - time.monotonic())
+            backup.add_done_callback(lambda _: self._slots.release())
+            pending.add(backup)
+        else:
+            backup = None
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise _deadline_exceeded()  # the losers finish in the background
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count("hedge_wins")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    # --------------------------
+    # Async calls (event loop)
+    # --------------------------
+    async def generate_async(
+        self, model: str, prompt, timeout: float = GEMINI_GENERATE_TIMEOUT_S, hedge: bool = True
+    ) -> str:
+        """Text of a generate_content_async call; no thread is held while waiting."""
+
+        async def call(remaining):
+            response = await self.model(model).generate_content_async(prompt, request_options={"timeout": remaining})
+            return response.text
+
+        self._count("calls")
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt_async(call, deadline, hedge)
+            except RETRYABLE_ERRORS as e:
+                delay = self._retry_delay(e, attempt, self.max_retries, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def stream_async(self, model: str, prompt, timeout: float = GEMINI_GENERATE_TIMEOUT_S):
+        """
+        Yield answer text as Gemini streams it. timeout bounds the wait for
+        each next chunk; failures are retried only before any text was
+        yielded, and streams are never hedged.
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            deadline = time.monotonic() + timeout
+            semaphore = await self._acquire_async_slot(deadline)
+            yielded = False
+            error = None
+            try:
+                self._admit()
+                try:
+                    self._count("attempts")
+                    response = await self._bounded(
+                        self.model(model).generate_content_async(
+                            prompt, stream=True, request_options={"timeout": timeout}
+                        ),
+                        deadline,
+                    )
+                    chunks = response.__aiter__()
+                    while True:
+                        try:
+                            chunk = await self._bounded(chunks.__anext__(), time.monotonic() + timeout)
+                        except StopAsyncIteration:
+                            return
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            continue  # a chunk without text (e.g. only finish metadata)
+                        if text:
+                            yielded = True
+                            yield text
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    self._settle(error)
+            except RETRYABLE_ERRORS as e:
+                delay = None if yielded else self._retry_delay(e, attempt, self.max_retries, deadline)
+                if delay is None:
+                    raise
+            finally:
+                semaphore.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _bounded(self, awaitable, deadline: float):
+        try:
+            return await asyncio.wait_for(awaitable, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            raise _deadline_exceeded() from None
+
+    async def _acquire_async_slot(self, deadline: float) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._async_slots.get(loop)
+            if semaphore is None:
+                semaphore = self._async_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._count("overloaded")
+            raise GeminiUnavailable(f"All {self.max_concurrency} Gemini call slots are busy") from None
+        return semaphore
+
+    async def _attempt_async(self, call, deadline: float, hedge: bool):
+        semaphore = await self._acquire_async_slot(deadline)
+        try:
+            self._admit()
+            error = None
+            try:
+                self._count("attempts")
+                primary = asyncio.ensure_future(call(deadline - time.monotonic()))
+                if not (hedge and self.hedge_after_s > 0):
+                    return await self._bounded(primary, deadline)
+                return await self._hedged_async(call, primary, semaphore, deadline)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._settle(error)
+        finally:
+            semaphore.release()
+
+    async def _hedged_async(self, call, primary: asyncio.Future, semaphore: asyncio.Semaphore, deadline: float):
+        done, _ = await asyncio.wait({primary}, timeout=min(self.hedge_after_s, max(0.0, deadline - time.monotonic())))
+        pending, backup = {primary}, None
+        if not done and not semaphore.locked():
+            await semaphore.acquire()  # free, so this does not wait
+            self._count("hedges")
+            backup = asyncio.ensure_future(call(deadline - time.monotonic()))
+            backup.add_done_callback(lambda _: semaphore.release())
+            pending.add(backup)
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self._count("timeouts")
+                    raise _deadline_exceeded()
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = {
+                "max_concurrency": self.max_concurrency,
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failures": self.failures,
+                "rate_limited": self.rate_limited,
+                "timeouts": self.timeouts,
+                "overloaded": self.overloaded,
+                "pooled_models": len(self._models),
+            }
+        counters["circuit"] = self.breaker.stats()
+        return counters
+
+
+# Shared by embeddings and the API, so the limits and the breaker are process wide
+client = GeminiClient()
@@ -0,0 +1,129 @@
+"""
+Memory-budgeted LRU cache for loaded per-document FAISS indices.
+Evicts least recently used documents once the byte budget is exceeded,
+never evicts pinned (active) documents, and keeps hit/miss/eviction counters.
+Entries dropped by eviction or clear() are closed (their chunk store's
+memory maps and file handles released) unless the document is pinned.
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class IndexCache:
+    """
+    LRU cache of {document_id: (index, chunk_store)} bounded by estimated bytes.
+    Pinned documents count toward the budget but are never evicted.
+    close(value), if given, releases a dropped entry's resources; pop()
+    leaves that to the caller, which owns the returned value.
+    """
+
+    def __init__(self, max_bytes: int, close=None):
+        self.max_bytes = max_bytes
+        self.close = close
+        self._entries = OrderedDict()  # {document_id: (value, nbytes)}
+        self._pinned = set()
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, document_id: str) -> bool:
+        with self._lock:
+            return document_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, document_id: str):
+        """Return the cached value (marking it recently used), or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(document_id)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, document_id: str):
+        """Return the cached value without marking it recently used or counting a lookup."""
+        with self._lock:
+            entry = self._entries.get(document_id)
+            return None if entry is None else entry[0]
+
+    def put(self, document_id: str, value, nbytes: int):
+        """Insert or resize an entry, then evict LRU entries to fit the budget."""
+        with self._lock:
+            old = self._entries.pop(document_id, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[document_id] = (value, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def pop(self, document_id: str):
+        """Remove an entry without counting it as an eviction."""
+        with self._lock:
+            entry = self._entries.pop(document_id, None)
+            if entry is None:
+                return None
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            for document_id, (value, _) in self._entries.items():
+                self._release(document_id, value)
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _release(self, document_id: str, value):
+        if self.close is not None and document_id not in self._pinned:
+            self.close(value)
+
+    def pin(self, document_id: str):
+        """Keep a document resident regardless of recency."""
+        with self._lock:
+            self._pinned.add(document_id)
+
+    def unpin(self, document_id: str):
+        with self._lock:
+            self._pinned.discard(document_id)
+            self._evict()
+
+    def set_pinned(self, document_ids):
+        """Replace the pinned set (e.g. when the active document changes)."""
+        with self._lock:
+            self._pinned = set(document_ids)
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used unpinned entries until under budget."""
+        if self.current_bytes <= self.max_bytes:
+            return
+        for document_id in list(self._entries):
+            if self.current_bytes <= self.max_bytes:
+                break
+            if document_id in self._pinned:
+                continue
+            value, nbytes = self._entries.pop(document_id)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+            self._release(document_id, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "pinned": sorted(self._pinned),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
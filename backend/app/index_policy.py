@@ -0,0 +1,217 @@
+"""
+Index selection policy for FAISS indices.
+Picks brute-force Flat, HNSW or IVF from the vector count and a search
+latency target, optionally with compressed vector codes (fp16, SQ8, PQ),
+and builds/tunes indices of the chosen type via FAISS index factories.
+"""
+
+import math
+import os
+
+import faiss
+import numpy as np
+
+# --------------------------
+# Configuration
+# --------------------------
+# Target latency for a single query against one index
+SEARCH_LATENCY_TARGET_MS = float(os.getenv("SEARCH_LATENCY_TARGET_MS", "20"))
+# Approximate brute-force cost per 768-dim vector (memory-bandwidth bound)
+FLAT_NS_PER_VECTOR = float(os.getenv("FLAT_NS_PER_VECTOR", "300"))
+# Never leave Flat below this many vectors (ANN training/graph cost dominates)
+FLAT_MIN_VECTORS = int(os.getenv("FLAT_MIN_VECTORS", "10000"))
+# Above this, HNSW graph memory gets too large; use IVF instead
+HNSW_MAX_VECTORS = int(os.getenv("HNSW_MAX_VECTORS", "2000000"))
+
+HNSW_M = 32
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# FAISS wants roughly 39+ training points per centroid
+IVF_MIN_POINTS_PER_LIST = 39
+
+# Vector compression: "none" (float32), "fp16", "sq8" or "pq"
+INDEX_COMPRESSION = os.getenv("INDEX_COMPRESSION", "none").lower()
+# Small indices are not worth compressing (or re-training) at all
+COMPRESSION_MIN_VECTORS = int(os.getenv("COMPRESSION_MIN_VECTORS", "1024"))
+# PQ needs enough vectors to train 256 centroids per sub-quantizer; below
+# this SQ8 is used instead
+PQ_MIN_VECTORS = int(os.getenv("PQ_MIN_VECTORS", "8192"))
+PQ_M = int(os.getenv("PQ_M", "96"))  # sub-quantizers (bytes per vector); must divide the dimension
+MAX_TRAIN_SAMPLE = 65536
+
+COMPRESSION_CODECS = {
+    "none": "Flat",
+    "fp16": "SQfp16",
+    "sq8": "SQ8",
+    "pq": None,  # PQ{PQ_M}
+}
+
+
+# --------------------------
+# Policy
+# --------------------------
+def estimated_flat_latency_ms(ntotal: int) -> float:
+    return ntotal * FLAT_NS_PER_VECTOR / 1e6
+
+
+def ivf_nlist(ntotal: int) -> int:
+    """Number of IVF lists for a collection size (about 4 * sqrt(n))."""
+    nlist = int(4 * math.sqrt(max(ntotal, 1)))
+    return max(1, min(nlist, ntotal // IVF_MIN_POINTS_PER_LIST))
+
+
+def choose_index_kind(ntotal: int, supports_removal: bool = False) -> str:
+    """
+    Choose "flat", "hnsw" or "ivf" for an index holding ntotal vectors.
+    HNSW cannot remove vectors, so indices that need removal use IVF.
+    """
+    if ntotal < FLAT_MIN_VECTORS or estimated_flat_latency_ms(ntotal) <= SEARCH_LATENCY_TARGET_MS:
+        return "flat"
+    if supports_removal or ntotal > HNSW_MAX_VECTORS:
+        return "ivf"
+    return "hnsw"
+
+
+def choose_compression(ntotal: int, compression: str = None) -> str:
+    """Choose the code type for an index holding ntotal vectors."""
+    compression = compression or INDEX_COMPRESSION
+    if compression not in COMPRESSION_CODECS:
+        raise ValueError(f"Unknown INDEX_COMPRESSION mode: {compression}")
+    if ntotal < COMPRESSION_MIN_VECTORS:
+        return "none"
+    if compression == "pq" and ntotal < PQ_MIN_VECTORS:
+        return "sq8"
+    return compression
+
+
+def choose_index_spec(ntotal: int, supports_removal: bool = False):
+    """Return the (kind, compression) an index of ntotal vectors should use."""
+    return choose_index_kind(ntotal, supports_removal), choose_compression(ntotal)
+
+
+def _unwrap(index):
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = index.index
+    return faiss.downcast_index(index)
+
+
+def describe_index(index) -> str:
+    """Return the kind ("flat", "hnsw", "ivf") of a (possibly id-mapped) index."""
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def describe_compression(index) -> str:
+    """Return the code type ("none", "fp16", "sq8", "pq") of an index."""
+    index = _unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+            return "fp16"
+        return "sq8"
+    if isinstance(index, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "none"
+
+
+def describe_spec(index):
+    return describe_index(index), describe_compression(index)
+
+
+def index_memory_bytes(index) -> int:
+    """Approximate resident size of an index's vector codes (plus HNSW links)."""
+    inner = _unwrap(index)
+    storage = faiss.downcast_index(inner.storage) if isinstance(inner, faiss.IndexHNSW) else inner
+    try:
+        code_size = storage.sa_code_size()
+    except RuntimeError:
+        code_size = index.d * 4
+    nbytes = index.ntotal * code_size
+    if isinstance(inner, faiss.IndexHNSW):
+        nbytes += index.ntotal * HNSW_M * 2 * 4
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) or isinstance(inner, faiss.IndexIVF):
+        nbytes += index.ntotal * 8  # stored ids
+    return nbytes
+
+
+def factory_string(kind: str, compression: str, ntotal: int) -> str:
+    """FAISS index_factory description for a (kind, compression) spec."""
+    codec = COMPRESSION_CODECS[compression] or f"PQ{PQ_M}"
+    if kind == "hnsw":
+        return f"HNSW{HNSW_M}" if codec == "Flat" else f"HNSW{HNSW_M},{codec}"
+    if kind == "ivf":
+        return f"IVF{ivf_nlist(ntotal)},{codec}"
+    return codec
+
+
+# --------------------------
+# Building / tuning
+# --------------------------
+def configure_search(index):
+    """Apply search-time parameters (not all are persisted by write_index)."""
+    inner = index.index if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    inner = faiss.downcast_index(inner)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = min(IVF_NPROBE, inner.nlist)
+    return index
+
+
+def _train(index, vectors: np.ndarray):
+    if index.is_trained:
+        return
+    if vectors.shape[0] > MAX_TRAIN_SAMPLE:
+        rng = np.random.default_rng(0)
+        vectors = vectors[rng.choice(vectors.shape[0], MAX_TRAIN_SAMPLE, replace=False)]
+    index.train(np.ascontiguousarray(vectors))
+
+
+def build_index(spec, vectors: np.ndarray, dim: int):
+    """
+    Build a sequential-id index for a (kind, compression) spec over vectors
+    (ids 0..n-1), training coarse quantizers / codecs on the vectors.
+    """
+    kind, compression = spec
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(dim, factory_string(kind, compression, vectors.shape[0]))
+    _train(index, vectors)
+    if vectors.shape[0]:
+        index.add(vectors)
+    return configure_search(index)
+
+
+def build_id_index(spec, vectors: np.ndarray, ids: np.ndarray, dim: int):
+    """
+    Build an index with explicit int64 ids that supports remove_ids.
+    Flat codes are wrapped in IndexIDMap2; IVF stores the ids natively.
+    """
+    kind, compression = spec
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if kind == "hnsw":
+        raise ValueError("HNSW indices do not support removal")
+    index = faiss.index_factory(dim, factory_string(kind, compression, vectors.shape[0]))
+    _train(index, vectors)
+    if kind != "ivf":
+        index = faiss.IndexIDMap2(index)
+    if vectors.shape[0]:
+        index.add_with_ids(vectors, np.ascontiguousarray(ids, dtype=np.int64))
+    return configure_search(index)
+
+
+def index_ids(index) -> np.ndarray:
+    """Return every external id stored in an id-mapped Flat or IVF index."""
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map)
+    invlists = faiss.extract_index_ivf(index).invlists
+    parts = []
+    for list_no in range(invlists.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            parts.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy())
+    return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
@@ -0,0 +1,250 @@
+"""
+Crash-safe background job queue backed by a local SQLite file.
+Jobs are persisted before the HTTP request returns and claimed by a pool
+of worker threads. Jobs interrupted by a restart are re-queued on startup
+(up to a maximum number of attempts), and each job records its current
+stage, progress, error and result for the job-status API.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+INTERRUPTED_ERROR = "Interrupted too many times"
+
+
+class JobQueue:
+    """Persistent FIFO of jobs: {id, kind, payload, status, stage, progress, error, attempts}."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,"
+            " status TEXT NOT NULL, stage TEXT, progress REAL NOT NULL DEFAULT 0,"
+            " error TEXT, attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL, result TEXT)"
+        )
+        # Job files created before results were recorded
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "result" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN result TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        """Persist a new job and return its id."""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, payload, status, stage, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), QUEUED, QUEUED, now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim(self):
+        """Atomically mark the oldest queued job as running and return it (or None)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, time.time(), row["id"]),
+            )
+            self._conn.commit()
+        job = self._to_dict(row)
+        job["status"] = RUNNING
+        job["attempts"] += 1
+        return job
+
+    def report(self, job_id: str, stage: str, progress: float = None):
+        """Record the stage a running job is in (and its progress within it, 0..1)."""
+        with self._lock:
+            if progress is None:
+                self._conn.execute(
+                    "UPDATE jobs SET stage = ?, updated_at = ? WHERE id = ?", (stage, time.time(), job_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ?",
+                    (stage, progress, time.time(), job_id),
+                )
+            self._conn.commit()
+
+    def finish(self, job_id: str, error: str = None, result: dict = None):
+        """Mark a job succeeded (with an optional JSON result), or failed with an error message."""
+        with self._lock:
+            if error is None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, stage = 'done', progress = 1, error = NULL, result = ?,"
+                    " updated_at = ? WHERE id = ?",
+                    (SUCCEEDED, json.dumps(result) if result is not None else None, time.time(), job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (FAILED, error, time.time(), job_id),
+                )
+            self._conn.commit()
+
+    def fail_exhausted(self, max_attempts: int) -> list:
+        """Fail jobs left running by a crash or restart that already used max_attempts; returns them."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND attempts >= ?", (RUNNING, max_attempts)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                [(FAILED, INTERRUPTED_ERROR, now, row["id"]) for row in rows],
+            )
+            self._conn.commit()
+        jobs = [self._to_dict(row) for row in rows]
+        for job in jobs:
+            job["status"], job["error"] = FAILED, INTERRUPTED_ERROR
+        return jobs
+
+    def requeue_interrupted(self, max_attempts: int) -> int:
+        """
+        Re-queue jobs left running by a crash or restart; jobs that already
+        used max_attempts are failed instead. Returns the number re-queued.
+        """
+        self.fail_exhausted(max_attempts)
+        now = time.time()
+        with self._lock:
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, updated_at = ? WHERE status = ?",
+                (QUEUED, QUEUED, now, RUNNING),
+            ).rowcount
+            self._conn.commit()
+        return requeued
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+
+class JobWorkerPool:
+    """
+    Threads that claim jobs from a JobQueue and run handlers[kind](job_id,
+    payload, report), where report(stage, progress=None) updates the job.
+    A handler's return value (a JSON-serializable dict or None) is stored as
+    the job result; a handler that raises fails the job with the exception message.
+    on_failure[kind](job_id, payload, error), if given, runs after a job of
+    that kind fails, whether its handler raised or it was interrupted by
+    restarts max_attempts times.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: dict, workers: int = 2, max_attempts: int = 3,
+                 poll_interval_s: float = 1.0, on_failure: dict = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.on_failure = on_failure or {}
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.poll_interval_s = poll_interval_s
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Re-queue interrupted jobs and start the worker threads (idempotent)."""
+        if self._threads:
+            return
+        for job in self.queue.fail_exhausted(self.max_attempts):
+            print(f"✗ Job {job['id']} ({job['kind']}) failed: {job['error']}")
+            self._failed(job, job["error"])
+        requeued = self.queue.requeue_interrupted(self.max_attempts)
+        if requeued:
+            print(f"Re-queued {requeued} interrupted job(s)")
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Stop claiming jobs; running jobs finish, or are re-queued on next start."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers after enqueueing a job."""
+        self._wakeup.set()
+
+    def submit(self, kind: str, payload: dict) -> str:
+        job_id = self.queue.enqueue(kind, payload)
+        self.notify()
+        return job_id
+
+    def _run(self):
+        while not self._stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self._wakeup.wait(self.poll_interval_s)
+                self._wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: dict):
+        job_id = job["id"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self.queue.finish(job_id, error=f"Unknown job kind: {job['kind']}")
+            return
+        try:
+            result = handler(
+                job_id, job["payload"], lambda stage, progress=None: self.queue.report(job_id, stage, progress)
+            )
+        except Exception as e:
+            print(f"✗ Job {job_id} ({job['kind']}) failed: {e}")
+            traceback.print_exc()
+            error = str(e) or type(e).__name__
+            self.queue.finish(job_id, error=error)
+            self._failed(job, error)
+            return
+        self.queue.finish(job_id, result=result)
+
+    def _failed(self, job: dict, error: str):
+        callback = self.on_failure.get(job["kind"])
+        if callback is None:
+            return
+        try:
+            callback(job["id"], job["payload"], error)
+        except Exception as e:
+            print(f"Warning: failure handler for job {job['id']} ({job['kind']}) raised: {e}")
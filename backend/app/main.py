@@ -1,7 +1,7 @@
 # backend/app/main.py
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .api_v2 import router as api_router
+from .api_v2 import router as api_router, ingestion_workers
 from .database import init_db
 import nltk
 import asyncio
@@ -82,6 +82,13 @@ async def startup_event():
         init_db()
     except Exception as e:
         print(f"Warning: could not initialize database: {e}")
+    # Start background ingestion workers (re-queues jobs interrupted by a restart)
+    ingestion_workers.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    ingestion_workers.stop(timeout=5.0)
 
 # Include API router
 app.include_router(api_router, prefix="/api")
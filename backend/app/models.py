@@ -28,6 +28,10 @@ class Document(Base):
     chunk_count = Column(Integer, default=0)  # Number of chunks created
     is_active = Column(Boolean, default=False)  # Mark as active document for queries
     device_id = Column(String, nullable=True)  # Optional device identifier for per-device filtering
+    content_hash = Column(String, nullable=True, index=True)  # SHA-256 of the uploaded file
+    # Document whose index, chunks and upload file this one uses (its own id
+    # unless it was uploaded as an exact copy of an already indexed file)
+    index_id = Column(String, nullable=True, index=True)
 
     # Relationships
     chat_messages = relationship("ChatMessage", back_populates="document", cascade="all, delete-orphan")
@@ -0,0 +1,191 @@
+"""
+Page-parallel PDF text extraction.
+Text extraction is CPU bound (PyPDF2's is pure Python), so large PDFs are
+split into page ranges extracted on a process pool sized to the machine.
+Ranges are reassembled in page order and streamed with a bounded number in
+flight. A per-page timeout keeps one pathological page from stalling the
+job: the page is skipped (yielded as empty text) and a warning is logged.
+When a worker hangs past even the backstop timeout (the alarm cannot
+interrupt native code), the pool is replaced so the stuck process does not
+hold a slot for every later upload; ranges still in flight are resubmitted.
+Pages are read with the engine chosen by extractors.get_extractor(".pdf").
+"""
+
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from .extractors import get_extractor, open_pdf
+
+# --------------------------
+# Configuration
+# --------------------------
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Smaller PDFs are extracted in-process; the pool's startup cost dominates
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_PAGE_TIMEOUT_S = float(os.getenv("PDF_PAGE_TIMEOUT_S", "30"))
+# Extra time a page range gets before its worker is considered hung
+PDF_BACKSTOP_SLACK_S = float(os.getenv("PDF_BACKSTOP_SLACK_S", "30"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PageTimeout(Exception):
+    pass
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+
+def extract_page_range(file_path: str, start: int, stop: int, timeout_s: float = PDF_PAGE_TIMEOUT_S,
+                       engine: str = None) -> list:
+    """
+    Extract the text of pages [start, stop) with the named engine. Runs in
+    pool workers; a page that takes longer than timeout_s is returned as ""
+    (where SIGALRM is available, i.e. POSIX main threads).
+    """
+    extractor = get_extractor(".pdf", engine)
+    doc = extractor.open(file_path)
+    use_alarm = (
+        timeout_s > 0 and hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+    )
+    previous_handler = signal.signal(signal.SIGALRM, _raise_page_timeout) if use_alarm else None
+    texts = []
+    try:
+        for page_no in range(start, stop):
+            # The outer try also catches an alarm delivered while disarming
+            try:
+                try:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, timeout_s)
+                    text = extractor.page_text(doc, page_no) or ""
+                finally:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+            except PageTimeout:
+                print(f"Warning: page {page_no + 1} of {file_path} timed out after {timeout_s}s; skipped")
+                text = ""
+            texts.append(text)
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous_handler)
+        extractor.close(doc)
+    return texts
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_EXTRACT_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the extraction processes (they are started on first use)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _recycle_pool(pool: ProcessPoolExecutor):
+    """
+    Replace a pool holding a hung worker: the next _get_pool() starts a new
+    one, and the old one's processes are killed (shutdown alone would wait
+    for the hung task). Its other pending futures fail with BrokenProcessPool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.kill()
+
+
+def pdf_page_count(file_path: str, engine: str = None) -> int:
+    extractor, doc = open_pdf(file_path, engine)
+    try:
+        return extractor.page_count(doc)
+    finally:
+        extractor.close(doc)
+
+
+def iter_pdf_pages(file_path: str, parallel: bool = None, engine: str = None, on_engine=None, on_count=None):
+    """
+    Yield the text of every page of a PDF, in order. Uses the process pool
+    for PDFs of PDF_PARALLEL_MIN_PAGES or more (unless parallel is False).
+    on_engine, if given, is called with the name of the engine that opened
+    the file (another than `engine` when that one could not read it), and
+    on_count with its page count, before the first page.
+    """
+    extractor, doc = open_pdf(file_path, engine)
+    if on_engine is not None:
+        on_engine(extractor.name)
+    try:
+        total = extractor.page_count(doc)
+        if on_count is not None:
+            on_count(total)
+        if parallel is None:
+            # Pool workers cannot start their own pools, so nested use stays serial
+            parallel = (
+                PDF_EXTRACT_WORKERS > 1
+                and total >= PDF_PARALLEL_MIN_PAGES
+                and multiprocessing.current_process().name == "MainProcess"
+            )
+        if not parallel:
+            for page_no in range(total):
+                yield extractor.page_text(doc, page_no) or ""
+            return
+    finally:
+        extractor.close(doc)
+
+    def submit(start: int, stop: int):
+        pool = _get_pool()
+        future = pool.submit(extract_page_range, file_path, start, stop, PDF_PAGE_TIMEOUT_S, extractor.name)
+        return start, stop, pool, future
+
+    window = deque()  # [(start, stop, pool, future)] in page order
+    max_in_flight = PDF_EXTRACT_WORKERS * 2
+    next_start = 0
+    resubmitted = set()  # range starts already retried after a pool was recycled
+    try:
+        while next_start < total or window:
+            while next_start < total and len(window) < max_in_flight:
+                stop = min(total, next_start + PDF_PAGES_PER_TASK)
+                window.append(submit(next_start, stop))
+                next_start = stop
+            start, stop, pool, future = window.popleft()
+            # Backstop for pages the in-worker alarm cannot interrupt
+            deadline = PDF_PAGE_TIMEOUT_S * (stop - start) + PDF_BACKSTOP_SLACK_S if PDF_PAGE_TIMEOUT_S > 0 else None
+            try:
+                texts = future.result(timeout=deadline)
+            except FutureTimeoutError:
+                print(f"Warning: pages {start + 1}-{stop} of {file_path} timed out; skipped")
+                texts = [""] * (stop - start)
+                _recycle_pool(pool)
+            except (BrokenProcessPool, CancelledError):
+                # The pool was recycled (by this or another extraction) under the range
+                if start in resubmitted:
+                    print(f"Warning: pages {start + 1}-{stop} of {file_path} crashed the extractor; skipped")
+                    texts = [""] * (stop - start)
+                else:
+                    resubmitted.add(start)
+                    window.appendleft(submit(start, stop))
+                    continue
+            yield from texts
+    finally:
+        for _, _, _, future in window:
+            future.cancel()
@@ -0,0 +1,100 @@
+"""
+Query embedding cache for repeated and popular questions.
+An in-process LRU maps normalized question text to its query vector, with
+a TTL and an entry limit. Misses can fall through to a persistent tier
+(the on-disk EmbeddingCache, under the same TTL) before the embedding API
+is called. Normalization only forms the key: the question is embedded as asked.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+# Query keys in the persistent tier, kept apart from the chunk texts it also stores
+_PERSISTENT_PREFIX = "query\0"
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form of a question: NFKC, case-folded, single spaces, no trailing ?!."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+class QueryCache:
+    """
+    LRU of {normalized question: vector} whose entries expire `ttl_s` seconds
+    after they were embedded. `persistent` is an optional EmbeddingCache;
+    its entries expire after `ttl_s` too.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float, persistent=None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.persistent = persistent
+        self._entries = OrderedDict()  # {question: (vector, expires_at)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get_or_embed(self, text: str, embed_fn):
+        """Return the vector for a question, calling embed_fn(text) only on a miss."""
+        question = normalize_question(text)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(question)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(question)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[question]
+                self.expirations += 1
+
+        key = _PERSISTENT_PREFIX + question
+        vector = self.persistent.get_many([key], max_age_s=self.ttl_s)[0] if self.persistent is not None else None
+        if vector is not None:
+            with self._lock:
+                self.persistent_hits += 1
+        else:
+            vector = embed_fn(text)
+            if self.persistent is not None:
+                self.persistent.put_many([key], [vector])
+            with self._lock:
+                self.misses += 1
+        self._put(question, vector, now + self.ttl_s)
+        return vector
+
+    def _put(self, question: str, vector, expires_at: float):
+        with self._lock:
+            self._entries[question] = (vector, expires_at)
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.persistent_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,129 @@
+"""
+Append-only write-ahead segment log for FAISS index persistence.
+Each add/remove is appended as a checksummed record, so a write costs
+O(new vectors). A torn record at the tail (crash mid-write) is detected
+by its checksum and discarded on replay; committed records are never rewritten.
+"""
+
+import os
+import struct
+import zlib
+
+import faiss
+import numpy as np
+
+MAGIC = b"MSEG"
+OP_ADD = 1  # vectors with sequential ids starting at `start`
+OP_ADD_IDS = 2  # vectors with explicit int64 ids
+OP_REMOVE_RANGE = 3  # remove ids in [start, end)
+
+# magic, op, start, count, payload length, crc32
+_HEADER = struct.Struct("<4sBqIII")
+
+
+class LogRecord:
+    """A decoded log record."""
+
+    __slots__ = ("op", "start", "count", "end", "ids", "vectors")
+
+    def __init__(self, op, start, count, end=None, ids=None, vectors=None):
+        self.op = op
+        self.start = start
+        self.count = count
+        self.end = end
+        self.ids = ids
+        self.vectors = vectors
+
+
+class SegmentLog:
+    """Append-only record log stored in a single file next to a base index."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+
+    def size_bytes(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    # --------------------------
+    # Appends
+    # --------------------------
+    def _append(self, op: int, start: int, count: int, payload: bytes):
+        crc = zlib.crc32(payload, zlib.crc32(struct.pack("<BqI", op, start, count)))
+        header = _HEADER.pack(MAGIC, op, start, count, len(payload), crc)
+        with open(self.path, "ab") as f:
+            f.write(header + payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append_add(self, vectors: np.ndarray, start_id: int):
+        """Record vectors appended with sequential ids start_id.."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._append(OP_ADD, start_id, vectors.shape[0], vectors.tobytes())
+
+    def append_add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        """Record vectors added under explicit ids."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self._append(OP_ADD_IDS, 0, vectors.shape[0], ids.tobytes() + vectors.tobytes())
+
+    def append_remove_range(self, start: int, end: int):
+        """Record removal of every id in [start, end)."""
+        self._append(OP_REMOVE_RANGE, start, 0, struct.pack("<q", end))
+
+    # --------------------------
+    # Replay / reset
+    # --------------------------
+    def replay(self):
+        """Return committed records in order, truncating any torn tail."""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            magic, op, start, count, length, crc = _HEADER.unpack_from(data, pos)
+            body_start = pos + _HEADER.size
+            payload = data[body_start : body_start + length]
+            if magic != MAGIC or len(payload) != length:
+                break
+            if zlib.crc32(payload, zlib.crc32(struct.pack("<BqI", op, start, count))) != crc:
+                break
+            records.append(self._decode(op, start, count, payload))
+            pos = body_start + length
+
+        if pos != len(data):
+            print(f"Warning: discarding {len(data) - pos} torn bytes from {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(pos)
+        return records
+
+    def _decode(self, op, start, count, payload) -> LogRecord:
+        if op == OP_ADD:
+            vectors = np.frombuffer(payload, dtype=np.float32).reshape(count, self.dim)
+            return LogRecord(op, start, count, vectors=vectors)
+        if op == OP_ADD_IDS:
+            ids = np.frombuffer(payload, dtype=np.int64, count=count)
+            vectors = np.frombuffer(payload, dtype=np.float32, offset=count * 8).reshape(count, self.dim)
+            return LogRecord(op, start, count, ids=ids, vectors=vectors)
+        (end,) = struct.unpack("<q", payload)
+        return LogRecord(op, start, count, end=end)
+
+    def reset(self):
+        """Atomically replace the log with an empty one (after compaction)."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+def write_index_atomic(index, path: str):
+    """Write a FAISS index to a temp file and rename it into place."""
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,179 @@
+"""
+Request coalescing ("singleflight") for identical upstream calls.
+Concurrent callers asking for the same key share one call: the first starts
+it, the others wait for its result, and an exception is raised to all of
+them. `timeout` bounds how long each caller waits for a shared call; a call
+that outlives its waiters still completes (and fills any cache it feeds).
+
+SingleFlight serves threads (blocking calls such as query embeddings);
+AsyncSingleFlight serves coroutines on one event loop, and can also fan
+out an async stream (e.g. generated tokens) to every subscriber.
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Counters:
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def _stats(self, in_flight: int) -> dict:
+        requests = self.calls + self.shared
+        return {
+            "upstream_calls": self.calls,
+            "coalesced": self.shared,
+            "coalesced_rate": self.shared / requests if requests else 0.0,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "in_flight": in_flight,
+        }
+
+
+class SingleFlight(_Counters):
+    """Thread-safe coalescing of blocking calls by key."""
+
+    def __init__(self):
+        super().__init__()
+        self._calls = {}  # {key: _Call}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout: float = None):
+        """fn() for the first caller of key; later concurrent callers get its result or exception."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out after {timeout}s waiting for a shared call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._stats(len(self._calls))
+
+
+class _Broadcast:
+    """Items of one upstream stream, replayed to every subscriber."""
+
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.error = None
+        self.changed = asyncio.Event()
+        self.task = None  # the pump, referenced so it is not garbage collected
+
+    def publish(self):
+        # Wake current waiters; later ones wait on a fresh event
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class AsyncSingleFlight(_Counters):
+    """Coalescing of coroutine calls and async streams by key, on one event loop."""
+
+    def __init__(self):
+        super().__init__()
+        self._tasks = {}  # {key: asyncio.Task}
+        self._streams = {}  # {key: _Broadcast}
+
+    def _forget(self, table: dict, key, value):
+        if table.get(key) is value:
+            del table[key]
+
+    async def do(self, key, fn, timeout: float = None):
+        """await fn() once for all concurrent callers of key."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+        try:
+            # Shielded: a caller timing out or disconnecting leaves the call running for the others
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _finish(self, key, task: asyncio.Task):
+        self._forget(self._tasks, key, task)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    async def stream(self, key, fn, timeout: float = None):
+        """
+        Async generator over the items of fn() (an async iterable), started
+        once for all concurrent subscribers of key. Each subscriber gets every
+        item from the start; timeout bounds the wait for each next item.
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = self._streams[key] = _Broadcast()
+            self.calls += 1
+            broadcast.task = asyncio.ensure_future(self._pump(key, broadcast, fn))
+        else:
+            self.shared += 1
+        position = 0
+        while True:
+            while position < len(broadcast.items):
+                yield broadcast.items[position]
+                position += 1
+            if broadcast.finished:
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+            try:
+                await asyncio.wait_for(broadcast.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+
+    async def _pump(self, key, broadcast: _Broadcast, fn):
+        try:
+            async for item in fn():
+                broadcast.items.append(item)
+                broadcast.publish()
+        except Exception as e:
+            broadcast.error = e
+            self.errors += 1
+        finally:
+            broadcast.finished = True
+            self._forget(self._streams, key, broadcast)
+            broadcast.publish()
+
+    def stats(self) -> dict:
+        return self._stats(len(self._tasks) + len(self._streams))
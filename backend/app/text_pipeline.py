@@ -0,0 +1,264 @@
+"""
+Streaming text pipeline for ingestion: pages -> normalized text -> chunks.
+Files are read page by page (PDF pages, DOCX paragraph groups, TXT line
+blocks) and every stage is a generator, so chunks reach the embedding
+pipeline while later pages are still being extracted and the full text is
+never held in memory.
+"""
+
+import re
+from array import array
+from functools import lru_cache
+from itertools import accumulate
+
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+
+from .extractors import file_type, get_extractor, iter_lines
+from .pdf_extraction import iter_pdf_pages
+
+# DOCX paragraphs and TXT lines are grouped into "pages" of about this size
+PAGE_CHARS = 64 * 1024
+SUMMARY_EXCERPT_CHARS = 5000
+
+
+# --------------------------
+# Extraction
+# --------------------------
+def _group_lines(lines, page_chars: int = PAGE_CHARS):
+    """Join consecutive lines into blocks of roughly page_chars characters."""
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line) + 1
+        if size >= page_chars:
+            yield "\n".join(block)
+            block, size = [], 0
+    if block:
+        yield "\n".join(block)
+
+
+def iter_pages(file_path: str, filename: str, on_page=None, on_engine=None):
+    """
+    Yield a file's text page by page (PDF, DOCX or TXT), using the engines
+    registered in extractors.
+    on_page, if given, is called as on_page(pages_done, total_pages) after
+    each page; total_pages is None when it is not known up front.
+    on_engine, if given, is called with the name of the engine that read
+    the file, which differs from the configured one after a fallback.
+    """
+    kind = file_type(filename)
+    counts = []
+    if kind == ".pdf":
+        # Large PDFs are extracted page-parallel on a process pool; the page
+        # count comes from the same open document, before the first page
+        pages = iter_pdf_pages(file_path, on_engine=on_engine, on_count=counts.append)
+    else:
+        # DOCX and TXT have no pages; lines are read by the registered engine
+        pages = _group_lines(iter_lines(file_path, kind, on_engine=on_engine))
+
+    for done, page in enumerate(pages, 1):
+        yield page
+        if on_page is not None:
+            on_page(done, counts[0] if counts else None)
+
+
+def extraction_key(filename: str, engine: str = None) -> str:
+    """
+    Identifies what iter_pages yields for a file: its type, engine (by
+    default the configured one) and page size.
+    """
+    kind = file_type(filename)
+    return f"{kind}:{engine or get_extractor(kind).name}:{PAGE_CHARS}"
+
+
+def extract_text_from_file(file_path: str, filename: str) -> str:
+    """Extract the full text of a PDF, DOCX, or TXT file."""
+    try:
+        return "\n".join(iter_pages(file_path, filename))
+    except Exception as e:
+        print(f"Error extracting text from {filename}: {e}")
+        raise
+
+
+# --------------------------
+# Normalization
+# --------------------------
+_WHITESPACE = re.compile(r"\s+")
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+# Once punctuation is stripped, the only rules of NLTK's word_tokenize that
+# still fire are these whole-word contraction splits (the others need quotes,
+# punctuation or apostrophes)
+_TOKENIZER_SPLITS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+
+
+@lru_cache(maxsize=1)
+def _stop_words() -> frozenset:
+    return frozenset(stopwords.words("english"))
+
+
+@lru_cache(maxsize=1)
+def _split_words() -> dict:
+    """{word: its non-stopword parts} for the tokenizer's contraction splits."""
+    stop_words = _stop_words()
+    return {word: [part for part in parts if part not in stop_words] for word, parts in _TOKENIZER_SPLITS.items()}
+
+
+def preprocess_text(text: str) -> str:
+    """Normalize text: lowercase, remove extra whitespace, remove punctuation."""
+    text = text.lower()
+    text = _WHITESPACE.sub(" ", text)
+    text = _NON_WORD.sub("", text)
+    return text
+
+
+def remove_stopwords(text: str) -> str:
+    """Remove common English stopwords."""
+    return " ".join(iter_words([text], normalize=False))
+
+
+def normalize_words(text: str) -> list:
+    """
+    Lowercase, strip punctuation, split and drop stopwords in one pass.
+    Same words as word_tokenize(preprocess_text(text)) minus stopwords,
+    without the sentence and word tokenizers.
+    """
+    stop_words = _stop_words()
+    words = _NON_WORD.sub("", text.lower()).split()
+    split_words = _split_words()
+    if split_words.keys().isdisjoint(words):
+        return [word for word in words if word not in stop_words]
+    kept = []
+    for word in words:
+        if word in split_words:
+            kept.extend(split_words[word])
+        elif word not in stop_words:
+            kept.append(word)
+    return kept
+
+
+def iter_words(pages, normalize: bool = True):
+    """
+    Yield the stopword-filtered words of each page. Pages are normalized
+    one at a time; page breaks are word boundaries, so the result equals
+    normalizing the joined text.
+    """
+    if normalize:
+        for page in pages:
+            yield from normalize_words(page)
+        return
+    # Raw text still has punctuation, so it goes through the NLTK tokenizer
+    stop_words = _stop_words()
+    for page in pages:
+        for word in word_tokenize(page):
+            if word.lower() not in stop_words:
+                yield word
+
+
+# --------------------------
+# Chunking
+# --------------------------
+def iter_buffer_chunks(buffers, chunk_size=500, chunk_overlap=150):
+    """
+    Streaming chunker over a sequence of text buffers (e.g. normalized
+    pages) whose words are separated by single spaces, read as one text
+    joined by spaces: runs of chunk_size words, starting every
+    chunk_size - chunk_overlap words.
+    Holds only the text from the next chunk's first word onwards plus one
+    offset per word, and slices each chunk out when the consumer asks for it.
+    """
+    step = chunk_size - chunk_overlap
+    text, starts, first = "", array("q"), 0
+
+    def end_of(word: int) -> int:
+        return starts[word + 1] - 1 if word + 1 < len(starts) else len(text)
+
+    for buffer in buffers:
+        if not buffer:
+            continue
+        if first:
+            # Drop the text before the next chunk's first word
+            cut = starts[first] if first < len(starts) else len(text)
+            text = text[cut:]
+            starts = array("q", [offset - cut for offset in starts[first:]])
+            first = 0
+        base = len(text) + 1 if text else 0
+        text = f"{text} {buffer}" if text else buffer
+        # Each word starts one space after the previous one ends
+        sizes = map(len, buffer.split(" ")[:-1])
+        starts.extend(accumulate(map((1).__add__, sizes), initial=base))
+        while len(starts) - first >= chunk_size:
+            yield text[starts[first] : end_of(first + chunk_size - 1)]
+            first += step
+    # Tail chunks (shorter than chunk_size) still start every step words
+    while first < len(starts):
+        yield text[starts[first] : end_of(min(first + chunk_size, len(starts)) - 1)]
+        first += step
+
+
+def chunk_text(text: str, chunk_size=500, chunk_overlap=150):
+    """Split text into overlapping chunks for embedding."""
+    # Single spaces between words, so a slice equals the words joined by " "
+    return list(iter_buffer_chunks([_WHITESPACE.sub(" ", text).strip()], chunk_size, chunk_overlap))
+
+
+class DocumentStream:
+    """
+    Streams a file's chunks page by page. While streaming it records the
+    text length and the opening SUMMARY_EXCERPT_CHARS of raw text, and calls
+    on_excerpt(excerpt) once the excerpt is complete so the summary can be
+    generated while the rest of the file is still being indexed.
+    pages, if given, is an iterable of page texts read instead of the file
+    (e.g. cached extraction output).
+    """
+
+    def __init__(self, file_path: str, filename: str, chunk_size=500, chunk_overlap=150,
+                 on_page=None, on_excerpt=None, pages=None):
+        self.file_path = file_path
+        self.filename = filename
+        self.pages = pages
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.on_page = on_page
+        self.on_excerpt = on_excerpt
+        self.text_length = 0
+        self.has_text = False
+        self._excerpt_parts = []
+        self._excerpt_chars = 0
+        self._excerpt_done = False
+
+    @property
+    def excerpt(self) -> str:
+        return "\n".join(self._excerpt_parts)
+
+    def _pages(self):
+        pages = self.pages if self.pages is not None else iter_pages(self.file_path, self.filename, self.on_page)
+        for page in pages:
+            self.text_length += len(page) + 1
+            self.has_text = self.has_text or bool(page.strip())
+            if not self._excerpt_done:
+                self._excerpt_parts.append(page[: SUMMARY_EXCERPT_CHARS - self._excerpt_chars])
+                self._excerpt_chars += len(self._excerpt_parts[-1]) + 1
+                if self._excerpt_chars >= SUMMARY_EXCERPT_CHARS:
+                    self._finish_excerpt()
+            yield page
+        self._finish_excerpt()
+
+    def _finish_excerpt(self):
+        if not self._excerpt_done:
+            self._excerpt_done = True
+            if self.on_excerpt is not None:
+                self.on_excerpt(self.excerpt)
+
+    def chunks(self):
+        """Generator of chunks; consume it once."""
+        pages = (" ".join(normalize_words(page)) for page in self._pages())
+        return iter_buffer_chunks(pages, self.chunk_size, self.chunk_overlap)
@@ -0,0 +1,62 @@
+"""
+Full-precision vector store kept on disk next to each document's index.
+Rows are raw float32 vectors appended in chunk-id order. It is the exact
+source for re-ranking candidates from compressed indices and for rebuilds.
+"""
+
+import os
+
+import numpy as np
+
+
+class VectorStore:
+    """Append-only float32 matrix file; row i is the vector of chunk id i."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = dim * 4
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        # A torn trailing row (crash mid-append) is ignored
+        return os.path.getsize(self.path) // self.row_bytes
+
+    def _map(self, count: int):
+        return np.memmap(self.path, dtype=np.float32, mode="r", shape=(count, self.dim))
+
+    def get(self, ids) -> np.ndarray:
+        """Read the rows for the given ids (only those pages are touched)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        count = len(self)
+        if ids.size == 0 or count == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.array(self._map(count)[ids])
+
+    def read_range(self, start: int, stop: int) -> np.ndarray:
+        count = len(self)
+        stop = min(stop, count)
+        if start >= stop:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.array(self._map(count)[start:stop])
+
+    def append(self, vectors: np.ndarray) -> int:
+        """Append rows; returns the id of the first appended row."""
+        start_id = len(self)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(self.path, "ab") as f:
+            f.truncate(start_id * self.row_bytes)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return start_id
+
+    def truncate(self, count: int):
+        """Drop every row with id >= count (and any torn trailing row)."""
+        if not os.path.exists(self.path):
+            return
+        count = min(count, len(self))
+        if os.path.getsize(self.path) != count * self.row_bytes:
+            with open(self.path, "r+b") as f:
+                f.truncate(count * self.row_bytes)
@@ -0,0 +1,191 @@
+"""
+Load report for the /api/ask request path (backend/app/api_v2).
+
+Runs the API router in-process behind an ASGI transport with Gemini and
+the query embedding replaced by fakes of fixed latency, then fires N
+concurrent single-document questions at two handlers:
+
+- sync: the previous shape of /ask, a `def` endpoint with a sync session
+  that blocks a threadpool thread for the whole generation call;
+- async: the current /ask (async session, async Gemini client, embedding
+  and FAISS offloaded to the API executor).
+
+With the threadpool limited to --threads, the sync handler's throughput
+stops at threads / latency while the async one keeps scaling with
+concurrency.
+
+A second table fires bursts of the same question at /api/ask and counts
+the upstream embedding and generation calls: identical in-flight questions
+share one of each.
+
+Usage (from the repository root):
+    python -m benchmarks.ask_load_report
+    python -m benchmarks.ask_load_report --latency 0.5 --threads 8 --concurrency 1 8 32 128
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import anyio
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import api_v2
+from backend.app.database import _configure_sqlite, get_async_db
+from backend.app.models import Base, ChatMessage, Document as DocumentModel
+from backend.app.query_cache import QueryCache
+
+
+UPSTREAM_CALLS = {"embed": 0, "generate": 0}
+
+
+def install_fakes(latency: float, embed_latency: float, gemini_concurrency: int):
+    class FakeResponse:
+        text = "An answer grounded in the excerpts."
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        def generate_content(self, prompt, **kwargs):
+            time.sleep(latency)
+            return FakeResponse()
+
+        async def generate_content_async(self, prompt, **kwargs):
+            UPSTREAM_CALLS["generate"] += 1
+            await asyncio.sleep(latency)
+            return FakeResponse()
+
+    def create_embedding(text):
+        UPSTREAM_CALLS["embed"] += 1
+        time.sleep(embed_latency)
+        return np.zeros(api_v2.embeddings.EMBED_DIM, dtype=np.float32)
+
+    api_v2.gemini_client.genai.GenerativeModel = FakeModel
+    api_v2.gemini_client.client = api_v2.gemini_client.GeminiClient(max_concurrency=gemini_concurrency)
+    api_v2.embeddings.create_embedding = create_embedding
+    # In-process query cache only, so the report leaves no files behind
+    api_v2.embeddings._query_cache = QueryCache(4096, 3600)
+    api_v2.embeddings.search_vector = lambda *args, **kwargs: [{"document_id": "doc", "chunk": "excerpt"}]
+    # Every request should pay for generation; the answer cache is not measured here
+    api_v2.embeddings.ANSWER_CACHE_MAX_ENTRIES = 0
+
+
+def build_app(db_path: str) -> tuple:
+    # Same connection settings as the API's engines
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _configure_sqlite)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autoflush=False, bind=engine)
+    with session() as db:
+        doc = DocumentModel(filename="report.pdf", file_path="report.pdf", summary="", chunk_count=1)
+        db.add(doc)
+        db.commit()
+        document_id = doc.id
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    event.listen(async_engine.sync_engine, "connect", _configure_sqlite)
+    async_session = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    api_v2.AsyncSessionLocal = async_session
+
+    async def override_db():
+        async with async_session() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(api_v2.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = override_db
+
+    @app.post("/api/ask-sync")
+    def ask_sync(q: api_v2.QuestionRequest):
+        # The pre-async handler: queries, embedding, search and generation all block one threadpool thread
+        with session() as db:
+            if not db.get(DocumentModel, q.document_id):
+                raise api_v2.HTTPException(status_code=404, detail="Document not found")
+            query_vec = api_v2.embeddings.embed_query(q.question)
+            hits = api_v2.embeddings.search_vector(query_vec, document_ids=[q.document_id], top_k=None)
+            answer = api_v2.gemini_client.genai.GenerativeModel("gemini-1.5-flash").generate_content("prompt").text
+            db.add(ChatMessage(document_id=q.document_id, role="user", content=q.question))
+            db.add(ChatMessage(document_id=q.document_id, role="assistant", content=answer))
+            db.commit()
+        return {"answer": answer, "source_chunks": [hit["chunk"] for hit in hits]}
+
+    return app, document_id
+
+
+async def fire(client: httpx.AsyncClient, path: str, document_id: str, concurrency: int, requests: int):
+    """Send `requests` questions, at most `concurrency` at a time. Returns requests/sec."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            response = await client.post(
+                path, json={"question": f"question {i}", "document_id": document_id, "use_chat_history": False}
+            )
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+async def burst(client: httpx.AsyncClient, document_id: str, size: int, round_no: int):
+    """Send `size` copies of one question at once. Returns (embedding calls, generation calls, seconds)."""
+    before = dict(UPSTREAM_CALLS)
+    body = {"question": f"What does burst {round_no} cover?", "document_id": document_id, "use_chat_history": False}
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(client.post("/api/ask", json=body) for _ in range(size)))
+    seconds = time.perf_counter() - start
+    for response in responses:
+        response.raise_for_status()
+    return UPSTREAM_CALLS["embed"] - before["embed"], UPSTREAM_CALLS["generate"] - before["generate"], seconds
+
+
+async def run(args):
+    install_fakes(args.latency, args.embed_latency, args.gemini_concurrency)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+    with tempfile.TemporaryDirectory() as tmp:
+        app, document_id = build_app(os.path.join(tmp, "load.db"))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+            print(
+                f"generation latency {args.latency}s, embedding latency {args.embed_latency}s, "
+                f"threadpool {args.threads} threads, {args.gemini_concurrency} concurrent Gemini calls\n"
+            )
+            print("| concurrency | sync req/s | async req/s | async / sync |")
+            print("|------------:|-----------:|------------:|-------------:|")
+            for concurrency in args.concurrency:
+                requests = max(concurrency * args.rounds, args.rounds)
+                sync_rps = await fire(client, "/api/ask-sync", document_id, concurrency, requests)
+                async_rps = await fire(client, "/api/ask", document_id, concurrency, requests)
+                print(f"| {concurrency} | {sync_rps:.1f} | {async_rps:.1f} | {async_rps / sync_rps:.1f}x |")
+
+            print("\n| identical questions | embedding calls | generation calls | seconds |")
+            print("|--------------------:|----------------:|-----------------:|--------:|")
+            for round_no, size in enumerate(args.burst):
+                embeds, generations, seconds = await burst(client, document_id, size, round_no)
+                print(f"| {size} | {embeds} | {generations} | {seconds:.2f} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake Gemini generation latency (seconds)")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Fake query embedding latency (seconds)")
+    parser.add_argument("--threads", type=int, default=8, help="Request threadpool size")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument(
+        "--gemini-concurrency", type=int, default=256, help="Gemini client concurrency limit (GEMINI_MAX_CONCURRENCY)"
+    )
+    parser.add_argument("--rounds", type=int, default=3, help="Requests per concurrent client")
+    parser.add_argument("--burst", type=int, nargs="+", default=[8, 64, 256], help="Identical-question burst sizes")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Memory and time report for the chunkers (backend/app/text_pipeline).
+
+Chunks the same normalized text with the original word-list chunker
+(text.split() plus " ".join of every window) and the streaming
+iter_buffer_chunks over 64 KB pages.
+Chunks are consumed one at a time, as the embedding pipeline does, so
+the peak is the chunker's own working memory (measured with tracemalloc).
+
+Usage (from the repository root):
+    python -m benchmarks.chunking_report
+    python -m benchmarks.chunking_report --mb 50 --chunk-size 500 --chunk-overlap 150
+"""
+
+import argparse
+import hashlib
+import random
+import time
+import tracemalloc
+
+from backend.app.text_pipeline import PAGE_CHARS, iter_buffer_chunks
+
+
+def word_list_chunks(text: str, chunk_size: int, chunk_overlap: int):
+    words = text.split()
+    for start in range(0, len(words), chunk_size - chunk_overlap):
+        yield " ".join(words[start : start + chunk_size])
+
+
+def streamed_chunks(text: str, chunk_size: int, chunk_overlap: int):
+    def pages():
+        start = 0
+        while start < len(text):
+            # Pages end on a word boundary, as normalized pages do
+            end = text.find(" ", start + PAGE_CHARS)
+            end = len(text) if end == -1 else end
+            yield text[start:end]
+            start = end + 1
+
+    return iter_buffer_chunks(pages(), chunk_size, chunk_overlap)
+
+
+def synthetic_text(mb: float) -> str:
+    rng = random.Random(0)
+    vocabulary = [f"term{i}" for i in range(20_000)]
+    words, size = [], 0
+    while size < mb * 2**20:
+        words.append(rng.choice(vocabulary))
+        size += len(words[-1]) + 1
+    return " ".join(words)
+
+
+def consume(chunker, text: str, chunk_size: int, chunk_overlap: int):
+    chunks, digest = 0, hashlib.sha256()
+    for chunk in chunker(text, chunk_size, chunk_overlap):
+        chunks += 1
+        digest.update(chunk.encode("utf-8") + b"\0")
+    return chunks, digest.hexdigest()
+
+
+def measure(chunker, text: str, chunk_size: int, chunk_overlap: int):
+    """(chunks, digest, seconds, peak bytes); tracing slows code down, so it is timed untraced."""
+    start = time.perf_counter()
+    chunks, digest = consume(chunker, text, chunk_size, chunk_overlap)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    consume(chunker, text, chunk_size, chunk_overlap)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chunks, digest, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=20, help="Size of the synthetic normalized text")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    args = parser.parse_args()
+
+    text = synthetic_text(args.mb)
+    print(f"{len(text) / 2**20:.1f} MB of text, chunk_size={args.chunk_size}, chunk_overlap={args.chunk_overlap}\n")
+    print("| chunker | chunks | seconds | peak MB | identical |")
+    print("|---------|-------:|--------:|--------:|:---------:|")
+    baseline = None
+    for name, chunker in [
+        ("word list + join", word_list_chunks),
+        ("streaming offsets (iter_buffer_chunks)", streamed_chunks),
+    ]:
+        chunks, digest, seconds, peak = measure(chunker, text, args.chunk_size, args.chunk_overlap)
+        baseline = baseline or digest
+        identical = "yes" if digest == baseline else "NO"
+        print(f"| {name} | {chunks} | {seconds:.2f} | {peak / 2**20:.1f} | {identical} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Recall-versus-memory report for the compressed index modes (INDEX_COMPRESSION).
+
+Builds a Flat index per mode over the same vectors and reports bytes per
+vector, recall@k against exact search, and recall@k after exact re-ranking
+of RERANK_FACTOR * k candidates (what the app does for compressed indices).
+
+Usage (from the repository root):
+    python -m benchmarks.compression_report                      # synthetic vectors
+    python -m benchmarks.compression_report --indices-dir ./data/indices
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import faiss
+import numpy as np
+
+from backend.app import index_policy
+
+DIM = 768
+MODES = ["none", "fp16", "sq8", "pq"]
+
+
+def load_vectors(indices_dir: str) -> np.ndarray:
+    """Load every document's full-precision vectors (<doc>.vectors files)."""
+    parts = []
+    for path in sorted(glob.glob(os.path.join(indices_dir, "*.vectors"))):
+        rows = os.path.getsize(path) // (DIM * 4)
+        if rows:
+            parts.append(np.fromfile(path, dtype=np.float32, count=rows * DIM).reshape(rows, DIM))
+    if not parts:
+        raise SystemExit(f"No .vectors files found in {indices_dir}")
+    return np.vstack(parts)
+
+
+def synthetic_vectors(n: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit-norm vectors, a rough stand-in for text embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n // 200, 8), DIM)).astype(np.float32)
+    labels = rng.integers(0, centers.shape[0], n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def rerank(vectors, queries, candidates, k):
+    out = np.empty((queries.shape[0], k), dtype=np.int64)
+    for row, (query, ids) in enumerate(zip(queries, candidates)):
+        ids = ids[ids >= 0]
+        distances = ((vectors[ids] - query) ** 2).sum(axis=1)
+        out[row] = ids[np.argsort(distances)[:k]]
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--indices-dir", help="Use vectors from an indices directory instead of synthetic data")
+    parser.add_argument("--n", type=int, default=20000, help="Synthetic vector count")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rerank-factor", type=int, default=int(os.getenv("RERANK_FACTOR", "4")))
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.indices_dir) if args.indices_dir else synthetic_vectors(args.n)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed copies of stored vectors, like paraphrased questions
+    queries = vectors[rng.choice(vectors.shape[0], args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    exact = faiss.IndexFlatL2(DIM)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    fetch_k = args.k * args.rerank_factor
+
+    print(f"{vectors.shape[0]} vectors, {args.queries} queries, k={args.k}, re-rank depth={fetch_k}\n")
+    print("| mode | bytes/vector | index MB | vs float32 | build s | recall@k | recall@k re-ranked |")
+    print("|------|-------------:|---------:|-----------:|--------:|---------:|-------------------:|")
+    baseline = vectors.shape[0] * DIM * 4  # float32
+    for mode in args.modes:
+        start = time.perf_counter()
+        index = index_policy.build_index(("flat", mode), vectors, DIM)
+        build_s = time.perf_counter() - start
+        nbytes = index_policy.index_memory_bytes(index)
+        _, found = index.search(queries, args.k)
+        _, candidates = index.search(queries, fetch_k)
+        reranked = rerank(vectors, queries, candidates, args.k)
+        print(
+            f"| {mode} | {nbytes / vectors.shape[0]:.0f} | {nbytes / 2**20:.1f} | "
+            f"{baseline / nbytes:.1f}x | {build_s:.1f} | {recall(found, truth):.3f} | "
+            f"{recall(reranked, truth):.3f} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Speed and memory report for the text-extraction engines (backend/app/extractors).
+
+Each installed engine extracts each sample file in a fresh process, and the
+report gives pages/sec and peak resident memory. DOCX and TXT "pages" are the
+~64 KB blocks the ingestion pipeline reads.
+
+Usage (from the repository root):
+    python -m benchmarks.extraction_report                      # synthetic PDF and DOCX
+    python -m benchmarks.extraction_report path/to/a.pdf path/to/b.docx
+    python -m benchmarks.extraction_report data/uploads         # every supported file in a directory
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.app import extractors
+from backend.app.text_pipeline import _group_lines
+from benchmarks.pdf_extraction_report import LOREM, write_synthetic_pdf
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_RSS_SCALE = 1 if sys.platform == "darwin" else 1024
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the process's RSS high-water mark (Linux); False if unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_bytes(field: str) -> int:
+    """VmRSS (current) or VmHWM (peak) from /proc/self/status."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise OSError(field)
+
+
+def write_synthetic_docx(path: str, paragraphs: int):
+    from docx import Document
+
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Paragraph {i + 1}: {LOREM}")
+    table = doc.add_table(rows=50, cols=4)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f"cell {r}.{c}"
+    doc.save(path)
+
+
+def measure(path: str, kind: str, name: str):
+    """Runs in a fresh process: (pages, chars, seconds, peak RSS bytes, baseline RSS bytes)."""
+    extractor = extractors.get_extractor(kind, name)
+    extractor.lib  # import the engine before taking the baseline
+    if _reset_peak_rss():
+        baseline = _rss_bytes("VmRSS")
+    else:
+        # Without a resettable peak, import-time memory may mask the extraction peak
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_SCALE
+    start = time.perf_counter()
+    pages = chars = 0
+    if kind == ".pdf":
+        doc = extractor.open(path)
+        for page_no in range(extractor.page_count(doc)):
+            chars += len(extractor.page_text(doc, page_no) or "")
+            pages += 1
+        extractor.close(doc)
+    else:
+        for page in _group_lines(extractor.iter_lines(path)):
+            chars += len(page)
+            pages += 1
+    seconds = time.perf_counter() - start
+    try:
+        peak = _rss_bytes("VmHWM")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_SCALE
+    return pages, chars, seconds, peak, baseline
+
+
+def sample_files(paths):
+    for path in paths:
+        names = sorted(os.listdir(path)) if os.path.isdir(path) else [None]
+        for name in names:
+            file_path = os.path.join(path, name) if name else path
+            try:
+                yield file_path, extractors.file_type(file_path)
+            except ValueError:
+                continue
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Files or directories (default: generated samples)")
+    parser.add_argument("--pages", type=int, default=300, help="Synthetic PDF page count")
+    parser.add_argument("--paragraphs", type=int, default=20000, help="Synthetic DOCX paragraph count")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = args.paths
+        if not paths:
+            write_synthetic_pdf(os.path.join(tmp, "synthetic.pdf"), args.pages)
+            write_synthetic_docx(os.path.join(tmp, "synthetic.docx"), args.paragraphs)
+            paths = [tmp]
+
+        print("| file | engine | pages | seconds | pages/sec | peak RSS MB | RSS growth MB | chars |")
+        print("|------|--------|------:|--------:|----------:|------------:|--------------:|------:|")
+        for path, kind in sample_files(paths):
+            for extractor in extractors.available_extractors(kind):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    pages, chars, seconds, peak, baseline = pool.submit(measure, path, kind, extractor.name).result()
+                print(
+                    f"| {os.path.basename(path)} | {extractor.name} | {pages} | {seconds:.2f} | "
+                    f"{pages / seconds if seconds else 0:.0f} | {peak / 2**20:.0f} | "
+                    f"{(peak - baseline) / 2**20:.0f} | {chars} |"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Throughput report for text normalization (backend/app/text_pipeline).
+
+Compares the NLTK path (preprocess_text, then word_tokenize and a stopword
+filter) with the single-pass normalize_words on the same text, and checks
+that both produce identical words. Requires the NLTK stopwords and punkt
+data (downloaded by the API on startup).
+
+Usage (from the repository root):
+    python -m benchmarks.normalization_report                   # synthetic text
+    python -m benchmarks.normalization_report path/to/doc.pdf path/to/notes.txt
+"""
+
+import argparse
+import random
+import time
+
+from nltk.tokenize import word_tokenize
+
+from backend.app.text_pipeline import _stop_words, extract_text_from_file, normalize_words, preprocess_text
+
+SAMPLE_SENTENCES = [
+    "Retrieval-augmented generation grounds answers in the user's own documents.",
+    "The quarterly report (Q3, 2024) shows revenue of $4.2M — up 12% year-over-year!",
+    "We cannot ship until the e-mail gateway's TLS certificates are renewed; gonna fix it today.",
+    "Section 4.1: \"Indexing\" covers FAISS, HNSW & IVF indices... and their trade-offs?",
+    "Naïve café owners in São Paulo don't close on Sundays.",
+]
+
+
+def nltk_words(text: str) -> list:
+    stop_words = _stop_words()
+    return [word for word in word_tokenize(preprocess_text(text)) if word.lower() not in stop_words]
+
+
+def synthetic_text(chars: int) -> str:
+    rng = random.Random(0)
+    parts, size = [], 0
+    while size < chars:
+        parts.append(rng.choice(SAMPLE_SENTENCES))
+        size += len(parts[-1]) + 1
+    return "\n".join(parts)
+
+
+def best_of(fn, text: str, repeats: int):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        words = fn(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, words
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="*", help="PDF, DOCX or TXT files (default: synthetic text)")
+    parser.add_argument("--chars", type=int, default=2_000_000, help="Synthetic text size")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = [(path, extract_text_from_file(path, path)) for path in args.files]
+    if not samples:
+        samples = [("synthetic", synthetic_text(args.chars))]
+
+    print("| text | MB | path | seconds | MB/sec | words | speedup | identical |")
+    print("|------|---:|------|--------:|-------:|------:|--------:|:---------:|")
+    for name, text in samples:
+        mb = len(text.encode("utf-8")) / 2**20
+        nltk_s, expected = best_of(nltk_words, text, args.repeats)
+        fast_s, words = best_of(normalize_words, text, args.repeats)
+        print(f"| {name} | {mb:.1f} | nltk | {nltk_s:.2f} | {mb / nltk_s:.1f} | {len(expected)} | 1.0x | yes |")
+        print(
+            f"| {name} | {mb:.1f} | single-pass | {fast_s:.2f} | {mb / fast_s:.1f} | {len(words)} | "
+            f"{nltk_s / fast_s:.1f}x | {'yes' if words == expected else 'NO'} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Speedup report for page-parallel PDF extraction (backend/app/pdf_extraction).
+
+Extracts the same PDF serially and on process pools of increasing size and
+reports pages/sec and speedup over serial extraction. Output text is checked
+to be identical to the serial result.
+
+Usage (from the repository root):
+    python -m benchmarks.pdf_extraction_report                  # synthetic 400-page PDF
+    python -m benchmarks.pdf_extraction_report --pages 1000
+    python -m benchmarks.pdf_extraction_report path/to/large.pdf
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from backend.app import pdf_extraction
+
+LOREM = (
+    "Retrieval augmented generation grounds answers in document excerpts. "
+    "Each page of this synthetic report repeats ordinary prose so that text "
+    "extraction does realistic work per glyph run and line. "
+)
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 45):
+    """Write a text-only PDF (Helvetica, one content stream per page)."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page_no in range(pages):
+        lines = [f"BT /F1 9 Tf 40 {800 - 17 * i} Td (Page {page_no + 1} line {i + 1}: {LOREM[:110]}) Tj ET"
+                 for i in range(lines_per_page)]
+        stream = "\n".join(lines).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def timed_extract(path: str, parallel: bool):
+    start = time.perf_counter()
+    texts = list(pdf_extraction.iter_pdf_pages(path, parallel=parallel))
+    return time.perf_counter() - start, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF to extract (default: a generated synthetic PDF)")
+    parser.add_argument("--pages", type=int, default=400, help="Synthetic PDF page count")
+    parser.add_argument("--workers", type=int, nargs="+", help="Pool sizes to try (default: 2, 4, ... up to CPUs)")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({n for n in (2, 4, 8, 16, cpus) if n <= cpus} or {2})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(tmp, "synthetic.pdf")
+            write_synthetic_pdf(path, args.pages)
+        total = pdf_extraction.pdf_page_count(path)
+
+        serial_s, expected = timed_extract(path, parallel=False)
+        print(f"{total} pages, {os.path.getsize(path) / 2**20:.1f} MB, {cpus} CPUs\n")
+        print("| mode | workers | seconds | pages/sec | speedup | identical |")
+        print("|------|--------:|--------:|----------:|--------:|:---------:|")
+        print(f"| serial | 1 | {serial_s:.2f} | {total / serial_s:.0f} | 1.0x | yes |")
+        for workers in worker_counts:
+            pdf_extraction.shutdown_pool()
+            pdf_extraction.PDF_EXTRACT_WORKERS = workers
+            # Start the pool outside the timed run, as a long-lived server would
+            pdf_extraction._get_pool().submit(int).result()
+            parallel_s, texts = timed_extract(path, parallel=True)
+            print(
+                f"| parallel | {workers} | {parallel_s:.2f} | {total / parallel_s:.0f} | "
+                f"{serial_s / parallel_s:.1f}x | {'yes' if texts == expected else 'NO'} |"
+            )
+        pdf_extraction.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
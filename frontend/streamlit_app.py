@@ -3,6 +3,7 @@ import requests
 import time
 from typing import List, Optional
 import hashlib
+import json
 import uuid
 import streamlit.components.v1 as components
 
@@ -729,6 +730,46 @@ def ask_question(
         return {"answer": f"API error: {e}", "source_chunks": []}
 
 
+def ask_question_stream(
+    question: str, document_id: Optional[str], document_ids: Optional[List[str]] = None
+):
+    """
+    Ask a question through the streaming endpoint. Yields (event, data)
+    pairs as they arrive: ("sources", {...}), ("token", {"text": ...}) for
+    each piece of the answer, then ("done", {"answer": ...}) or ("error", {...}).
+    """
+    doc_ids = None
+    if document_ids:
+        doc_ids = list(document_ids)
+    elif document_id:
+        doc_ids = [document_id]
+
+    payload = {"question": question, "document_ids": doc_ids, "use_chat_history": True}
+    try:
+        headers = {"X-Device-Id": st.session_state.get("device_id")}
+        with requests.post(
+            f"{API_URL}/ask/stream", json=payload, timeout=60, headers=headers, stream=True
+        ) as res:
+            res.raise_for_status()
+            event = "message"
+            for line in res.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):])
+                    event = "message"
+    except Exception as e:
+        yield "error", {"error": f"API error: {e}"}
+
+
+def assistant_message_html(content: str) -> str:
+    return f"""
+        <div class='chat-message assistant'>
+            <div class='message-content message-assistant'>{content}</div>
+        </div>
+        """
+
+
 # =========================
 # Main Layout
 # =========================
@@ -980,30 +1021,6 @@ else:
 if convo_key not in st.session_state.conversations:
     st.session_state.conversations[convo_key] = []
 
-# Process pending query
-if st.session_state.pending_query and not st.session_state.processing_query:
-    pq = st.session_state.pending_query
-    st.session_state.processing_query = True
-    try:
-        resp = ask_question(pq["question"], pq.get("active_doc"), pq.get("doc_ids"))
-        answer = resp.get("answer", "No answer returned")
-        if answer:
-            if pq["convo_key"] not in st.session_state.conversations:
-                st.session_state.conversations[pq["convo_key"]] = []
-            st.session_state.conversations[pq["convo_key"]].append(
-                {"role": "assistant", "content": answer}
-            )
-    except Exception as e:
-        if pq["convo_key"] not in st.session_state.conversations:
-            st.session_state.conversations[pq["convo_key"]] = []
-        st.session_state.conversations[pq["convo_key"]].append(
-            {"role": "assistant", "content": f"API error: {e}"}
-        )
-    finally:
-        st.session_state.pending_query = None
-        st.session_state.processing_query = False
-        st.rerun()
-
 # Chat and context columns
 col_chat, col_context = st.columns([3, 1], gap="large")
 
@@ -1037,16 +1054,39 @@ with col_chat:
                     unsafe_allow_html=True,
                 )
             else:
-                st.markdown(
-                    f"""
-                    <div class='chat-message assistant'>
-                        <div class='message-content message-assistant'>{content}</div>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+                st.markdown(assistant_message_html(content), unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
 
+    # Process pending query, rendering the answer as it streams in
+    if st.session_state.pending_query and not st.session_state.processing_query:
+        pq = st.session_state.pending_query
+        st.session_state.processing_query = True
+        placeholder = st.empty()
+        placeholder.markdown(assistant_message_html("…"), unsafe_allow_html=True)
+        answer = ""
+        try:
+            for event, data in ask_question_stream(
+                pq["question"], pq.get("active_doc"), pq.get("doc_ids")
+            ):
+                if event == "token":
+                    answer += data.get("text", "")
+                    placeholder.markdown(assistant_message_html(answer + " ▌"), unsafe_allow_html=True)
+                elif event == "done":
+                    answer = data.get("answer", answer)
+                elif event == "error":
+                    answer = data.get("error", "No answer returned")
+        except Exception as e:
+            answer = f"API error: {e}"
+        finally:
+            if pq["convo_key"] not in st.session_state.conversations:
+                st.session_state.conversations[pq["convo_key"]] = []
+            st.session_state.conversations[pq["convo_key"]].append(
+                {"role": "assistant", "content": answer or "No answer returned"}
+            )
+            st.session_state.pending_query = None
+            st.session_state.processing_query = False
+            st.rerun()
+
     # Input
     st.divider()
     question = st.chat_input("Ask something about your documents...")
@@ -0,0 +1,355 @@
+import asyncio
+import json
+import os
+import tracemalloc
+
+import numpy as np
+import httpx
+import pytest
+from fastapi import FastAPI, UploadFile
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app import api_v2, extractors, gemini_client, text_pipeline
+from backend.app.answer_cache import AnswerCache
+from backend.app.artifact_cache import ArtifactCache
+from backend.app.chunk_dedup import ChunkFingerprints
+from backend.app.database import get_async_db
+from backend.app.models import Base, Document as DocumentModel
+from backend.app.singleflight import AsyncSingleFlight
+
+
+@pytest.fixture(autouse=True)
+def fresh_gemini_client(monkeypatch):
+    # Model handles are pooled, so each test's fake model needs a new client
+    monkeypatch.setattr(gemini_client, "client", gemini_client.GeminiClient())
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    db_path = tmp_path / "marthanote.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    async_session = async_sessionmaker(
+        create_async_engine(f"sqlite+aiosqlite:///{db_path}"), autoflush=False, expire_on_commit=False
+    )
+
+    async def override_db():
+        async with async_session() as db:
+            yield db
+
+    (tmp_path / "uploads").mkdir()
+    monkeypatch.setattr(api_v2, "UPLOAD_FOLDER", str(tmp_path / "uploads"))
+    monkeypatch.setattr(api_v2, "AsyncSessionLocal", async_session)
+    submitted, deleted_indices = [], []
+    monkeypatch.setattr(api_v2.ingestion_workers, "submit", lambda kind, payload: submitted.append(payload) or "job-1")
+    monkeypatch.setattr(api_v2.embeddings, "delete_index", deleted_indices.append)
+    monkeypatch.setattr(api_v2.embeddings, "_answer_cache", AnswerCache(16, 60, 0.95))
+    monkeypatch.setattr(api_v2, "_generation_flight", AsyncSingleFlight())
+
+    app = FastAPI()
+    app.include_router(api_v2.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = override_db
+    test_client = TestClient(app)
+    test_client.session, test_client.submitted, test_client.deleted_indices = session, submitted, deleted_indices
+    return test_client
+
+
+def test_duplicate_upload_shares_the_index_until_the_last_copy_is_deleted(client):
+    original = client.post("/api/upload", files={"file": ("report.txt", b"quarterly numbers")}).json()
+    assert original["job_id"] == "job-1" and client.submitted == [{"document_id": original["document_id"]}]
+
+    # Simulate the ingestion job finishing
+    db = client.session()
+    doc = db.get(DocumentModel, original["document_id"])
+    doc.summary, doc.chunk_count = "Quarterly numbers.", 3
+    db.commit()
+    stored_file = doc.file_path
+
+    copy = client.post("/api/upload", files={"file": ("report (1).txt", b"quarterly numbers")}).json()
+    assert (copy["job_id"], copy["summary"], copy["chunk_count"]) == (None, "Quarterly numbers.", 3)
+    assert len(client.submitted) == 1 and sorted(os.listdir(os.path.dirname(stored_file))) == [
+        os.path.basename(stored_file)
+    ]
+    db.expire_all()
+    shared = db.get(DocumentModel, copy["document_id"])
+    assert shared.index_id == original["document_id"] and shared.file_path == stored_file
+
+    # Different content is indexed on its own
+    other = client.post("/api/upload", files={"file": ("report.txt", b"other numbers")}).json()
+    assert other["job_id"] == "job-1" and len(client.submitted) == 2
+
+    client.delete(f"/api/documents/{original['document_id']}")
+    assert client.deleted_indices == [] and os.path.exists(stored_file)
+    client.post("/api/documents/bulk-delete", json={"document_ids": [copy["document_id"]]})
+    assert client.deleted_indices == [original["document_id"]] and not os.path.exists(stored_file)
+    db.close()
+
+
+def test_reupload_after_a_failed_regeneration_is_indexed_again(client, monkeypatch):
+    monkeypatch.setattr(api_v2, "SessionLocal", client.session)
+    original = client.post("/api/upload", files={"file": ("report.txt", b"quarterly numbers")}).json()
+    db = client.session()
+    doc = db.get(DocumentModel, original["document_id"])
+    doc.summary, doc.chunk_count = "Quarterly numbers.", 3
+    db.commit()
+    db.close()
+
+    client.post(f"/api/documents/{original['document_id']}/summary/regenerate")
+    api_v2._mark_ingest_failed("job-1", {"document_id": original["document_id"]}, "embedding failed")
+
+    copy = client.post("/api/upload", files={"file": ("report.txt", b"quarterly numbers")}).json()
+    assert copy["job_id"] == "job-1" and client.submitted[-1] == {"document_id": copy["document_id"]}
+    assert len(client.submitted) == 3 and copy["summary"] == "Processing..."
+
+
+def test_upload_is_streamed_with_flat_memory_and_a_size_limit(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(api_v2, "UPLOAD_COPY_BUFFER_BYTES", 64 * 1024)
+    source = tmp_path / "big.bin"
+    source.write_bytes(os.urandom(1024) * 16 * 1024)  # 16 MB
+    with open(source, "rb") as f:
+        tracemalloc.start()
+        _, size = api_v2._save_upload(UploadFile(f, filename="big.bin"), str(tmp_path / "copy.bin"))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    assert size == 16 * 2**20 and peak < 4 * api_v2.UPLOAD_COPY_BUFFER_BYTES
+
+    accepted = client.post("/api/upload", files={"file": ("notes.txt", b"x" * 1000)}).json()
+    db = client.session()
+    assert db.get(DocumentModel, accepted["document_id"]).document_size == 1000
+    db.close()
+
+    monkeypatch.setattr(api_v2, "MAX_UPLOAD_BYTES", 100 * 1024)
+    response = client.post("/api/upload", files={"file": ("huge.txt", b"x" * (200 * 1024))})
+    assert response.status_code == 413
+    with open(source, "rb") as f:
+        with pytest.raises(api_v2.HTTPException) as error:
+            api_v2._save_upload(UploadFile(f, filename="big.bin"), str(tmp_path / "partial.bin"))
+        assert error.value.status_code == 413 and f.tell() <= 2 * 100 * 1024  # stopped early
+    assert len(client.submitted) == 1
+
+
+def test_unchanged_file_skips_extraction_and_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_v2, "_artifact_cache", ArtifactCache(str(tmp_path / "artifacts.db"), 2**20))
+    extracted, generated, prompts = [], [], []
+
+    def fake_iter_pages(file_path, filename, on_page=None, on_engine=None):
+        extracted.append(file_path)
+        on_engine("text" if filename.endswith(".txt") else "python-docx")
+        yield from ["first page", "second page"]
+
+    class FakeModel:
+        def __init__(self, name):
+            generated.append(name)
+
+        def generate_content(self, prompt, **kwargs):
+            prompts.append(prompt)
+            return type("Response", (), {"text": " A summary. "})()
+
+    monkeypatch.setattr(api_v2, "iter_pages", fake_iter_pages)
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+    progress = []
+    on_page = lambda done, total: progress.append((done, total))
+    for _ in range(2):  # upload, then regeneration of the same content
+        assert list(api_v2._document_pages("a.txt", "a.txt", "hash-1", on_page)) == ["first page", "second page"]
+        assert api_v2.generate_summary("first page", "a.txt", "hash-1") == "A summary."
+    assert extracted == ["a.txt"] and generated == [api_v2.SUMMARY_MODEL] and len(prompts) == 1
+    # Replayed pages still report indexing progress (the fake extractor reports none)
+    assert progress == [(1, 2), (2, 2)]
+
+    # The prompt names the file, so the same content under another name gets its own summary
+    api_v2.generate_summary("first page", "renamed.txt", "hash-1")
+    assert len(prompts) == 2 and "renamed.txt" in prompts[-1]
+
+    list(api_v2._document_pages("b.txt", "b.txt", "hash-2"))
+    assert extracted == ["a.txt", "b.txt"]
+
+    # Pages a fallback engine read are not cached under the configured engine
+    monkeypatch.setattr(extractors, "DOCX_ENGINE", "lxml")
+    for _ in range(2):
+        list(api_v2._document_pages("c.docx", "c.docx", "hash-3"))
+    assert extracted == ["a.txt", "b.txt", "c.docx", "c.docx"]
+
+
+def test_streaming_ask_sends_sources_then_tokens_and_saves_the_chat(client, monkeypatch):
+    document_id = client.post("/api/upload", files={"file": ("a.txt", b"text")}).json()["document_id"]
+    monkeypatch.setattr(api_v2.embeddings, "embed_query", lambda question: np.ones(4, dtype=np.float32))
+    monkeypatch.setattr(
+        api_v2.embeddings, "search_vector", lambda *args, **kwargs: [{"document_id": document_id, "chunk": "ctx"}]
+    )
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        async def generate_content_async(self, prompt, stream=False, **kwargs):
+            assert stream and "ctx" in prompt
+
+            async def chunks():
+                for text in ["Hello", ", world"]:
+                    yield type("Chunk", (), {"text": text})()
+
+            return chunks()
+
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+    response = client.post("/api/ask/stream", json={"question": "hi?", "document_id": document_id})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert events == [
+        ("sources", {"source_chunks": ["ctx"]}),
+        ("token", {"text": "Hello"}),
+        ("token", {"text": ", world"}),
+        ("done", {"answer": "Hello, world", "cached": False}),
+    ]
+    history = client.get(f"/api/chat-history/{document_id}").json()
+    assert [(m["role"], m["content"]) for m in history] == [("user", "hi?"), ("assistant", "Hello, world")]
+
+
+def test_near_identical_questions_are_answered_from_the_cache(client, monkeypatch):
+    document_id = client.post("/api/upload", files={"file": ("a.txt", b"text")}).json()["document_id"]
+    vectors = {"what is it?": np.array([1.0, 0.0, 0.1]), "what is this?": np.array([1.0, 0.0, 0.12])}
+    monkeypatch.setattr(api_v2.embeddings, "embed_query", lambda question: vectors.get(question, np.ones(3)))
+    monkeypatch.setattr(
+        api_v2.embeddings, "search_vector", lambda *args, **kwargs: [{"document_id": document_id, "chunk": "ctx"}]
+    )
+    prompts = []
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        async def generate_content_async(self, prompt, **kwargs):
+            prompts.append(prompt)
+            return type("Response", (), {"text": f"answer {len(prompts)}"})()
+
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+    ask = lambda question, **extra: client.post(
+        "/api/ask", json={"question": question, "document_id": document_id, "use_chat_history": False, **extra}
+    ).json()
+
+    assert ask("what is it?") == {"answer": "answer 1", "source_chunks": ["ctx"], "cached": False}
+    assert ask("what is this?") == {"answer": "answer 1", "source_chunks": ["ctx"], "cached": True}
+    assert ask("something else")["answer"] == "answer 2"
+    # Answers that depend on the conversation so far are not shared
+    assert ask("what is this?", use_chat_history=True)["cached"] is False
+    assert len(prompts) == 3
+
+    stats = client.get("/api/embeddings/stats").json()["answer_cache"]
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_concurrent_identical_questions_share_one_generation(client, monkeypatch):
+    document_id = client.post("/api/upload", files={"file": ("a.txt", b"text")}).json()["document_id"]
+    monkeypatch.setattr(api_v2.embeddings, "embed_query", lambda question: np.ones(3))
+    monkeypatch.setattr(
+        api_v2.embeddings, "search_vector", lambda *args, **kwargs: [{"document_id": document_id, "chunk": "ctx"}]
+    )
+    calls = []
+
+    class FakeModel:
+        def __init__(self, name):
+            pass
+
+        async def generate_content_async(self, prompt, stream=False, **kwargs):
+            calls.append(stream)
+            await asyncio.sleep(0.2)
+            if not stream:
+                return type("Response", (), {"text": "shared answer"})()
+
+            async def chunks():
+                for text in ["shared", " stream"]:
+                    await asyncio.sleep(0.05)
+                    yield type("Chunk", (), {"text": text})()
+
+            return chunks()
+
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+    # History differs per request order, so it is left out to keep the prompts identical
+    body = {"document_id": document_id, "use_chat_history": False}
+
+    async def burst():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            asks = [http.post("/api/ask", json={**body, "question": q}) for q in ["Why?", "why", "WHY ?"]]
+            streams = [http.post("/api/ask/stream", json={**body, "question": "how?"}) for _ in range(3)]
+            return await asyncio.gather(*asks, *streams)
+
+    monkeypatch.setattr(api_v2.embeddings, "ANSWER_CACHE_MAX_ENTRIES", 0)
+    responses = asyncio.run(burst())
+
+    assert [r.json()["answer"] for r in responses[:3]] == ["shared answer"] * 3
+    for response in responses[3:]:
+        assert 'event: done\ndata: {"answer": "shared stream", "cached": false}' in response.text
+    assert sorted(calls) == [False, True]
+    stats = client.get("/api/generation/stats").json()["coalescing"]
+    assert (stats["upstream_calls"], stats["coalesced"], stats["in_flight"]) == (2, 4, 0)
+
+
+def test_generation_errors_reach_every_coalesced_request():
+    async def scenario():
+        flight = AsyncSingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("quota exceeded")
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        results = await asyncio.gather(
+            *(flight.do("key", failing) for _ in range(3)), return_exceptions=True
+        )
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("slow", slow, timeout=0.05)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert [str(r) for r in results] == ["quota exceeded"] * 3
+    assert (flight.stats()["errors"], flight.stats()["timeouts"]) == (1, 1)
+
+
+def test_fully_deduplicated_upload_is_indexed_with_its_chunk_count(client, tmp_path, monkeypatch):
+    embeddings = api_v2.embeddings
+    monkeypatch.setattr(embeddings, "INDICES_DIR", str(tmp_path / "indices"))
+    monkeypatch.setattr(embeddings, "GLOBAL_INDEX_DIR", str(tmp_path / "indices" / "_global"))
+    monkeypatch.setattr(embeddings, "CHUNK_DEDUP", True)
+    monkeypatch.setattr(embeddings, "_chunk_fingerprints", ChunkFingerprints(str(tmp_path / "fingerprints.db")))
+    monkeypatch.setattr(embeddings, "_embedding_cache", None)
+    vector = np.ones(embeddings.EMBED_DIM, dtype=np.float32)
+    monkeypatch.setattr(embeddings, "create_embeddings", lambda texts: [vector] * len(texts))
+    monkeypatch.setattr(api_v2, "_artifact_cache", ArtifactCache(str(tmp_path / "artifacts.db"), 2**20))
+    monkeypatch.setattr(api_v2, "SessionLocal", client.session)
+    monkeypatch.setattr(api_v2, "generate_summary", lambda text, filename, content_hash=None: "Same text.")
+    monkeypatch.setattr(text_pipeline, "_stop_words", lambda: frozenset({"the"}))
+    monkeypatch.setattr(text_pipeline, "_split_words", lambda: {})
+    embeddings.reset_all_indices()
+
+    # The same text twice, in files with different bytes (so the indices are not shared)
+    text = " ".join(f"word{i}" for i in range(120))
+    db = client.session()
+    documents = []
+    for name, content in (("a.txt", text), ("b.txt", text + "\n")):
+        path = tmp_path / name
+        path.write_text(content)
+        doc = DocumentModel(filename=name, file_path=str(path), summary="Processing...", device_id="device-1")
+        db.add(doc)
+        db.commit()
+        documents.append(doc.id)
+    db.close()
+
+    results = [api_v2._run_ingest_job("job", {"document_id": doc_id}, lambda *args: None) for doc_id in documents]
+    assert [(r["chunks_added"], r["duplicates_skipped"]) for r in results] == [(1, 0), (0, 1)]
+    db = client.session()
+    for doc_id in documents:
+        doc = db.get(DocumentModel, doc_id)
+        assert (doc.summary, doc.chunk_count) == ("Same text.", 1)
+    db.close()
+    embeddings.reset_all_indices()
@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from backend.app import artifact_cache
+from backend.app.artifact_cache import ArtifactCache
+
+
+def test_pages_round_trip_only_when_fully_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_cache, "DECOMPRESS_BLOCK_BYTES", 1024)
+    cache = ArtifactCache(str(tmp_path / "artifacts.db"), max_bytes=10 * 2**20)
+    pages = ["", "naïve café — 页面\n" * 50] + [f"page {i} " * 500 for i in range(40)]
+
+    partial = cache.record_pages("abc", "pdf:pypdf2", iter(pages))
+    next(partial), next(partial)
+    partial.close()  # abandoned mid-file: nothing cached
+    assert cache.iter_pages("abc", "pdf:pypdf2") is None
+
+    assert list(cache.record_pages("abc", "pdf:pypdf2", iter(pages))) == pages
+    assert list(cache.iter_pages("abc", "pdf:pypdf2")) == pages
+    assert cache.iter_pages("abc", "pdf:pymupdf") is None  # other engine, other artifact
+
+    cache.put_text("abc", "summary", "model-a", "A short summary.")
+    assert cache.get_text("abc", "summary", "model-a") == "A short summary."
+    assert cache.get_text("abc", "summary", "model-b") is None
+    stats = cache.stats()
+    assert stats["entries_by_kind"] == {"pages": 1, "summary": 1}
+    assert (stats["hits"], stats["misses"]) == (2, 3)
+
+
+def test_least_recently_used_artifacts_are_evicted(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "artifacts.db"), max_bytes=8000)
+    for i in range(3):
+        # Random hex compresses to ~1.3 KB; each put is a different document
+        cache.put_text(f"doc{i}", "summary", "m", random.Random(i).randbytes(1200).hex())
+    cache.get_text("doc0", "summary", "m")  # doc0 is now the most recently used
+    for i in range(3, 6):
+        cache.put_text(f"doc{i}", "summary", "m", random.Random(i).randbytes(1200).hex())
+
+    assert cache.stats()["bytes"] <= 8000 and cache.evictions == 1
+    assert cache.get_text("doc0", "summary", "m") is not None
+    assert cache.get_text("doc1", "summary", "m") is None
+
+    # Artifacts over a quarter of the budget are never stored
+    cache.put_text("huge", "summary", "m", random.Random(9).randbytes(5000).hex())
+    assert cache.get_text("huge", "summary", "m") is None
+
+
+_forked_cache = None
+
+
+def _summarize_in_worker():
+    # Uses the instance inherited through fork, like api_v2's module-level cache
+    cache = _forked_cache
+    cache.put_text("doc", "summary", "m", f"written by {os.getpid()}")
+    return cache.get_text("doc", "summary", "m")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_forked_workers_open_their_own_connection(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path / "artifacts.db"), max_bytes=2**20)
+    cache.put_text("doc", "summary", "m", "written by the parent")
+    parent_connection = cache._conn
+    monkeypatch.setitem(globals(), "_forked_cache", cache)
+
+    # Forked while another parent thread holds the lock: the worker must not deadlock
+    with cache._lock:
+        pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))
+        written = pool.submit(_summarize_in_worker).result(timeout=30)
+    pool.shutdown()
+    assert written.startswith("written by") and written != f"written by {os.getpid()}"
+    assert cache.get_text("doc", "summary", "m") == written
+    assert cache._conn is parent_connection
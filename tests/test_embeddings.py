@@ -1,5 +1,18 @@
 import os
+import threading
+import time
+import zlib
+
+import numpy as np
+import pytest
+
 from backend.app import embeddings
+from backend.app.answer_cache import AnswerCache
+from backend.app.chunk_dedup import ChunkFingerprints
+from backend.app.embedding_cache import EmbeddingCache
+from backend.app.query_cache import QueryCache, normalize_question
+from backend.app.rwlock import ReadWriteLock
+from backend.app.singleflight import SingleFlight
 
 
 def test_search_on_empty_indices():
@@ -21,3 +34,587 @@ def test_create_and_delete_index(tmp_path):
     # After delete, search should yield empty
     results = embeddings.search("hello", document_id=doc_id)
     assert results == []
+
+
+def _fake_vector(text):
+    rng = np.random.default_rng(zlib.crc32(text.encode()))
+    return rng.random(embeddings.EMBED_DIM, dtype=np.float32)
+
+
+@pytest.fixture
+def offline_indices(tmp_path, monkeypatch):
+    """Point the index store at a temp dir and replace Gemini with fake vectors."""
+    indices_dir = tmp_path / "indices"
+    indices_dir.mkdir()
+    monkeypatch.setattr(embeddings, "INDICES_DIR", str(indices_dir))
+    monkeypatch.setattr(embeddings, "GLOBAL_INDEX_DIR", str(indices_dir / "_global"))
+    monkeypatch.setattr(embeddings, "create_embedding", _fake_vector)
+    monkeypatch.setattr(embeddings, "create_embeddings", lambda texts: [_fake_vector(t) for t in texts])
+    embedding_cache = EmbeddingCache(str(tmp_path / "embeddings.db"), "fake-model", 1 << 20)
+    monkeypatch.setattr(embeddings, "_embedding_cache", embedding_cache)
+    monkeypatch.setattr(embeddings, "_query_cache", QueryCache(16, 60, embedding_cache))
+    monkeypatch.setattr(embeddings, "_chunk_fingerprints", ChunkFingerprints(str(tmp_path / "fingerprints.db")))
+    monkeypatch.setattr(embeddings, "_answer_cache", AnswerCache(16, 60, 0.95))
+    monkeypatch.setattr(embeddings, "_query_flight", SingleFlight())
+    embeddings.reset_all_indices()
+    yield indices_dir
+    embeddings.reset_all_indices()
+
+
+def test_global_search_uses_consolidated_index(offline_indices):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk", "beta chunk"])
+    embeddings.add_chunks_to_index("doc-b", ["gamma chunk"])
+
+    assert embeddings.search("gamma chunk", document_id=None, top_k=1) == ["gamma chunk"]
+
+    embeddings.delete_index("doc-b")
+    results = embeddings.search("gamma chunk", document_id=None, top_k=5)
+    assert "gamma chunk" not in results
+    assert sorted(results) == ["alpha chunk", "beta chunk"]
+
+
+def test_global_index_migrates_existing_documents(offline_indices, monkeypatch):
+    monkeypatch.setattr(embeddings, "GLOBAL_INDEX_ENABLED", False)
+    embeddings.add_chunks_to_index("doc-old", ["legacy chunk"])
+    embeddings._index_cache.clear()
+
+    monkeypatch.setattr(embeddings, "GLOBAL_INDEX_ENABLED", True)
+    assert embeddings.search("legacy chunk", document_id=None, top_k=1) == ["legacy chunk"]
+
+
+def test_search_vector_merges_documents(offline_indices):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk", "beta chunk", "delta chunk"])
+    embeddings.add_chunks_to_index("doc-b", ["gamma chunk"])
+
+    query_vec = _fake_vector("beta chunk")
+    hits = embeddings.search_vector(
+        query_vec, document_ids=["doc-a", "doc-b"], top_k=None, per_document_k=2
+    )
+
+    assert len(hits) == 3
+    assert hits[0] == {"document_id": "doc-a", "chunk": "beta chunk", "score": 0.0}
+    assert [h["score"] for h in hits] == sorted(h["score"] for h in hits)
+    assert {h["document_id"] for h in hits} == {"doc-a", "doc-b"}
+
+
+def test_index_cache_evicts_lru_but_keeps_pinned():
+    from backend.app.index_cache import IndexCache
+
+    cache = IndexCache(max_bytes=100)
+    cache.put("pinned", "p", 40)
+    cache.pin("pinned")
+    cache.put("old", "o", 40)
+    assert cache.get("pinned") == "p"
+    cache.put("new", "n", 40)
+
+    assert "old" not in cache
+    assert "pinned" in cache and "new" in cache
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 80
+    assert stats["hits"] == 1
+
+
+def test_dropped_index_cache_entries_release_their_chunk_store(tmp_path):
+    from backend.app.chunk_store import ChunkStore
+    from backend.app.index_cache import IndexCache
+
+    stores = {}
+    for name in ("pinned", "old", "new"):
+        stores[name] = ChunkStore(str(tmp_path / f"{name}.chunks"), str(tmp_path / f"{name}.offsets"))
+        stores[name].append([f"{name} chunk"])
+    cache = IndexCache(max_bytes=100, close=lambda entry: entry[1].close())
+    cache.put("pinned", (None, stores["pinned"]), 40)
+    cache.pin("pinned")
+    cache.put("old", (None, stores["old"]), 40)
+    cache.put("new", (None, stores["new"]), 40)  # evicts "old"
+    assert stores["old"]._data_map is None and stores["new"]._data_map is not None
+
+    cache.clear()
+    assert stores["new"]._data_map is None
+    assert stores["pinned"]._data_map is not None  # still in use by the active document
+    # A reader still holding a closed store maps it again
+    assert stores["old"][0] == "old chunk" and len(stores["old"]) == 1
+    assert stores["old"].append(["more"]) == 1
+
+
+def test_chunk_store_reads_back_and_drops_torn_tail(tmp_path):
+    from backend.app.chunk_store import ChunkStore
+
+    data_path, offsets_path = str(tmp_path / "d.chunks"), str(tmp_path / "d.offsets")
+    store = ChunkStore(data_path, offsets_path)
+    assert len(store) == 0
+    assert store.append(["first", "sécond"]) == 0
+    assert store.append(["third"]) == 2
+    assert store.get_many([2, 0, 7]) == ["third", "first"]
+    store.close()
+
+    # Simulate a crash after the offsets write but before the data hit disk
+    with open(data_path, "r+b") as f:
+        f.truncate(len("first".encode()) + len("sécond".encode()))
+    reopened = ChunkStore(data_path, offsets_path)
+    assert len(reopened) == 2
+    assert reopened[1] == "sécond"
+
+
+def test_legacy_pickled_id_map_is_migrated(offline_indices):
+    import pickle
+
+    import faiss
+
+    index = faiss.IndexFlatL2(embeddings.EMBED_DIM)
+    index.add(np.vstack([_fake_vector("old one"), _fake_vector("old two")]))
+    faiss.write_index(index, str(offline_indices / "legacy.index"))
+    with open(offline_indices / "legacy_id_map.pkl", "wb") as f:
+        pickle.dump({0: "old one", 1: "old two"}, f)
+
+    assert embeddings.search("old two", document_id="legacy", top_k=1) == ["old two"]
+    assert not (offline_indices / "legacy_id_map.pkl").exists()
+
+
+def _drop_in_memory_state():
+    """Forget loaded indices so the next access reloads them from disk."""
+    embeddings._index_cache.clear()
+    embeddings._global_index = None
+    embeddings._global_registry = None
+
+
+def test_appends_go_to_segment_log_and_survive_torn_tail(offline_indices):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk"])
+    embeddings.add_chunks_to_index("doc-a", ["beta chunk"])
+    log_path = offline_indices / "doc-a.wal"
+    assert log_path.stat().st_size > 0
+
+    # A crash mid-append leaves a partial record at the end of the log
+    with open(log_path, "ab") as f:
+        f.write(b"MSEG\x01partial")
+    _drop_in_memory_state()
+
+    assert embeddings.get_index_stats("doc-a")["chunk_count"] == 2
+    assert embeddings.search("beta chunk", document_id="doc-a", top_k=1) == ["beta chunk"]
+    assert embeddings.search("beta chunk", document_id=None, top_k=1) == ["beta chunk"]
+
+
+def test_global_search_reads_chunk_text_without_loading_indices(offline_indices):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk", "beta chunk"])
+    embeddings.add_chunks_to_index("doc-b", ["gamma chunk"])
+    _drop_in_memory_state()
+    misses = embeddings.get_cache_stats()["misses"]
+
+    assert embeddings.search("gamma chunk", document_id=None, top_k=1) == ["gamma chunk"]
+    assert len(embeddings._index_cache) == 0 and embeddings.get_cache_stats()["misses"] == misses
+
+
+def test_global_searches_overlap_and_do_not_wait_for_global_lock_holders(offline_indices):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk", "beta chunk"])
+    held, release = threading.Event(), threading.Event()
+    results = []
+
+    def hold_global_lock():
+        with embeddings._global_lock:  # e.g. an ingestion writing the global WAL
+            held.set()
+            release.wait(5)
+
+    def search():
+        with embeddings._global_index_rw.read():  # another search in progress
+            results.append(embeddings.search("beta chunk", document_id=None, top_k=1))
+
+    holder = threading.Thread(target=hold_global_lock)
+    holder.start()
+    held.wait(5)
+    searcher = threading.Thread(target=search)
+    searcher.start()
+    searcher.join(2)
+    finished_while_held = not searcher.is_alive()
+    release.set()
+    holder.join()
+    searcher.join()
+    assert finished_while_held and results == [["beta chunk"]]
+
+
+def test_read_write_lock_excludes_writers_from_readers():
+    lock = ReadWriteLock()
+    events = []
+
+    def write():
+        with lock.write():
+            events.append("write")
+
+    with lock.read(), lock.read():
+        writer = threading.Thread(target=write)
+        writer.start()
+        time.sleep(0.05)
+        assert events == []
+        events.append("read")
+    writer.join(5)
+    assert events == ["read", "write"]
+
+
+def test_global_index_is_reconciled_after_a_crash_before_the_global_write(offline_indices, monkeypatch):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk"])
+    embeddings.add_chunks_to_index("doc-b", ["gamma chunk"])
+
+    def crash(document_id, start_id, vectors):
+        raise SystemExit("killed")
+
+    # The process dies after doc-a's log commit, before the global write
+    with monkeypatch.context() as m:
+        m.setattr(embeddings, "_global_add", crash)
+        with pytest.raises(SystemExit):
+            embeddings.add_chunks_to_index("doc-a", ["beta chunk"])
+    # ...and after doc-b's files were deleted, before it was unregistered
+    for path in embeddings._get_index_paths("doc-b"):
+        if os.path.exists(path):
+            os.remove(path)
+    _drop_in_memory_state()
+
+    assert sorted(embeddings.search("beta chunk", document_id=None, top_k=5)) == ["alpha chunk", "beta chunk"]
+    assert list(embeddings._global_registry["documents"]) == ["doc-a"]
+    _drop_in_memory_state()
+    assert embeddings._load_global_index().ntotal == 2  # reconciled once, not again
+
+
+def test_compaction_folds_log_into_base(offline_indices, monkeypatch):
+    monkeypatch.setattr(embeddings, "WAL_COMPACT_MIN_BYTES", 0)
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk", "beta chunk"])
+    assert (offline_indices / "doc-a.wal").stat().st_size == 0
+    _drop_in_memory_state()
+
+    assert embeddings.search("alpha chunk", document_id=None, top_k=1) == ["alpha chunk"]
+    assert embeddings.get_index_stats("doc-a")["chunk_count"] == 2
+
+
+def test_index_migrates_to_ann_when_policy_thresholds_are_crossed(offline_indices, monkeypatch):
+    from backend.app import index_policy
+
+    monkeypatch.setattr(index_policy, "FLAT_MIN_VECTORS", 40)
+    monkeypatch.setattr(index_policy, "SEARCH_LATENCY_TARGET_MS", 0)
+    chunks = [f"chunk number {i}" for i in range(60)]
+    embeddings.add_chunks_to_index("doc-big", chunks[:30])
+    assert embeddings.get_index_stats("doc-big")["index_type"] == "flat"
+
+    embeddings.add_chunks_to_index("doc-big", chunks[30:])
+    embeddings.wait_for_index_migrations()
+
+    assert embeddings.get_index_stats("doc-big")["index_type"] == "hnsw"
+    assert embeddings._global_index.ntotal == 60
+    assert index_policy.describe_index(embeddings._global_index) == "ivf"
+    assert embeddings.search("chunk number 42", document_id="doc-big", top_k=1) == ["chunk number 42"]
+    assert embeddings.search("chunk number 7", document_id=None, top_k=1) == ["chunk number 7"]
+
+    _drop_in_memory_state()
+    assert embeddings.get_index_stats("doc-big") == {
+        "chunk_count": 60,
+        "embedding_dimension": embeddings.EMBED_DIM,
+        "index_type": "hnsw",
+        "compression": "none",
+    }
+    embeddings.delete_index("doc-big")
+    assert embeddings._global_index.ntotal == 0
+
+
+def test_compressed_index_reranks_with_full_precision_vectors(offline_indices, monkeypatch):
+    from backend.app import index_policy
+
+    monkeypatch.setattr(index_policy, "INDEX_COMPRESSION", "sq8")
+    monkeypatch.setattr(index_policy, "COMPRESSION_MIN_VECTORS", 0)
+    chunks = [f"compressed chunk {i}" for i in range(40)]
+    embeddings.add_chunks_to_index("doc-sq", chunks)
+    embeddings.wait_for_index_migrations()
+
+    stats = embeddings.get_index_stats("doc-sq")
+    assert (stats["index_type"], stats["compression"]) == ("flat", "sq8")
+    hits = embeddings.search_vector(_fake_vector("compressed chunk 13"), ["doc-sq"], top_k=1)
+    assert hits == [{"document_id": "doc-sq", "chunk": "compressed chunk 13", "score": 0.0}]
+    global_hits = embeddings.search_vector(_fake_vector("compressed chunk 21"), None, top_k=1)
+    assert global_hits[0]["chunk"] == "compressed chunk 21"
+    assert global_hits[0]["score"] == 0.0
+
+
+def test_embedding_pipeline_retries_rate_limits_and_keeps_order():
+    from google.api_core import exceptions as google_exceptions
+
+    from backend.app.embedding_pipeline import EmbeddingPipeline
+
+    failed = set()
+
+    def flaky_embed(texts):
+        # Every batch is rate limited once before it succeeds
+        if texts[0] not in failed:
+            failed.add(texts[0])
+            raise google_exceptions.ResourceExhausted("quota")
+        return [_fake_vector(t) for t in texts]
+
+    pipeline = EmbeddingPipeline(concurrency=4, batch_size=8, max_batch_size=16, backoff_base_s=0.001)
+    chunks = [f"chunk {i}" for i in range(50)]
+    batches = list(pipeline.embed(chunks, flaky_embed))
+
+    assert [text for batch, _ in batches for text in batch] == chunks
+    for batch, vectors in batches:
+        assert np.array_equal(vectors, np.vstack([_fake_vector(t) for t in batch]))
+    stats = pipeline.stats()
+    assert stats["rate_limited"] == len(batches) == stats["retries"]
+    assert stats["chunks"] == 50
+    assert stats["batch_size"] < 8
+
+
+def test_identical_chunks_are_embedded_once(offline_indices, monkeypatch):
+    embedded = []
+
+    def counting_embed(texts):
+        embedded.extend(texts)
+        return [_fake_vector(t) for t in texts]
+
+    monkeypatch.setattr(embeddings, "create_embeddings", counting_embed)
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk", "beta chunk", "alpha chunk"])
+    # Re-uploading / regenerating re-adds the same text
+    embeddings.delete_index("doc-a")
+    embeddings.add_chunks_to_index("doc-b", ["beta chunk", "gamma chunk"])
+
+    assert sorted(embedded) == ["alpha chunk", "beta chunk", "gamma chunk"]
+    cache_stats = embeddings.get_embedding_stats()["cache"]
+    assert (cache_stats["hits"], cache_stats["misses"]) == (1, 4)
+    assert embeddings.search("beta chunk", document_id="doc-b", top_k=1) == ["beta chunk"]
+
+
+def test_embedding_cache_evicts_least_recently_used(tmp_path):
+    vector_bytes = embeddings.EMBED_DIM * 4
+    path = str(tmp_path / "cache.db")
+    cache = EmbeddingCache(path, "fake-model", max_bytes=3 * (vector_bytes + 64))
+    cache.put_many(["one", "two", "three"], [_fake_vector(t) for t in ("one", "two", "three")])
+    assert cache.get_many(["one"])[0] is not None  # "two" and "three" are now least recently used
+    cache.put_many(["four"], [_fake_vector("four")])
+
+    # Eviction frees down to 90% of the budget, so both old entries go
+    assert [v is not None for v in cache.get_many(["one", "two", "three", "four"])] == [True, False, False, True]
+    assert cache.stats()["evictions"] == 2
+    cache.close()
+
+    # Vectors persist; another model never sees them
+    assert np.array_equal(EmbeddingCache(path, "fake-model", 1 << 20).get_many(["four"])[0], _fake_vector("four"))
+    assert EmbeddingCache(path, "other-model", 1 << 20).get_many(["four"]) == [None]
+
+
+def test_repeated_questions_skip_the_embedding_call(offline_indices, monkeypatch):
+    embeddings.add_chunks_to_index("doc-a", ["what is the main idea", "other chunk"])
+    asked = []
+
+    def counting_embed(text):
+        asked.append(text)
+        return _fake_vector(text)
+
+    monkeypatch.setattr(embeddings, "create_embedding", counting_embed)
+    for question in ["What is the main idea?", "what is  the MAIN idea", "Summarize this."]:
+        embeddings.search(question, document_id="doc-a", top_k=1)
+    # Questions are embedded as asked, never from the normalized key or a chunk with that text
+    assert asked == ["What is the main idea?", "Summarize this."]
+
+    # A restart still finds the question in the persistent tier
+    monkeypatch.setattr(embeddings, "_query_cache", QueryCache(16, 60, embeddings._embedding_cache))
+    embeddings.search("what is the main idea", document_id="doc-a", top_k=1)
+    assert len(asked) == 2
+    stats = embeddings.get_embedding_stats()["query_cache"]
+    assert (stats["hits"], stats["persistent_hits"], stats["misses"]) == (0, 1, 0)
+
+
+def test_query_cache_entries_expire(monkeypatch):
+    from backend.app import query_cache
+
+    clock = [0.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: clock[0])
+    cache = QueryCache(max_entries=2, ttl_s=10)
+    calls = []
+    embed = lambda text: calls.append(text) or _fake_vector(text)
+
+    cache.get_or_embed("Hello?", embed)
+    cache.get_or_embed("hello", embed)
+    clock[0] = 11
+    cache.get_or_embed("hello", embed)
+    assert calls == ["Hello?", "hello"]
+    assert cache.stats()["expirations"] == 1
+
+
+def test_persistent_query_entries_expire(tmp_path, monkeypatch):
+    from backend.app import embedding_cache
+
+    clock = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: clock[0])
+    persistent = EmbeddingCache(str(tmp_path / "embeddings.db"), "fake-model", 1 << 20)
+    calls = []
+    embed = lambda text: calls.append(text) or _fake_vector(text)
+
+    QueryCache(max_entries=2, ttl_s=10, persistent=persistent).get_or_embed("Hello?", embed)
+    QueryCache(max_entries=2, ttl_s=10, persistent=persistent).get_or_embed("hello", embed)
+    clock[0] += 11
+    QueryCache(max_entries=2, ttl_s=10, persistent=persistent).get_or_embed("hello", embed)
+    assert calls == ["Hello?", "hello"]
+    assert persistent.stats()["entries"] == 1
+
+
+def test_add_chunks_consumes_generators_incrementally(offline_indices):
+    def stream():
+        for i in range(100):
+            yield f"streamed chunk {i}"
+
+    progress = []
+    embeddings.add_chunks_to_index("doc-s", stream(), progress=lambda done, total: progress.append((done, total)))
+
+    assert embeddings.get_index_stats("doc-s")["chunk_count"] == 100
+    assert progress[-1] == (100, None)
+    # Chunks were committed while the generator was still producing
+    assert len(progress) > 1 and progress[0][0] < 100
+    assert embeddings.search("streamed chunk 57", document_id="doc-s", top_k=1) == ["streamed chunk 57"]
+
+
+def test_near_duplicate_chunks_are_skipped_and_resolved_by_pointer(offline_indices, monkeypatch):
+    monkeypatch.setattr(embeddings, "CHUNK_DEDUP", True)
+    words = [f"term{i}" for i in range(400)]
+    boilerplate = " ".join(words)
+    edited = " ".join(words[:200] + ["changed"] + words[201:])  # one word differs
+
+    first = embeddings.add_chunks_to_index("doc-a", [boilerplate, "alpha chunk"], corpus="device-1")
+    second = embeddings.add_chunks_to_index("doc-b", ["beta chunk", edited, "beta chunk"], corpus="device-1")
+    other = embeddings.add_chunks_to_index("doc-c", [boilerplate], corpus="device-2")
+
+    assert first["duplicates_skipped"] == 0
+    assert (second["chunks_added"], second["duplicates_skipped"], second["api_calls_saved"]) == (1, 2, 1)
+    assert second["index_bytes_saved"] > 2 * embeddings.EMBED_DIM * 4
+    assert other["duplicates_skipped"] == 0  # other devices are not deduplicated against
+    assert embeddings.get_index_stats("doc-b")["chunk_count"] == 1
+
+    # doc-b still finds its boilerplate through the pointer into doc-a
+    query_vec = _fake_vector(boilerplate)
+    hits = embeddings.search_vector(query_vec, document_ids=["doc-b"], top_k=1)
+    assert hits == [{"document_id": "doc-b", "chunk": boilerplate, "score": 0.0}]
+
+    # Deleting doc-a copies the shared chunk into doc-b first
+    embeddings.delete_index("doc-a")
+    assert embeddings.get_index_stats("doc-b")["chunk_count"] == 2
+    hits = embeddings.search_vector(query_vec, document_ids=["doc-b"], top_k=1)
+    assert hits == [{"document_id": "doc-b", "chunk": boilerplate, "score": 0.0}]
+    assert embeddings.search(boilerplate, document_id=None, top_k=5).count(boilerplate) == 2  # doc-b and doc-c
+
+
+def test_near_identical_questions_reuse_answers_until_a_document_changes(offline_indices):
+    embeddings.add_chunks_to_index("doc-a", ["alpha chunk"])
+    embeddings.add_chunks_to_index("doc-b", ["beta chunk"])
+    question = _fake_vector("what is alpha")
+    rephrased = question + np.float32(0.001)
+
+    asked_at = time.monotonic()
+    assert embeddings.lookup_answer(question, ["doc-a", "doc-b"]) is None
+    embeddings.store_answer(question, ["doc-b", "doc-a"], "Alpha.", ["alpha chunk"], 1.5, asked_at)
+    embeddings.store_answer(question, None, "Alpha (global).", ["alpha chunk"], 2.0, asked_at)
+
+    hit = embeddings.lookup_answer(rephrased, ["doc-a", "doc-b"])
+    assert (hit["answer"], hit["source_chunks"]) == ("Alpha.", ["alpha chunk"])
+    assert hit["similarity"] > 0.99
+    assert embeddings.lookup_answer(_fake_vector("unrelated question"), ["doc-a", "doc-b"]) is None
+    assert embeddings.lookup_answer(question, ["doc-a"]) is None  # a different document set
+
+    # New chunks in doc-b invalidate its answers and every all-documents answer
+    embeddings.add_chunks_to_index("doc-b", ["gamma chunk"])
+    assert embeddings.lookup_answer(question, ["doc-a", "doc-b"]) is None
+    assert embeddings.lookup_answer(question, None) is None
+
+    # An answer generated from sources retrieved before a change is not cached
+    asked_at = time.monotonic()
+    embeddings.delete_index("doc-a")
+    embeddings.store_answer(question, ["doc-a"], "Stale.", ["alpha chunk"], 1.0, asked_at)
+    assert embeddings.lookup_answer(question, ["doc-a"]) is None
+
+    stats = embeddings.get_embedding_stats()["answer_cache"]
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (1, 6, 2)
+    assert stats["saved_generation_s"] == 1.5
+
+
+def test_answer_cache_expires_and_evicts(monkeypatch):
+    from backend.app import answer_cache
+
+    clock = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: clock[0])
+    cache = AnswerCache(max_entries=2, ttl_s=10, min_similarity=0.9)
+    vectors = [_fake_vector(f"question {i}") for i in range(3)]
+    for i, vector in enumerate(vectors):
+        cache.store(vector, ["doc"], f"answer {i}", [], 1.0, asked_at=clock[0])
+
+    assert cache.lookup(vectors[0], ["doc"]) is None  # least recently used, evicted
+    assert cache.lookup(vectors[2], ["doc"])["answer"] == "answer 2"
+    clock[0] = 111.0
+    assert cache.lookup(vectors[2], ["doc"]) is None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["expirations"], stats["entries"]) == (1, 2, 0)
+
+
+def test_answer_cache_forgets_old_document_changes(monkeypatch):
+    from backend.app import answer_cache
+
+    clock = [100.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: clock[0])
+    cache = AnswerCache(max_entries=4, ttl_s=10, min_similarity=0.9)
+    for i in range(1000):
+        cache.invalidate_document(f"doc-{i}")
+        clock[0] += 1
+    assert len(cache._changed_at) <= 11
+
+    # A forgotten change still blocks answers asked before it
+    vector = _fake_vector("question")
+    cache.store(vector, ["doc-0"], "stale", [], 1.0, asked_at=99.0)
+    assert cache.lookup(vector, ["doc-0"]) is None
+    cache.store(vector, ["doc-0"], "fresh", [], 1.0, asked_at=clock[0])
+    assert cache.lookup(vector, ["doc-0"])["answer"] == "fresh"
+
+
+def test_concurrent_identical_questions_share_one_embedding_call(offline_indices, monkeypatch):
+    monkeypatch.setattr(embeddings, "_embedding_cache", None)
+    monkeypatch.setattr(embeddings, "_query_cache", QueryCache(16, 60))
+    release = threading.Event()
+    calls = []
+
+    def slow_embed(text):
+        calls.append(text)
+        release.wait(5)
+        if normalize_question(text) == "broken":
+            raise RuntimeError("embedding failed")
+        return _fake_vector(text)
+
+    monkeypatch.setattr(embeddings, "create_embedding", slow_embed)
+    results = {}
+
+    def ask(i, question):
+        try:
+            results[i] = embeddings.embed_query(question)
+        except RuntimeError as e:
+            results[i] = e
+
+    questions = ["What is it?", "what is it", "WHAT IS IT?", "broken", "Broken?"]
+    threads = [threading.Thread(target=ask, args=(i, q)) for i, q in enumerate(questions)]
+    for thread in threads:
+        thread.start()
+    while embeddings._query_flight.stats()["coalesced"] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    # One call per normalized question, with the leading request's own wording
+    assert sorted(map(normalize_question, calls)) == ["broken", "what is it"]
+    asked = next(text for text in calls if normalize_question(text) == "what is it")
+    assert all(np.array_equal(results[i], _fake_vector(asked)) for i in range(3))
+    assert results[3] is results[4] and str(results[3]) == "embedding failed"
+    stats = embeddings.get_embedding_stats()["query_coalescing"]
+    assert (stats["upstream_calls"], stats["coalesced"], stats["errors"], stats["in_flight"]) == (2, 3, 1, 0)
+
+
+def test_coalesced_waiters_time_out():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    leader = threading.Thread(target=flight.do, args=("key", lambda: started.set() or release.wait(5)))
+    leader.start()
+    started.wait(5)
+    with pytest.raises(TimeoutError):
+        flight.do("key", lambda: "not called", timeout=0.05)
+    release.set()
+    leader.join()
+    assert flight.do("key", lambda: "fresh call") == "fresh call"
+    assert flight.stats()["timeouts"] == 1
@@ -0,0 +1,49 @@
+from docx import Document
+
+from backend.app import extractors
+
+
+def _write_docx(path):
+    doc = Document()
+    doc.add_paragraph("Intro paragraph")
+    doc.add_paragraph("Mixed ").add_run("bold run").bold = True
+    table = doc.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "left cell"
+    table.cell(0, 1).text = "right cell"
+    doc.add_paragraph("Closing paragraph")
+    doc.save(path)
+
+
+def test_streaming_docx_reader_matches_python_docx(tmp_path):
+    path = str(tmp_path / "doc.docx")
+    _write_docx(path)
+
+    streamed = list(extractors.LxmlDocxExtractor().iter_lines(path))
+    # Same paragraphs; the streaming reader keeps tables in document order
+    assert streamed == ["Intro paragraph", "Mixed bold run", "left cell", "right cell", "Closing paragraph"]
+    assert sorted(streamed) == sorted(extractors.PythonDocxExtractor().iter_lines(path))
+
+
+def test_missing_engines_fall_back_to_the_next_installed(monkeypatch):
+    pdfium, pymupdf, pypdf2 = extractors.EXTRACTORS[".pdf"]
+    monkeypatch.setattr(pdfium, "available", lambda: False)
+    monkeypatch.setattr(pymupdf, "available", lambda: False)
+
+    assert extractors.get_extractor(".pdf") is pypdf2
+    assert extractors.get_extractor(".pdf", "pypdfium2") is pypdf2
+    assert extractors.file_type("report.docx") == ".docx"
+
+
+def test_engine_that_fails_before_output_is_replaced(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.docx")
+    _write_docx(path)
+
+    def broken(file_path):
+        raise KeyError("word/document.xml")
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(extractors.EXTRACTORS[".docx"][0], "iter_lines", broken)
+    used = []
+    lines = list(extractors.iter_lines(path, ".docx", "lxml", on_engine=used.append))
+    assert lines[0] == "Intro paragraph" and "right cell" in lines
+    assert used == ["python-docx"]
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from backend.app import gemini_client
+from backend.app.gemini_client import CircuitBreaker, GeminiClient, GeminiUnavailable
+
+
+def _text(value):
+    return type("Response", (), {"text": value})()
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """A FakeModel class whose behaviour per call is scripted by the test."""
+
+    class FakeModel:
+        created = []
+        script = []  # callables (prompt) -> text or raise, consumed in order
+
+        def __init__(self, name):
+            FakeModel.created.append(name)
+
+        def generate_content(self, prompt, request_options=None):
+            return _text(FakeModel.script.pop(0)(prompt))
+
+        async def generate_content_async(self, prompt, stream=False, request_options=None):
+            step = FakeModel.script.pop(0)
+            if stream:
+                return step(prompt)
+            result = step(prompt)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return _text(result)
+
+    monkeypatch.setattr(gemini_client.genai, "GenerativeModel", FakeModel)
+    return FakeModel
+
+
+def _fail(prompt):
+    raise google_exceptions.ServiceUnavailable("upstream down")
+
+
+def test_transient_errors_are_retried_on_a_pooled_handle(fake_model):
+    client = GeminiClient(max_retries=2, backoff_base_s=0.001)
+    fake_model.script = [_fail, lambda prompt: f"answer to {prompt}", lambda prompt: "again"]
+
+    assert client.generate("model-a", "q1") == "answer to q1"
+    assert client.generate("model-a", "q2") == "again"
+    assert fake_model.created == ["model-a"]
+    stats = client.stats()
+    assert (stats["calls"], stats["attempts"], stats["retries"], stats["failures"]) == (2, 3, 1, 1)
+
+    # Errors that are not transient are raised at once
+    fake_model.script = [lambda prompt: (_ for _ in ()).throw(google_exceptions.InvalidArgument("bad"))]
+    with pytest.raises(google_exceptions.InvalidArgument):
+        client.generate("model-a", "q3")
+    assert client.stats()["circuit"]["state"] == "closed"
+
+
+def test_circuit_breaker_fails_fast_until_a_trial_call_succeeds(fake_model, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(gemini_client.time, "monotonic", lambda: clock[0])
+    client = GeminiClient(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout_s=30))
+    fake_model.script = [_fail, _fail]
+    for _ in range(2):
+        with pytest.raises(google_exceptions.ServiceUnavailable):
+            client.generate("model", "q")
+
+    # Open: rejected without calling the model
+    with pytest.raises(GeminiUnavailable):
+        client.generate("model", "q")
+    assert fake_model.script == []
+
+    clock[0] = 31.0
+    fake_model.script = [_fail]
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        client.generate("model", "q")  # half-open trial fails: open again
+    with pytest.raises(GeminiUnavailable):
+        client.generate("model", "q")
+
+    clock[0] = 62.0
+    fake_model.script = [lambda prompt: "recovered"]
+    assert client.generate("model", "q") == "recovered"
+    circuit = client.stats()["circuit"]
+    assert (circuit["state"], circuit["opened"], circuit["rejected"]) == ("closed", 2, 2)
+
+
+def test_rate_limited_embeddings_do_not_open_the_circuit(fake_model, monkeypatch):
+    def throttled(**kwargs):
+        raise google_exceptions.ResourceExhausted("quota exceeded")
+
+    monkeypatch.setattr(gemini_client.genai, "embed_content", throttled)
+    client = GeminiClient(max_retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout_s=30))
+    for _ in range(5):
+        with pytest.raises(google_exceptions.ResourceExhausted):
+            client.embed("embedding-model", ["chunk"], retries=0)
+
+    fake_model.script = [lambda prompt: "answer"]
+    assert client.generate("model", "q") == "answer"
+    stats = client.stats()
+    assert (stats["circuit"]["state"], stats["circuit"]["opened"], stats["rate_limited"]) == ("closed", 0, 5)
+
+
+def test_slow_calls_are_hedged_and_the_first_success_wins(fake_model):
+    client = GeminiClient(max_retries=0, hedge_after_s=0.05)
+    release = threading.Event()
+    fake_model.script = [lambda prompt: release.wait(5) and "slow", lambda prompt: "fast backup"]
+
+    started = time.monotonic()
+    assert client.generate("model", "q") == "fast backup"
+    assert time.monotonic() - started < 1
+    # The losing primary still holds its call slot until it returns
+    assert client._slots._value == client.max_concurrency - 1
+    release.set()
+    deadline = time.monotonic() + 5
+    while client._slots._value < client.max_concurrency and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client._slots._value == client.max_concurrency
+
+    async def slow(prompt):
+        await asyncio.sleep(5)
+        return "slow"
+
+    async def fast(prompt):
+        return "fast async backup"
+
+    fake_model.script = [slow, fast]
+    assert asyncio.run(client.generate_async("model", "q")) == "fast async backup"
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (2, 2)
+
+
+def test_deadlines_and_the_concurrency_limit_bound_waiting(fake_model):
+    client = GeminiClient(max_concurrency=1, max_retries=0)
+
+    async def hang(prompt):
+        await asyncio.sleep(5)
+
+    async def scenario():
+        fake_model.script = [hang]
+        first = asyncio.ensure_future(client.generate_async("model", "q", timeout=0.2))
+        await asyncio.sleep(0.01)
+        # The only slot is taken: the second call gives up at its deadline
+        with pytest.raises(GeminiUnavailable):
+            await client.generate_async("model", "q", timeout=0.05)
+        with pytest.raises(google_exceptions.DeadlineExceeded):
+            await first
+
+    asyncio.run(scenario())
+    stats = client.stats()
+    assert (stats["timeouts"], stats["overloaded"]) == (1, 1)
+
+
+def test_streams_are_retried_only_before_the_first_token(fake_model):
+    client = GeminiClient(max_retries=2, backoff_base_s=0.001)
+
+    def chunks(*texts, fail_after=False):
+        async def gen():
+            for text in texts:
+                yield _text(text)
+            if fail_after:
+                raise google_exceptions.ServiceUnavailable("dropped")
+
+        return lambda prompt: gen()
+
+    async def collect():
+        return [text async for text in client.stream_async("model", "q")]
+
+    fake_model.script = [chunks(fail_after=True), chunks("Hello", ", world")]
+    assert asyncio.run(collect()) == ["Hello", ", world"]
+
+    fake_model.script = [chunks("partial", fail_after=True), chunks("never")]
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        asyncio.run(collect())
+    assert client.stats()["retries"] == 1
@@ -0,0 +1,83 @@
+import threading
+
+from backend.app.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobWorkerPool
+
+
+def test_interrupted_jobs_are_requeued_after_restart(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path)
+    first = queue.enqueue("ingest", {"document_id": "a"})
+    second = queue.enqueue("ingest", {"document_id": "b"})
+    assert queue.claim()["id"] == first
+    queue.report(first, "embedding", 0.5)
+    queue.close()  # crash while the first job is running
+
+    reopened = JobQueue(path)
+    assert reopened.get(first)["status"] == RUNNING
+    assert reopened.requeue_interrupted(max_attempts=1) == 0
+    assert reopened.get(first)["status"] == FAILED
+
+    job = reopened.claim()
+    assert job["id"] == second and job["payload"] == {"document_id": "b"}
+    assert reopened.requeue_interrupted(max_attempts=3) == 1
+    requeued = reopened.get(second)
+    assert (requeued["status"], requeued["stage"], requeued["attempts"]) == (QUEUED, QUEUED, 1)
+
+
+def test_worker_pool_runs_jobs_and_records_progress_and_errors(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    done = threading.Event()
+    seen = []
+
+    def ingest(job_id, payload, report):
+        report("embedding", 0.5)
+        seen.append((payload["document_id"], queue.get(job_id)["stage"]))
+        if payload["document_id"] == "bad":
+            raise ValueError("No text could be extracted from the file.")
+        done.set()
+        return {"chunks_added": 3}
+
+    pool = JobWorkerPool(queue, {"ingest": ingest}, workers=1, poll_interval_s=0.05)
+    bad = pool.submit("ingest", {"document_id": "bad"})
+    good = pool.submit("ingest", {"document_id": "good"})
+    pool.start()
+    assert done.wait(5)
+    pool.stop(timeout=5)
+
+    assert seen == [("bad", "embedding"), ("good", "embedding")]
+    assert queue.get(bad)["status"] == FAILED
+    assert queue.get(bad)["error"] == "No text could be extracted from the file."
+    finished = queue.get(good)
+    assert (finished["status"], finished["stage"], finished["progress"]) == (SUCCEEDED, "done", 1.0)
+    assert finished["result"] == {"chunks_added": 3} and queue.get(bad)["result"] is None
+
+
+def test_failure_handlers_run_for_raised_and_exhausted_jobs(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    queue = JobQueue(path)
+    interrupted = queue.enqueue("ingest", {"document_id": "crashed"})
+    queue.claim()
+    queue.close()  # crash on the job's last attempt
+
+    failures = []
+    done = threading.Event()
+
+    def ingest(job_id, payload, report):
+        raise ValueError("No text could be extracted from the file.")
+
+    def on_failure(job_id, payload, error):
+        failures.append((payload["document_id"], error))
+        done.set()
+
+    queue = JobQueue(path)
+    pool = JobWorkerPool(queue, {"ingest": ingest}, workers=1, max_attempts=1, poll_interval_s=0.05,
+                         on_failure={"ingest": on_failure})
+    pool.start()
+    assert failures == [("crashed", "Interrupted too many times")]
+    assert queue.get(interrupted)["status"] == FAILED
+
+    done.clear()
+    pool.submit("ingest", {"document_id": "empty"})
+    assert done.wait(5)
+    pool.stop(timeout=5)
+    assert failures[-1] == ("empty", "No text could be extracted from the file.")
@@ -0,0 +1,70 @@
+import time
+
+from backend.app import pdf_extraction
+from benchmarks.pdf_extraction_report import write_synthetic_pdf
+
+
+def test_parallel_extraction_reassembles_pages_in_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.pdf")
+    write_synthetic_pdf(path, pages=11, lines_per_page=2)
+    monkeypatch.setattr(pdf_extraction, "PDF_EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(pdf_extraction, "PDF_PAGES_PER_TASK", 3)
+    try:
+        parallel = list(pdf_extraction.iter_pdf_pages(path, parallel=True))
+    finally:
+        pdf_extraction.shutdown_pool()
+
+    serial = list(pdf_extraction.iter_pdf_pages(path, parallel=False))
+    assert parallel == serial
+    assert [text.split(" line ")[0] for text in parallel] == [f"Page {i}" for i in range(1, 12)]
+
+
+def test_slow_pages_are_skipped_after_the_page_timeout(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    write_synthetic_pdf(path, pages=2, lines_per_page=2)
+
+    assert pdf_extraction.extract_page_range(path, 0, 2, timeout_s=1e-6) == ["", ""]
+    assert pdf_extraction.extract_page_range(path, 1, 2, timeout_s=30)[0].startswith("Page 2 line 1")
+
+
+_extract_page_range = pdf_extraction.extract_page_range
+
+
+def _hang_on_first_range(file_path, start, stop, timeout_s, engine):
+    if start == 0:
+        time.sleep(60)  # stuck in native code: the page alarm never fires
+    return _extract_page_range(file_path, start, stop, timeout_s, engine)
+
+
+def test_hung_worker_is_replaced_with_a_fresh_pool(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.pdf")
+    write_synthetic_pdf(path, pages=6, lines_per_page=2)
+    monkeypatch.setattr(pdf_extraction, "PDF_EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(pdf_extraction, "PDF_PAGES_PER_TASK", 2)
+    monkeypatch.setattr(pdf_extraction, "PDF_PAGE_TIMEOUT_S", 0.1)
+    monkeypatch.setattr(pdf_extraction, "PDF_BACKSTOP_SLACK_S", 1)
+    monkeypatch.setattr(pdf_extraction, "extract_page_range", _hang_on_first_range)
+    recycled = []
+
+    def recycle(pool):
+        recycled.append((pool, list(pool._processes.values())))
+        recycle_pool(pool)
+
+    recycle_pool = pdf_extraction._recycle_pool
+    monkeypatch.setattr(pdf_extraction, "_recycle_pool", recycle)
+    pdf_extraction.shutdown_pool()
+    try:
+        first_pool = pdf_extraction._get_pool()
+        counts = []
+        pages = list(pdf_extraction.iter_pdf_pages(path, parallel=True, on_count=counts.append))
+        assert [pool for pool, _ in recycled] == [first_pool]
+        assert pdf_extraction._get_pool() is not first_pool
+        for process in recycled[0][1]:
+            process.join(5)
+            assert not process.is_alive()
+    finally:
+        pdf_extraction.shutdown_pool()
+
+    assert counts == [6]
+    assert pages[:2] == ["", ""]
+    assert [text.split(" line ")[0] for text in pages[2:]] == [f"Page {i}" for i in range(3, 7)]
@@ -0,0 +1,90 @@
+import random
+
+import nltk
+import pytest
+from nltk.tokenize import word_tokenize
+
+from backend.app import text_pipeline
+from backend.app.text_pipeline import (
+    _group_lines,
+    chunk_text,
+    iter_buffer_chunks,
+    normalize_words,
+    preprocess_text,
+)
+
+REGRESSION_TOKENS = [
+    "The", "report's", "Q3", "revenue", "($4.2M)", "rose", "12%", "—", "we", "cannot", "can't", "won't",
+    "GONNA", "gimme", "gotta", "lemme", "wanna", "wanna.", "d'ye", "more'n", "'tis", "e-mail", "U.S.A.",
+    "1,000", "3.88", "İstanbul", "straße", "naïve", "café", "日本語", "__init__", "«quoted»", "“smart”",
+    "[bracket]", "<tag>", "@user", "#tag", "semi;colon", "...", "?!", "tab\tsep", "new\nline", "\xa0",
+]
+
+
+def _materialized_chunks(words, chunk_size, chunk_overlap):
+    """The original list-slicing chunker."""
+    return [" ".join(words[i : i + chunk_size]) for i in range(0, len(words), chunk_size - chunk_overlap)]
+
+
+def test_chunker_matches_materialized_chunker_at_edge_sizes():
+    for n in [0, 1, 4, 5, 6, 12, 13, 500, 1000, 1051]:
+        words = [f"w{i}" for i in range(n)]
+        for chunk_size, chunk_overlap in [(5, 2), (500, 150), (4, 0)]:
+            expected = _materialized_chunks(words, chunk_size, chunk_overlap)
+            assert chunk_text(" ".join(words), chunk_size, chunk_overlap) == expected
+    assert chunk_text("a b c d e f g", chunk_size=4, chunk_overlap=1) == ["a b c d", "d e f g", "g"]
+
+
+def test_offset_chunkers_match_materialized_chunker():
+    rng = random.Random(3)
+    for n in [0, 1, 5, 6, 499, 500, 851, 2000]:
+        words = [f"w{i}" * rng.randint(1, 3) for i in range(n)]
+        text = "".join(word + rng.choice([" ", "  ", "\n", "\t "]) for word in words)
+        # Pages split anywhere between words; chunks span page boundaries
+        cuts = sorted(rng.sample(range(n + 1), min(n + 1, 6)))
+        pages = [" ".join(words[a:b]) for a, b in zip([0] + cuts, cuts + [n])]
+        for chunk_size, chunk_overlap in [(5, 2), (500, 150)]:
+            expected = _materialized_chunks(words, chunk_size, chunk_overlap)
+            assert chunk_text(text, chunk_size, chunk_overlap) == expected
+            assert list(iter_buffer_chunks(pages, chunk_size, chunk_overlap)) == expected
+
+
+def test_chunker_pulls_pages_lazily():
+    pulled = []
+
+    def pages():
+        for i in range(100):
+            pulled.append(i)
+            yield " ".join(f"w{i}.{j}" for j in range(100))
+
+    chunks = iter_buffer_chunks(pages(), chunk_size=500, chunk_overlap=150)
+    next(chunks)
+    assert len(pulled) == 5
+    next(chunks)
+    assert len(pulled) == 9
+
+
+def test_lines_are_grouped_into_pages():
+    pages = list(_group_lines(["aaaa", "bbbb", "cc", "d"], page_chars=8))
+    assert pages == ["aaaa\nbbbb", "cc\nd"]
+
+
+def test_single_pass_normalizer_splits_contractions_like_word_tokenize(monkeypatch):
+    monkeypatch.setattr(text_pipeline, "_stop_words", lambda: frozenset({"can", "not", "me", "the"}))
+    monkeypatch.setattr(text_pipeline, "_split_words", text_pipeline._split_words.__wrapped__)
+    assert normalize_words("The cannot, gimme; wanna!") == ["gim", "wan", "na"]
+    assert normalize_words("Don't e-mail") == ["dont", "email"]
+
+
+def test_single_pass_normalizer_matches_nltk_pipeline():
+    try:
+        nltk.data.find("corpora/stopwords")
+        nltk.data.find("tokenizers/punkt")
+    except LookupError:
+        pytest.skip("NLTK stopwords/punkt data not downloaded")
+    stop_words = text_pipeline._stop_words()
+    rng = random.Random(7)
+    for _ in range(2000):
+        text = rng.choice([" ", "\n", ""]).join(rng.choice(REGRESSION_TOKENS) for _ in range(rng.randint(0, 40)))
+        expected = [w for w in word_tokenize(preprocess_text(text)) if w.lower() not in stop_words]
+        assert normalize_words(text) == expected, text